@@ -0,0 +1,66 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib import consang, consang_all, database, secure
+
+
+def usage():
+    print("Usage: consang.py [options] <base>")
+    print()
+    print("Options:")
+    print("  -q         Quiet")
+    print("  -qq        Very quiet")
+    print("  -scratch   Recompute every person from scratch")
+    print("  -j <n>     Spread each generation level over <n> processes")
+    sys.exit(2)
+
+
+def main():
+    verbosity = 2
+    scratch = False
+    jobs = 1
+    bname = None
+
+    i = 1
+    while i < len(sys.argv):
+        arg = sys.argv[i]
+        if arg == '-q':
+            verbosity = 1
+            i += 1
+        elif arg == '-qq':
+            verbosity = 0
+            i += 1
+        elif arg == '-scratch':
+            scratch = True
+            i += 1
+        elif arg == '-j' and i + 1 < len(sys.argv):
+            jobs = max(1, int(sys.argv[i + 1]))
+            i += 2
+        elif arg.startswith('-'):
+            usage()
+        else:
+            bname = arg
+            i += 1
+
+    if bname is None:
+        usage()
+
+    if not bname.endswith('.gwb'):
+        bname += '.gwb'
+    secure.add_assets(os.path.dirname(os.path.abspath(bname)))
+
+    base, close = database.open_database(bname, read_only=False)
+    try:
+        consang_all.compute_arrays(base, scratch, verbosity, jobs)
+    except consang.TopologicalSortError as e:
+        print(f"Error: loop in database, {e}", file=sys.stderr)
+        sys.exit(2)
+    finally:
+        close()
+
+
+if __name__ == '__main__':
+    main()
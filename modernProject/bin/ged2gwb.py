@@ -3,15 +3,18 @@
 import sys
 import os
 import re
+import multiprocessing
 from pathlib import Path
 from typing import Optional, List, Tuple
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from lib import database, gwdef, adef, name, iovalue, secure, ansel
+from lib import database, gwdef, adef, name, iovalue, secure, ansel, outbase, extsort, title_index
 
 
 class GedcomLine:
+    __slots__ = ('level', 'xref', 'tag', 'value', 'children')
+
     def __init__(self, level, xref, tag, value):
         self.level = level
         self.xref = xref
@@ -57,23 +60,37 @@ class GedcomParser:
 
         return GedcomLine(level, xref, tag, value)
 
-    def parse_file(self):
+    def iter_records(self, bar=None):
+        total = os.path.getsize(self.filename) if bar is not None else 0
+        pos = 0
         with open(self.filename, 'r', encoding='utf-8') as f:
-            lines = [self.parse_line(line) for line in f]
-            lines = [l for l in lines if l is not None]
-
-        stack = []
-        for line in lines:
-            while stack and stack[-1].level >= line.level:
-                stack.pop()
+            stack = []
+            for raw in f:
+                pos += len(raw)
+                line = self.parse_line(raw)
+                if line is None:
+                    continue
+
+                if line.level == 0:
+                    if total:
+                        bar.progress(min(pos, total), total)
+                    if stack:
+                        yield stack[0]
+                    stack = [line]
+                    continue
+
+                while stack and stack[-1].level >= line.level:
+                    stack.pop()
+
+                if stack:
+                    stack[-1].children.append(line)
+                    stack.append(line)
 
             if stack:
-                stack[-1].children.append(line)
-
-            stack.append(line)
+                yield stack[0]
 
-        root_records = [l for l in lines if l.level == 0]
-        return root_records
+    def parse_file(self):
+        return list(self.iter_records())
 
     def find_child(self, record, tag):
         for child in record.children:
@@ -393,10 +410,8 @@ class GedcomParser:
 
         return family, husb_ref, wife_ref, chil_refs
 
-    def load(self):
-        records = self.parse_file()
-
-        for record in records:
+    def load(self, bar=None):
+        for record in self.iter_records(bar):
             if record.tag == 'INDI' and record.xref:
                 person, fams_refs, famc_refs = self.parse_person(record)
                 self.individuals[record.xref] = {
@@ -414,6 +429,42 @@ class GedcomParser:
                 }
 
 
+CONVERT_CHUNK = 2048
+BUILD_STEPS = 8
+
+_convert_records = None
+
+
+def _init_convert_worker(records):
+    global _convert_records
+    _convert_records = records
+
+
+def _chunk_strings(task):
+    kind, start, end = task
+    builder = DatabaseBuilder(None)
+    builder.convert_records(kind, _convert_records[kind][start:end])
+    return builder.strings[2:]
+
+
+def _encode_chunk(task):
+    kind, start, end, string_ids = task
+    builder = DatabaseBuilder(None)
+    builder.string_map.update(string_ids)
+    buf = bytearray()
+    sizes = []
+    name_keys = []
+    title_keys = []
+    for value in builder.convert_records(kind, _convert_records[kind][start:end]):
+        pos = len(buf)
+        iovalue.encode_value(buf, value)
+        sizes.append(len(buf) - pos)
+        if kind == 'persons':
+            name_keys.append((value['fields'][0], value['fields'][1]))
+            title_keys.append(title_index.person_keys(value))
+    return bytes(buf), sizes, name_keys, title_keys
+
+
 class DatabaseBuilder:
     def __init__(self, parser):
         self.parser = parser
@@ -570,20 +621,60 @@ class DatabaseBuilder:
             ]
         }
 
-    def build(self, output_path):
+    def convert_records(self, kind, records):
+        if kind == 'persons':
+            return [self.person_to_iovalue(person) for person in records]
+        return [self.family_to_iovalue(*record) for record in records]
+
+    def iter_persons(self, person_records, name_keys, titles):
+        for person in person_records:
+            value = self.person_to_iovalue(person)
+            titles.add_person(len(name_keys), title_index.person_keys(value))
+            name_keys.append((value['fields'][0], value['fields'][1]))
+            yield value
+
+    def convert_parallel(self, person_records, family_records, jobs, titles):
+        records = {'persons': person_records, 'families': family_records}
+        tasks = [(kind, start, min(start + CONVERT_CHUNK, len(records[kind])))
+                 for kind in ('persons', 'families')
+                 for start in range(0, len(records[kind]), CONVERT_CHUNK)]
+
+        with multiprocessing.Pool(jobs, initializer=_init_convert_worker, initargs=(records,)) as pool:
+            encode_tasks = []
+            for task, strings in zip(tasks, pool.map(_chunk_strings, tasks)):
+                encode_tasks.append(task + ({s: self.add_string(s) for s in strings},))
+            encoded = pool.map(_encode_chunk, encode_tasks)
+
+        person_chunks = []
+        family_chunks = []
+        name_keys = []
+        for task, (blob, sizes, keys, person_title_keys) in zip(tasks, encoded):
+            if task[0] == 'persons':
+                person_chunks.append((blob, sizes))
+                for ip, person_keys in enumerate(person_title_keys, task[1]):
+                    titles.add_person(ip, person_keys)
+                name_keys.extend(keys)
+            else:
+                family_chunks.append((blob, sizes))
+        return person_chunks, family_chunks, name_keys
+
+    def build(self, output_path, jobs=1, bar=None):
+        def step(n):
+            if bar is not None:
+                bar.progress(n, BUILD_STEPS)
+
         for xref, data in self.parser.individuals.items():
             self.person_map[xref] = len(self.person_map)
 
         for xref, data in self.parser.families.items():
             self.family_map[xref] = len(self.family_map)
 
-        persons = []
+        person_records = []
         ascends = []
         unions = []
 
         for xref, data in sorted(self.parser.individuals.items(), key=lambda x: self.person_map[x[0]]):
-            person_iovalue = self.person_to_iovalue(data['person'])
-            persons.append(person_iovalue)
+            person_records.append(data['person'])
 
             parents_fam = None
             if data['famc']:
@@ -604,7 +695,7 @@ class DatabaseBuilder:
 
             unions.append({'tag': 0, 'fields': [union_fams]})
 
-        families = []
+        family_records = []
         couples = []
         descends = []
 
@@ -613,8 +704,7 @@ class DatabaseBuilder:
             mother_idx = self.person_map.get(data['wife'], -1) if data['wife'] else -1
             children_idxs = [self.person_map[c] for c in data['children'] if c in self.person_map]
 
-            family_iovalue = self.family_to_iovalue(data['family'], father_idx, mother_idx, children_idxs)
-            families.append(family_iovalue)
+            family_records.append((data['family'], father_idx, mother_idx, children_idxs))
 
             couple_val = {'tag': 0, 'fields': [
                 father_idx if father_idx >= 0 else -1,
@@ -624,6 +714,13 @@ class DatabaseBuilder:
 
             descends.append({'tag': 0, 'fields': [children_idxs]})
 
+        step(1)
+        name_keys = []
+        titles = title_index.TitleIndex()
+        if jobs > 1:
+            person_chunks, family_chunks, name_keys = self.convert_parallel(person_records, family_records, jobs,
+                                                                            titles)
+
         os.makedirs(output_path, exist_ok=True)
         secure.add_assets(output_path)
 
@@ -632,178 +729,78 @@ class DatabaseBuilder:
         open(os.path.join(output_path, "notes"), 'w').close()
 
         base_file = os.path.join(output_path, "base")
+        base_acc_file = os.path.join(output_path, "base.acc")
 
-        with open(base_file, 'wb') as f:
-            f.write(database.MAGIC_GNWB0024)
-
-            database.output_binary_int(f, len(persons))
-            database.output_binary_int(f, len(families))
-            database.output_binary_int(f, len(self.strings))
-
-            header_end = f.tell()
+        with open(base_file, 'wb') as f, open(base_acc_file, 'wb') as f_acc:
+            base_writer = outbase.BaseWriter(f, f_acc)
+            base_writer.output_header(len(person_records), len(family_records), len(self.strings), "")
 
-            for _ in range(7):
+            step(2)
+            if jobs > 1:
+                base_writer.output_encoded_array(len(person_records), person_chunks)
+            else:
+                base_writer.output_array(self.iter_persons(person_records, name_keys, titles), len(person_records))
+            step(3)
+            base_writer.output_array(ascends)
+            base_writer.output_array(unions)
+            if jobs > 1:
+                base_writer.output_encoded_array(len(family_records), family_chunks)
+            else:
+                base_writer.output_array((self.family_to_iovalue(*record) for record in family_records),
+                                         len(family_records))
+            step(4)
+            base_writer.output_array(couples)
+            base_writer.output_array(descends)
+            base_writer.output_array(self.strings)
+            base_writer.finish(len(self.strings))
+        step(5)
+
+        with open(os.path.join(output_path, "strings.inx"), 'wb') as f:
+            outbase.write_strings_hash(f, self.strings.__getitem__, len(self.strings))
+        step(6)
+
+        self.generate_name_indexes(output_path, name_keys)
+        step(7)
+        title_index.write(os.path.join(output_path, title_index.TITLES_INX), titles)
+        step(BUILD_STEPS)
+
+    def generate_name_indexes(self, gwb_path, name_keys):
+        with extsort.ExternalSorter() as names, extsort.ExternalSorter() as snames, \
+                extsort.ExternalSorter() as fnames:
+            for i, (fname_idx, sname_idx) in enumerate(name_keys):
+                if fname_idx >= len(self.strings) or sname_idx >= len(self.strings):
+                    continue
+
+                fname = self.strings[fname_idx]
+                sname = self.strings[sname_idx]
+
+                if fname and sname and fname != "?" and sname != "?":
+                    names.add((database.name_index(f"{fname} {sname}"), i))
+                    snames.add((sname, sname_idx, i))
+                    fnames.add((fname, fname_idx, i))
+
+            names_inx_file = os.path.join(gwb_path, "names.inx")
+            with open(names_inx_file, 'wb') as f:
+                f.write(database.MAGIC_NAMES_INX)
                 database.output_binary_int(f, 0)
+                writer = iovalue.ValueWriter(f, f.tell())
+                extsort.output_buckets(writer, database.TABLE_SIZE, names.unique())
+                writer.flush()
 
-            iovalue.output(f, "")
-
-            persons_pos = f.tell()
-            iovalue.output(f, persons)
-
-            ascends_pos = f.tell()
-            iovalue.output(f, ascends)
-
-            unions_pos = f.tell()
-            iovalue.output(f, unions)
-
-            families_pos = f.tell()
-            iovalue.output(f, families)
-
-            couples_pos = f.tell()
-            iovalue.output(f, couples)
-
-            descends_pos = f.tell()
-            iovalue.output(f, descends)
-
-            strings_pos = f.tell()
-            iovalue.output(f, self.strings)
-
-            f.seek(header_end)
-            database.output_binary_int(f, persons_pos)
-            database.output_binary_int(f, ascends_pos)
-            database.output_binary_int(f, unions_pos)
-            database.output_binary_int(f, families_pos)
-            database.output_binary_int(f, couples_pos)
-            database.output_binary_int(f, descends_pos)
-            database.output_binary_int(f, strings_pos)
-
-        persons_offsets = []
-        current_pos = persons_pos + iovalue.array_header_size(len(persons))
-        for person in persons:
-            persons_offsets.append(current_pos)
-            current_pos += iovalue.size(person)
-
-        ascends_offsets = []
-        current_pos = ascends_pos + iovalue.array_header_size(len(ascends))
-        for ascend in ascends:
-            ascends_offsets.append(current_pos)
-            current_pos += iovalue.size(ascend)
-
-        unions_offsets = []
-        current_pos = unions_pos + iovalue.array_header_size(len(unions))
-        for union in unions:
-            unions_offsets.append(current_pos)
-            current_pos += iovalue.size(union)
-
-        families_offsets = []
-        current_pos = families_pos + iovalue.array_header_size(len(families))
-        for family in families:
-            families_offsets.append(current_pos)
-            current_pos += iovalue.size(family)
-
-        couples_offsets = []
-        current_pos = couples_pos + iovalue.array_header_size(len(couples))
-        for couple in couples:
-            couples_offsets.append(current_pos)
-            current_pos += iovalue.size(couple)
-
-        descends_offsets = []
-        current_pos = descends_pos + iovalue.array_header_size(len(descends))
-        for descend in descends:
-            descends_offsets.append(current_pos)
-            current_pos += iovalue.size(descend)
-
-        strings_offsets = []
-        current_pos = strings_pos + iovalue.array_header_size(len(self.strings))
-        for string in self.strings:
-            strings_offsets.append(current_pos)
-            current_pos += iovalue.size(string)
+            for sorter, prefix in ((snames, "snames"), (fnames, "fnames")):
+                with open(os.path.join(gwb_path, f"{prefix}.dat"), 'wb') as oc_dat, \
+                        open(os.path.join(gwb_path, f"{prefix}.inx"), 'wb') as oc_inx:
+                    extsort.output_name_lists(oc_dat, oc_inx, sorter.unique(),
+                                              lambda entry: entry[1], lambda entry: entry[2])
 
-        base_acc_file = os.path.join(output_path, "base.acc")
-        with open(base_acc_file, 'wb') as f:
-            for offset in persons_offsets:
-                database.output_binary_int(f, offset)
-            for offset in ascends_offsets:
-                database.output_binary_int(f, offset)
-            for offset in unions_offsets:
-                database.output_binary_int(f, offset)
-            for offset in families_offsets:
-                database.output_binary_int(f, offset)
-            for offset in couples_offsets:
-                database.output_binary_int(f, offset)
-            for offset in descends_offsets:
-                database.output_binary_int(f, offset)
-            for offset in strings_offsets:
-                database.output_binary_int(f, offset)
-
-        self.generate_name_indexes(output_path, persons)
-
-    def generate_name_indexes(self, gwb_path, persons):
-        names_table = [[] for _ in range(database.TABLE_SIZE)]
-        snames_table = {}
-        fnames_table = {}
-
-        for i, person in enumerate(persons):
-            fields = person['fields']
-            fname_idx = fields[0]
-            sname_idx = fields[1]
-
-            if fname_idx >= len(self.strings) or sname_idx >= len(self.strings):
-                continue
-
-            fname = self.strings[fname_idx]
-            sname = self.strings[sname_idx]
-
-            if fname and sname and fname != "?" and sname != "?":
-                full_name = f"{fname} {sname}"
-                idx = hash(name.crush_lower(full_name)) % database.TABLE_SIZE
-                if i not in names_table[idx]:
-                    names_table[idx].append(i)
-
-                if sname_idx not in snames_table:
-                    snames_table[sname_idx] = []
-                if i not in snames_table[sname_idx]:
-                    snames_table[sname_idx].append(i)
-
-                if fname_idx not in fnames_table:
-                    fnames_table[fname_idx] = []
-                if i not in fnames_table[fname_idx]:
-                    fnames_table[fname_idx].append(i)
-
-        names_inx_file = os.path.join(gwb_path, "names.inx")
-        with open(names_inx_file, 'wb') as f:
-            database.output_binary_int(f, 0)
-            iovalue.output(f, names_table)
-
-        snames_bt = sorted(snames_table.items(), key=lambda x: self.strings[x[0]] if x[0] < len(self.strings) else "")
-        snames_dat_file = os.path.join(gwb_path, "snames.dat")
-        with open(snames_dat_file, 'wb') as f:
-            snames_inx_data = []
-            for istr, ipers in snames_bt:
-                pos = f.tell()
-                database.output_binary_int(f, len(ipers))
-                for ip in ipers:
-                    database.output_binary_int(f, ip)
-                snames_inx_data.append([istr, pos])
-
-        snames_inx_file = os.path.join(gwb_path, "snames.inx")
-        with open(snames_inx_file, 'wb') as f:
-            iovalue.output(f, snames_inx_data)
-
-        fnames_bt = sorted(fnames_table.items(), key=lambda x: self.strings[x[0]] if x[0] < len(self.strings) else "")
-        fnames_dat_file = os.path.join(gwb_path, "fnames.dat")
-        with open(fnames_dat_file, 'wb') as f:
-            fnames_inx_data = []
-            for istr, ipers in fnames_bt:
-                pos = f.tell()
-                database.output_binary_int(f, len(ipers))
-                for ip in ipers:
-                    database.output_binary_int(f, ip)
-                fnames_inx_data.append([istr, pos])
-
-        fnames_inx_file = os.path.join(gwb_path, "fnames.inx")
-        with open(fnames_inx_file, 'wb') as f:
-            iovalue.output(f, fnames_inx_data)
+
+def convert(input_file, output_path, jobs=1, parse_bar=None, write_bar=None):
+    parser = GedcomParser(input_file)
+    parser.detect_encoding()
+    parser.load(parse_bar)
+    builder = DatabaseBuilder(parser)
+    builder.build(output_path, jobs, write_bar)
+    return builder
 
 
 def main():
@@ -814,6 +811,7 @@ def main():
         print("  <input.ged>      Input GEDCOM file")
         print("  -o <output.gwb>  Output GeneWeb database path (default: <input>.gwb)")
         print("  -v, --verbose    Verbose output")
+        print("  -j <n>           Convert records in <n> processes")
         print()
         print("Supported GEDCOM features:")
         print("  - Character encodings: UTF-8, ANSEL, ASCII")
@@ -826,6 +824,7 @@ def main():
     input_file = sys.argv[1]
     output_file = None
     verbose = False
+    jobs = 1
 
     i = 2
     while i < len(sys.argv):
@@ -835,6 +834,9 @@ def main():
         elif sys.argv[i] in ['-v', '--verbose']:
             verbose = True
             i += 1
+        elif sys.argv[i] == '-j' and i + 1 < len(sys.argv):
+            jobs = max(1, int(sys.argv[i + 1]))
+            i += 2
         else:
             i += 1
 
@@ -883,7 +885,7 @@ def main():
 
         if verbose:
             print("Writing database files...")
-        builder.build(output_file)
+        builder.build(output_file, jobs)
 
         if verbose:
             print(f"  Strings: {len(builder.strings)}")
@@ -2,14 +2,20 @@ import sys
 import os
 import socket
 import time
+import queue
+import threading
 from typing import Optional, Dict, List, Tuple, Any
 from pathlib import Path
 import hashlib
 import base64
+import zlib
+import tempfile
+from email.utils import formatdate, parsedate_to_datetime
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from lib import config, driver, wserver, logs, mutil, util, database, secure
+from lib import config, driver, wserver, logs, mutil, util, database, secure, page_cache
+from bin import robot, import_queue
 
 
 output_conf = config.OutputConf(
@@ -40,6 +46,20 @@ default_n_workers = 20
 n_workers = default_n_workers
 default_max_pending_requests = 150
 max_pending_requests = default_max_pending_requests
+default_max_queued_connections = 64
+max_queued_connections = default_max_queued_connections
+default_drain_timeout = 30
+drain_timeout = default_drain_timeout
+default_keepalive_timeout = 5
+keepalive_timeout = default_keepalive_timeout
+response_chunk_size = 16384
+max_inline_body = 1 << 20
+compress_responses = True
+compress_min_size = 256
+compressible_types = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'image/svg+xml')
+default_max_keepalive_requests = 100
+max_keepalive_requests = default_max_keepalive_requests
 no_host_address = False
 only_addresses: List[str] = []
 plugins: List[str] = []
@@ -421,7 +441,9 @@ def no_access(conf: config.Config, from_addr: str):
 
 
 def log_and_robot_check(tm: float, from_addr: str, request: str, conf: config.Config):
-    raise NotImplementedError("log_and_robot_check not yet implemented")
+    if robot_xcl is not None:
+        max_call, sec = robot_xcl
+        robot.check(tm, from_addr, max_call, sec, conf, False)
 
 
 def conf_and_connection(from_addr: str, request: str) -> Optional[config.Config]:
@@ -536,8 +558,14 @@ def arg_parse_in_file(filename: str) -> List[str]:
     raise NotImplementedError("arg_parse_in_file not yet implemented")
 
 
-def robot_exclude_arg(fname: str):
-    raise NotImplementedError("robot_exclude_arg not yet implemented")
+def robot_exclude_arg(s: str):
+    global robot_xcl
+    try:
+        max_call, sec = s.split(',')
+        robot_xcl = (int(max_call), int(sec))
+    except ValueError:
+        print(f"Bad use of option -robot_xcl: {s}", file=sys.stderr)
+        sys.exit(2)
 
 
 def slashify(dir: str) -> str:
@@ -595,104 +623,602 @@ def parse_query_string(query: str) -> List[Tuple[str, str]]:
     return result
 
 
-def handle_connection(conn, addr):
-    try:
-        request_data = b''
-        while True:
+class StdoutRouter:
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def write(self, s):
+        buffer = getattr(_capture_local, 'buffer', None)
+        if buffer is None:
+            return self.fallback.write(s)
+        buffer.append(s)
+        return len(s)
+
+    def flush(self):
+        if getattr(_capture_local, 'buffer', None) is None:
+            self.fallback.flush()
+
+
+_capture_local = threading.local()
+_capture_lock = threading.Lock()
+_capture_users = 0
+
+
+def begin_capture(buffer: List[str]):
+    global _capture_users
+    with _capture_lock:
+        if _capture_users == 0:
+            sys.stdout = StdoutRouter(sys.stdout)
+        _capture_users += 1
+    _capture_local.buffer = buffer
+
+
+def end_capture():
+    global _capture_users
+    _capture_local.buffer = None
+    with _capture_lock:
+        _capture_users -= 1
+        if _capture_users == 0 and isinstance(sys.stdout, StdoutRouter):
+            sys.stdout = sys.stdout.fallback
+
+
+def spool_body(conn, pending: bytearray, length: int):
+    body = tempfile.TemporaryFile()
+    body.write(pending[:length])
+    remaining = length - min(len(pending), length)
+    del pending[:length]
+    while remaining > 0:
+        chunk = conn.recv(min(remaining, 65536))
+        if not chunk:
+            break
+        body.write(chunk)
+        remaining -= len(chunk)
+    body.seek(0)
+    return body
+
+
+def read_request(conn, pending: bytearray) -> Optional[Tuple[List[str], Dict[str, str], Any]]:
+    while b'\r\n\r\n' not in pending:
+        try:
             chunk = conn.recv(4096)
-            if not chunk:
-                break
-            request_data += chunk
-            if b'\r\n\r\n' in request_data:
-                break
+        except socket.timeout:
+            if pending:
+                raise
+            return None
+        if not chunk:
+            return None
+        pending += chunk
+
+    header_end = pending.find(b'\r\n\r\n')
+    head = bytes(pending[:header_end])
+    del pending[:header_end + 4]
+
+    lines = head.decode('utf-8', errors='ignore').split('\r\n')
+    headers = parse_headers(lines[1:])
+    try:
+        content_length = int(headers.get('content-length', 0))
+    except (TypeError, ValueError):
+        content_length = 0
+    if import_queue.max_upload_size and content_length > import_queue.max_upload_size:
+        return lines, headers, None
+    if content_length > max_inline_body:
+        return lines, headers, spool_body(conn, pending, content_length)
+    while len(pending) < content_length:
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        pending += chunk
+    body = bytes(pending[:content_length])
+    del pending[:content_length]
+    return lines, headers, body
+
+
+def wants_keep_alive(version: str, headers: Dict[str, str]) -> bool:
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.1':
+        return 'close' not in connection
+    return 'keep-alive' in connection
+
+
+def is_header_line(line: str) -> bool:
+    name, sep, _ = line.partition(':')
+    return bool(sep and name and ' ' not in name and '<' not in name)
+
+
+def split_response(response: str) -> Tuple[str, List[str], str]:
+    status = 'HTTP/1.1 200 OK'
+    if response.startswith('HTTP/'):
+        eol = response.find('\n')
+        if eol == -1:
+            return response.strip(), [], ''
+        status = response[:eol].rstrip('\r')
+        response = response[eol + 1:]
+
+    headers = []
+    while response:
+        eol = response.find('\n')
+        line = response if eol == -1 else response[:eol]
+        line = line.rstrip('\r')
+        if line == '':
+            response = '' if eol == -1 else response[eol + 1:]
+            break
+        if not is_header_line(line):
+            break
+        headers.append(line)
+        response = '' if eol == -1 else response[eol + 1:]
+    return status, headers, response
+
+
+def frame_head(status: str, headers: List[str], has_body: bool, length: Optional[int],
+               keep_alive: bool, chunked: bool = False) -> bytes:
+    kept = [h for h in headers
+            if h.split(':', 1)[0].strip().lower()
+            not in ('content-length', 'connection', 'transfer-encoding', 'keep-alive')]
+    if has_body and not any(h.lower().startswith('content-type:') for h in kept):
+        kept.append('Content-Type: text/html; charset=utf-8')
+    if length is not None:
+        kept.append(f'Content-Length: {length}')
+    elif chunked:
+        kept.append('Transfer-Encoding: chunked')
+    if keep_alive:
+        kept.append('Connection: keep-alive')
+        kept.append(f'Keep-Alive: timeout={keepalive_timeout}, max={max_keepalive_requests}')
+    else:
+        kept.append('Connection: close')
+    head = status + '\r\n' + ''.join(h + '\r\n' for h in kept) + '\r\n'
+    return head.encode('utf-8')
+
+
+def frame_response(response: str, keep_alive: bool, head_only: bool = False) -> bytes:
+    status, headers, body = split_response(response)
+    body_bytes = body.encode('utf-8')
+    head = frame_head(status, headers, bool(body_bytes), len(body_bytes), keep_alive)
+    return head + (b'' if head_only else body_bytes)
+
+
+def status_code(status: str) -> int:
+    parts = status.split()
+    return int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 200
+
+
+def choose_encoding(accept: str) -> Optional[str]:
+    weights: Dict[str, float] = {}
+    for item in accept.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, sep, val = param.partition('=')
+            if sep and key.strip().lower() == 'q':
+                try:
+                    q = float(val)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    best = None
+    for enc in ('gzip', 'deflate'):
+        q = weights.get(enc, weights.get('*', 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (enc, q)
+    return best[0] if best else None
+
+
+def compressible(headers: List[str]) -> bool:
+    ctype = 'text/html'
+    for h in headers:
+        name, _, val = h.partition(':')
+        name = name.strip().lower()
+        if name == 'content-encoding':
+            return False
+        if name == 'content-type':
+            ctype = val.strip().lower()
+    return ctype.startswith(compressible_types)
 
-        if not request_data:
-            return
 
-        request_str = request_data.decode('utf-8', errors='ignore')
-        lines = request_str.split('\r\n')
+def page_validators(conf: config.Config) -> Optional[Tuple[str, float]]:
+    if not page_cache.cacheable(conf):
+        return None
+    try:
+        full_path = os.path.join(secure.base_dir(), conf.bname)
+        t = database.with_shared_database(full_path, driver.date_of_last_change)
+    except Exception:
+        return None
+    if not t:
+        return None
+    env = conf.env if isinstance(conf.env, dict) else dict(conf.env)
+    key = ([conf.bname, repr(t), page_cache.access_level(conf), page_cache.credentials(conf),
+            conf.headers.get('accept-language', '')]
+           + [env.get(k, '') for k in page_cache.KEY_PARAMS])
+    digest = hashlib.sha1('\0'.join(key).encode('utf-8')).hexdigest()[:20]
+    return f'W/"{digest}"', t
+
+
+def validator_headers(validators: Tuple[str, float]) -> List[str]:
+    etag, t = validators
+    return [f'ETag: {etag}', f'Last-Modified: {formatdate(t, usegmt=True)}']
+
+
+def not_modified(headers: Dict[str, str], validators: Tuple[str, float]) -> bool:
+    etag, t = validators
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag.removeprefix('W/') in (tag.removeprefix('W/') for tag in tags)
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError, IndexError):
+            return False
+        return int(t) <= since
+    return False
+
 
-        if not lines:
+class ResponseStream:
+    def __init__(self, conn, version: str, keep_alive: bool, head_only: bool = False,
+                 chunk_size: Optional[int] = None, accept_encoding: str = ''):
+        self.conn = conn
+        self.version = version
+        self.keep_alive = keep_alive
+        self.head_only = head_only
+        self.chunk_size = response_chunk_size if chunk_size is None else chunk_size
+        self.accept_encoding = accept_encoding if compress_responses else ''
+        self.validators: Optional[Tuple[str, float]] = None
+        self.record: Optional[List[str]] = None
+        self.record_size = 0
+        self.record_limit = 0
+        self.status: Optional[str] = None
+        self.headers: List[str] = []
+        self.pending = ''
+        self.in_body = False
+        self.body: List[bytes] = []
+        self.body_size = 0
+        self.started = False
+        self.aborted = False
+        self.chunked = False
+        self.encoder = None
+        self.output_conf = config.OutputConf(
+            status=lambda status: self.append(f"HTTP/1.1 {status}\r\n"),
+            header=lambda name: self.append(f"{name}\r\n"),
+            body=self.append,
+            flush=self.flush
+        )
+
+    def append(self, s: str) -> int:
+        if not s:
+            return 0
+        if self.record is not None:
+            self.record.append(s)
+            self.record_size += page_cache.page_size(s)
+            if self.record_size > self.record_limit:
+                self.record = None
+        if self.in_body:
+            self.add_body(s)
+        else:
+            self.pending += s
+            self.parse_head()
+        return len(s)
+
+    write = append
+
+    def parse_head(self) -> None:
+        while not self.in_body:
+            eol = self.pending.find('\n')
+            if eol == -1:
+                if len(self.pending) > self.chunk_size:
+                    self.start_body(self.pending)
+                return
+            line = self.pending[:eol].rstrip('\r')
+            rest = self.pending[eol + 1:]
+            if self.status is None and not self.headers and line.startswith('HTTP/'):
+                self.status = line
+            elif line == '':
+                self.start_body(rest)
+                return
+            elif is_header_line(line):
+                self.headers.append(line)
+            else:
+                self.start_body(self.pending)
+                return
+            self.pending = rest
+
+    def start_body(self, s: str) -> None:
+        self.in_body = True
+        self.pending = ''
+        self.add_body(s)
+
+    def add_body(self, s: str) -> None:
+        if not s:
             return
+        data = s.encode('utf-8')
+        self.body.append(data)
+        self.body_size += len(data)
+        if self.body_size >= self.chunk_size:
+            self.flush()
+
+    def start_recording(self, limit: int) -> None:
+        self.record = []
+        self.record_size = 0
+        self.record_limit = limit
+
+    def recorded(self) -> Optional[str]:
+        if self.record is None or status_code(self.status or '') != 200:
+            return None
+        return ''.join(self.record)
+
+    def not_modified(self) -> None:
+        self.status = 'HTTP/1.1 304 Not Modified'
+        self.headers = validator_headers(self.validators)
+        self.in_body = True
+
+    def out_headers(self, has_body: bool, size: Optional[int]) -> List[str]:
+        headers = list(self.headers)
+        code = status_code(self.status or '')
+        if self.validators and code == 200:
+            headers.extend(validator_headers(self.validators))
+        encoding = choose_encoding(self.accept_encoding) if self.accept_encoding else None
+        if (encoding and has_body and code not in (204, 304)
+                and (size is None or size >= compress_min_size) and compressible(headers)):
+            self.encoder = zlib.compressobj(6, zlib.DEFLATED, 31 if encoding == 'gzip' else 15)
+            headers.append(f'Content-Encoding: {encoding}')
+            headers.append('Vary: Accept-Encoding')
+        return headers
+
+    def send_data(self, data: bytes) -> None:
+        if self.head_only or not data:
+            return
+        if self.chunked:
+            self.conn.sendall(b'%x\r\n' % len(data) + data + b'\r\n')
+        else:
+            self.conn.sendall(data)
 
-        method, path, version = parse_request_line(lines[0])
-        headers = parse_headers(lines[1:])
-
-        body_data = b''
-        if method == 'POST':
-            header_end = request_data.find(b'\r\n\r\n')
-            if header_end != -1:
-                body_data = request_data[header_end + 4:]
-                content_length = int(headers.get('content-length', 0))
-                while len(body_data) < content_length:
-                    chunk = conn.recv(4096)
-                    if not chunk:
-                        break
-                    body_data += chunk
-
-        path_parts = path.split('?')
-        script_name = path_parts[0]
-        query_string = path_parts[1] if len(path_parts) > 1 else ''
-
-        env = parse_query_string(query_string)
-
-        base_env = {}
-        for key, val in env:
-            base_env[key] = val
-
-        bname = base_env.get('b', '')
-
-        from bin import request
-
-        conf = config.Config(
-            output_conf=output_conf,
-            from_=addr[0] if isinstance(addr, tuple) else addr,
-            env=base_env,
-            bname=bname,
-            command=script_name,
-            request=path,
-            method=method,
-            headers=headers,
-            body_data=body_data
-        )
+    def flush(self) -> None:
+        if not self.in_body or not self.body:
+            return
+        data = b''.join(self.body)
+        self.body = []
+        self.body_size = 0
+        if not self.started:
+            self.chunked = self.version == 'HTTP/1.1'
+            if not self.chunked:
+                self.keep_alive = False
+            headers = self.out_headers(True, None)
+            self.conn.sendall(frame_head(self.status or 'HTTP/1.1 200 OK', headers, True, None,
+                                         self.keep_alive, self.chunked))
+            self.started = True
+        if self.encoder is not None:
+            data = self.encoder.compress(data) + self.encoder.flush(zlib.Z_SYNC_FLUSH)
+        self.send_data(data)
+
+    def discard(self) -> bool:
+        if self.started:
+            self.aborted = True
+            self.keep_alive = False
+            return False
+        self.status = None
+        self.headers = []
+        self.pending = ''
+        self.in_body = False
+        self.body = []
+        self.body_size = 0
+        return True
 
-        response_buffer = []
-        original_stdout = sys.stdout
+    def finish(self) -> bool:
+        if self.aborted:
+            return False
+        if not self.in_body and self.pending:
+            line = self.pending.rstrip('\r')
+            if line.startswith('HTTP/') and self.status is None and not self.headers:
+                self.status = line
+            elif is_header_line(line):
+                self.headers.append(line)
+            else:
+                self.start_body(self.pending)
+            self.pending = ''
+        if not self.started:
+            data = b''.join(self.body)
+            status = self.status or 'HTTP/1.1 200 OK'
+            headers = self.out_headers(bool(data), len(data))
+            if self.encoder is not None:
+                data = self.encoder.compress(data) + self.encoder.flush()
+            length = None if status_code(status) in (204, 304) else len(data)
+            head = frame_head(status, headers, bool(data), length, self.keep_alive)
+            self.conn.sendall(head + (b'' if self.head_only else data))
+            self.started = True
+        else:
+            self.flush()
+            if self.encoder is not None:
+                self.send_data(self.encoder.flush())
+            if self.chunked and not self.head_only:
+                self.conn.sendall(b'0\r\n\r\n')
+        return self.keep_alive
 
-        class ResponseCapture:
-            def write(self, s):
-                response_buffer.append(s)
-            def flush(self):
-                pass
 
-        sys.stdout = ResponseCapture()
+def serve_page(conf: config.Config, stream: ResponseStream) -> None:
+    from bin import request
+
+    cache = page_cache.cache()
+    key = cache.key(conf, os.path.join(secure.base_dir(), conf.bname)) if cache else None
+    if key is None:
+        request.treat_request(conf)
+        return
+    page = cache.get(key)
+    if page is not None:
+        stream.append(page)
+        return
+    stream.start_recording(cache.max_bytes)
+    request.treat_request(conf)
+    page = stream.recorded()
+    if page is not None:
+        cache.put(key, page)
 
-        try:
-            request.treat_request(conf)
-        except Exception as e:
-            logs.syslog(logs.LOG_ERR, f"Error handling request: {e}")
-            response_buffer.append("HTTP/1.1 500 Internal Server Error\r\n")
-            response_buffer.append("Content-Type: text/html\r\n")
-            response_buffer.append("\r\n")
-            response_buffer.append("<html><body><h1>Internal Server Error</h1></body></html>")
 
-        sys.stdout = original_stdout
+def serve_request(lines: List[str], headers: Dict[str, str], body_data: Any, addr, conn,
+                  may_keep_alive: bool = True) -> bool:
+    method, path, version = parse_request_line(lines[0])
 
-        response = ''.join(response_buffer)
-        if not response.startswith('HTTP/'):
-            response = 'HTTP/1.1 200 OK\r\n' + response
+    path_parts = path.split('?')
+    script_name = path_parts[0]
+    query_string = path_parts[1] if len(path_parts) > 1 else ''
 
-        conn.sendall(response.encode('utf-8'))
+    env = parse_query_string(query_string)
+
+    base_env = {}
+    for key, val in env:
+        base_env[key] = val
+
+    bname = base_env.get('b', '')
+
+    stream = ResponseStream(conn, version, may_keep_alive and wants_keep_alive(version, headers),
+                            head_only=(method == 'HEAD'),
+                            accept_encoding=headers.get('accept-encoding', ''))
+    conf = config.Config(
+        output_conf=stream.output_conf,
+        from_=addr[0] if isinstance(addr, tuple) else addr,
+        env=base_env,
+        bname=bname,
+        command=script_name,
+        request=path,
+        method=method,
+        headers=headers,
+        body_data=body_data if method == 'POST' and isinstance(body_data, bytes) else b'',
+        body_file=body_data if method == 'POST' and not isinstance(body_data, bytes) else None
+    )
+
+    begin_capture(stream)
+
+    try:
+        log_and_robot_check(time.time(), conf.from_, path, conf)
+        stream.validators = page_validators(conf)
+        if stream.validators and not_modified(headers, stream.validators):
+            stream.not_modified()
+        else:
+            serve_page(conf, stream)
+    except SystemExit:
+        pass
+    except Exception as e:
+        logs.syslog(logs.LOG_ERR, f"Error handling request: {e}")
+        if stream.discard():
+            stream.append("HTTP/1.1 500 Internal Server Error\r\n")
+            stream.append("Content-Type: text/html\r\n")
+            stream.append("\r\n")
+            stream.append("<html><body><h1>Internal Server Error</h1></body></html>")
+    finally:
+        end_capture()
+        if not isinstance(body_data, bytes):
+            body_data.close()
+
+    return stream.finish()
+
+
+def handle_connection(conn, addr):
+    try:
+        pending = bytearray()
+        served = 0
+        while True:
+            if served:
+                conn.settimeout(keepalive_timeout)
+            request_data = read_request(conn, pending)
+            if request_data is None:
+                return
+            if served:
+                conn.settimeout(conn_timeout)
+
+            lines, headers, body_data = request_data
+            if body_data is None:
+                refuse_body(conn, addr)
+                return
+            served += 1
+            keep_alive = serve_request(lines, headers, body_data, addr, conn,
+                                       served < max_keepalive_requests)
+            if not keep_alive:
+                return
 
     except Exception as e:
         logs.syslog(logs.LOG_ERR, f"Connection error: {e}")
+    finally:
+        conn.close()
+
+
+def shed_connection(conn, addr):
+    logs.syslog(logs.LOG_WARNING, f"Server overloaded, refusing {addr}")
+    try:
+        body = b"<html><body><h1>503 Service Unavailable</h1></body></html>"
+        conn.sendall(b"HTTP/1.1 503 Service Unavailable\r\n"
+                     b"Content-Type: text/html\r\n"
+                     b"Retry-After: 5\r\n"
+                     b"Connection: close\r\n"
+                     + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    except Exception:
+        pass
     finally:
         try:
             conn.close()
-        except:
+        except Exception:
             pass
 
 
+def refuse_body(conn, addr):
+    logs.syslog(logs.LOG_WARNING, f"Request body too large from {addr}")
+    try:
+        body = b"<html><body><h1>413 Payload Too Large</h1></body></html>"
+        conn.sendall(b"HTTP/1.1 413 Payload Too Large\r\n"
+                     b"Content-Type: text/html\r\n"
+                     b"Connection: close\r\n"
+                     + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    def __init__(self, handler, n_workers: int, max_queued: int):
+        self.handler = handler
+        self.n_workers = max(1, n_workers)
+        self.queue: queue.Queue = queue.Queue(maxsize=max(1, max_queued))
+        self.threads: List[threading.Thread] = []
+
+    def start(self):
+        for n in range(self.n_workers):
+            t = threading.Thread(target=self.worker, name=f"gwd-worker-{n}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                conn, addr = item
+                self.handler(conn, addr)
+            except Exception as e:
+                logs.syslog(logs.LOG_ERR, f"Worker error: {e}")
+            finally:
+                self.queue.task_done()
+
+    def submit(self, conn, addr) -> bool:
+        try:
+            self.queue.put_nowait((conn, addr))
+            return True
+        except queue.Full:
+            return False
+
+    def shutdown(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        for _ in self.threads:
+            try:
+                self.queue.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for t in self.threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        alive = sum(1 for t in self.threads if t.is_alive())
+        if alive:
+            logs.syslog(logs.LOG_WARNING, f"{alive} worker(s) still busy after {timeout}s drain")
+
+
 def geneweb_server(predictable_mode: bool = False):
     logs.info("GeneWeb server starting...")
     logs.info(f"Port: {selected_port}")
@@ -701,16 +1227,21 @@ def geneweb_server(predictable_mode: bool = False):
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
+    pool = ConnectionPool(handle_connection, n_workers, max_queued_connections)
+
     try:
         server_socket.bind((selected_addr or '', selected_port))
-        server_socket.listen(5)
+        server_socket.listen(max_pending_requests)
         logs.info(f"Server listening on port {selected_port}")
+        pool.start()
 
         while True:
             try:
                 conn, addr = server_socket.accept()
                 logs.info(f"Connection from {addr}")
-                handle_connection(conn, addr)
+                conn.settimeout(conn_timeout)
+                if not pool.submit(conn, addr):
+                    shed_connection(conn, addr)
             except KeyboardInterrupt:
                 logs.info("Server shutdown requested")
                 break
@@ -719,6 +1250,11 @@ def geneweb_server(predictable_mode: bool = False):
 
     finally:
         server_socket.close()
+        if pool.threads:
+            logs.info("Draining pending connections...")
+            pool.shutdown(drain_timeout)
+        if robot_xcl is not None:
+            robot.reset()
         logs.info("Server stopped")
 
 
@@ -754,6 +1290,11 @@ def geneweb_cgi(secret_salt: str, addr: str, script: str, query: str):
 
 def main():
     global selected_port, daemon, debug, selected_addr
+    global n_workers, max_pending_requests, max_queued_connections, conn_timeout, drain_timeout
+    global keepalive_timeout, max_keepalive_requests
+    page_cache_size = 0
+    page_cache_dir = None
+    page_cache_disk_size = None
 
     if len(sys.argv) > 1:
         i = 1
@@ -768,6 +1309,45 @@ def main():
             elif arg == '-addr' and i + 1 < len(sys.argv):
                 selected_addr = sys.argv[i + 1]
                 i += 2
+            elif arg == '-n_workers' and i + 1 < len(sys.argv):
+                n_workers = int(sys.argv[i + 1])
+                i += 2
+            elif arg == '-max_pending_requests' and i + 1 < len(sys.argv):
+                max_pending_requests = int(sys.argv[i + 1])
+                i += 2
+            elif arg == '-max_queued_connections' and i + 1 < len(sys.argv):
+                max_queued_connections = int(sys.argv[i + 1])
+                i += 2
+            elif arg == '-conn_tmout' and i + 1 < len(sys.argv):
+                conn_timeout = int(sys.argv[i + 1])
+                i += 2
+            elif arg == '-drain_tmout' and i + 1 < len(sys.argv):
+                drain_timeout = int(sys.argv[i + 1])
+                i += 2
+            elif arg == '-keepalive_tmout' and i + 1 < len(sys.argv):
+                keepalive_timeout = int(sys.argv[i + 1])
+                i += 2
+            elif arg == '-max_keepalive_requests' and i + 1 < len(sys.argv):
+                max_keepalive_requests = int(sys.argv[i + 1])
+                i += 2
+            elif arg == '-max_open_bases' and i + 1 < len(sys.argv):
+                database.base_registry.max_open = int(sys.argv[i + 1])
+                i += 2
+            elif arg == '-page_cache' and i + 1 < len(sys.argv):
+                page_cache_size = int(sys.argv[i + 1]) * 1024 * 1024
+                i += 2
+            elif arg == '-page_cache_dir' and i + 1 < len(sys.argv):
+                page_cache_dir = sys.argv[i + 1]
+                i += 2
+            elif arg == '-page_cache_disk' and i + 1 < len(sys.argv):
+                page_cache_disk_size = int(sys.argv[i + 1]) * 1024 * 1024
+                i += 2
+            elif arg == '-max_upload_size' and i + 1 < len(sys.argv):
+                import_queue.max_upload_size = int(sys.argv[i + 1]) * 1024 * 1024
+                i += 2
+            elif arg == '-robot_xcl' and i + 1 < len(sys.argv):
+                robot_exclude_arg(sys.argv[i + 1])
+                i += 2
             elif arg == '-daemon':
                 daemon = True
                 i += 1
@@ -777,6 +1357,8 @@ def main():
             else:
                 i += 1
 
+    page_cache.configure(page_cache_size, page_cache_dir, page_cache_disk_size)
+
     cgi = os.environ.get('GATEWAY_INTERFACE')
     if cgi:
         addr = os.environ.get('REMOTE_ADDR', '')
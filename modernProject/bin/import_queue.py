@@ -0,0 +1,263 @@
+import sys
+import os
+import re
+import shutil
+import threading
+import time
+import queue
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from lib import logs, progr_bar
+
+
+upload_chunk_size = 1 << 16
+upload_scan_size = 8192
+default_max_upload_size = 256 << 20
+max_upload_size = default_max_upload_size
+importing_suffix = ".importing"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class ImportJob:
+    name: str
+    ged_path: str
+    gwb_path: str
+    state: str = QUEUED
+    stage: str = ""
+    current: int = 0
+    total: int = 0
+    error: str = ""
+    submitted: float = 0.0
+    started: float = 0.0
+    finished: float = 0.0
+
+    def percent(self) -> int:
+        if self.state == DONE:
+            return 100
+        if not self.total:
+            return 0
+        return min(100, self.current * 100 // self.total)
+
+    def report(self, stage: str) -> Callable[[int, int], None]:
+        def update(current: int, total: int) -> None:
+            self.stage = stage
+            self.current = current
+            self.total = total
+        return update
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit: int):
+        self.limit = limit
+        super().__init__(f"Upload exceeds {limit} bytes")
+
+
+def check_upload_size(size: int) -> None:
+    if max_upload_size and size > max_upload_size:
+        raise UploadTooLarge(max_upload_size)
+
+
+def valid_base_name(name: str) -> bool:
+    return bool(re.fullmatch(r"[A-Za-z0-9_-]+", name))
+
+
+def copy_raw_upload(src: BinaryIO, out: BinaryIO) -> int:
+    first = src.read(upload_scan_size)
+    header_end = first.find(b'\r\n\r\n')
+    if header_end != -1:
+        first = first[header_end + 4:]
+    size = 0
+    chunk = first
+    while chunk:
+        size += len(chunk)
+        check_upload_size(size)
+        out.write(chunk)
+        chunk = src.read(upload_chunk_size)
+
+    tail_size = min(size, upload_scan_size)
+    out.seek(size - tail_size)
+    lines = out.read(tail_size).split(b'\r\n')
+    kept = len(lines)
+    while kept > 1 and (not lines[kept - 1] or lines[kept - 1].startswith(b'--')):
+        kept -= 1
+    if any(line.startswith(b'--') for line in lines[kept:]):
+        size = size - tail_size + len(b'\r\n'.join(lines[:kept]))
+        out.seek(size)
+        out.truncate()
+        out.write(b'\r\n')
+        size += 2
+    out.seek(0, os.SEEK_END)
+    return size
+
+
+def copy_multipart_file(src: BinaryIO, boundary: bytes, field: str,
+                        open_target: Callable[[str], Optional[BinaryIO]]) -> Optional[str]:
+    delim = b'--' + boundary
+    end_delim = b'\r\n' + delim
+    buf = b''
+    written = 0
+
+    def write(target: BinaryIO, data: bytes) -> None:
+        nonlocal written
+        written += len(data)
+        check_upload_size(written)
+        target.write(data)
+
+    def fill(needle: bytes) -> bool:
+        nonlocal buf
+        while needle not in buf:
+            chunk = src.read(upload_chunk_size)
+            if not chunk:
+                return False
+            buf += chunk
+        return True
+
+    if not fill(delim):
+        return None
+    buf = buf[buf.find(delim) + len(delim):]
+    while True:
+        while len(buf) < 2:
+            chunk = src.read(upload_chunk_size)
+            if not chunk:
+                return None
+            buf += chunk
+        if buf.startswith(b'--') or not fill(b'\r\n\r\n'):
+            return None
+        header_end = buf.find(b'\r\n\r\n')
+        part_headers = buf[:header_end]
+        buf = buf[header_end + 4:]
+
+        target = None
+        filename = None
+        if f'name="{field}"'.encode() in part_headers:
+            match = re.search(rb'filename="([^"]+)"', part_headers)
+            if match:
+                filename = match.group(1).decode('utf-8', errors='ignore')
+                target = open_target(filename)
+
+        keep = len(end_delim) - 1
+        while True:
+            i = buf.find(end_delim)
+            if i != -1:
+                if target is not None:
+                    write(target, buf[:i])
+                buf = buf[i + len(end_delim):]
+                break
+            if len(buf) > keep:
+                if target is not None:
+                    write(target, buf[:-keep])
+                buf = buf[-keep:]
+            chunk = src.read(upload_chunk_size)
+            if not chunk:
+                return None
+            buf += chunk
+        if target is not None:
+            return filename
+
+
+class ImportQueue:
+    def __init__(self, jobs: int = 1):
+        self.jobs = jobs
+        self.lock = threading.Lock()
+        self.pending: "queue.Queue[Optional[ImportJob]]" = queue.Queue()
+        self.imports: Dict[str, ImportJob] = {}
+        self.worker: Optional[threading.Thread] = None
+
+    def submit(self, name: str, ged_path: str, gwb_path: str) -> ImportJob:
+        with self.lock:
+            job = self.imports.get(name)
+            if job is not None and job.state in (QUEUED, RUNNING):
+                return job
+            job = ImportJob(name, ged_path, gwb_path, submitted=time.time())
+            self.imports[name] = job
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._work, name="gedcom-import", daemon=True)
+                self.worker.start()
+        self.pending.put(job)
+        logs.info(f"Queued import of {name}.ged")
+        return job
+
+    def status(self, name: str) -> Optional[ImportJob]:
+        with self.lock:
+            return self.imports.get(name)
+
+    def _work(self) -> None:
+        while True:
+            job = self.pending.get()
+            if job is None:
+                return
+            self.run(job)
+
+    def run(self, job: ImportJob) -> None:
+        from bin import ged2gwb
+
+        job.state = RUNNING
+        job.started = time.time()
+        tmp_path = job.gwb_path + importing_suffix
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        try:
+            ged2gwb.convert(job.ged_path, tmp_path, self.jobs,
+                            parse_bar=progr_bar.ProgressBar(disabled=True, report=job.report("parsing")),
+                            write_bar=progr_bar.ProgressBar(disabled=True, report=job.report("writing")))
+            os.rename(tmp_path, job.gwb_path)
+            job.state = DONE
+            logs.info(f"Imported {job.name}.ged in {time.time() - job.started:.1f}s")
+        except Exception as e:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            job.error = str(e) or type(e).__name__
+            job.state = FAILED
+            logs.err(f"Failed to import {job.name}.ged: {job.error}")
+        finally:
+            job.finished = time.time()
+
+    def stop(self) -> None:
+        with self.lock:
+            worker = self.worker
+            self.worker = None
+        if worker is not None:
+            self.pending.put(None)
+            worker.join()
+
+
+_queue: Optional[ImportQueue] = None
+_queue_lock = threading.Lock()
+
+
+def import_queue() -> ImportQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = ImportQueue()
+        return _queue
+
+
+def reset() -> None:
+    global _queue
+    with _queue_lock:
+        q, _queue = _queue, None
+    if q is not None:
+        q.stop()
+
+
+def ensure_base(base_dir: str, name: str) -> Optional[ImportJob]:
+    if not valid_base_name(name):
+        return None
+    gwb_path = os.path.join(base_dir, f"{name}.gwb")
+    ged_path = os.path.join(base_dir, f"{name}.ged")
+    job = import_queue().status(name)
+    if job is not None and job.state in (QUEUED, RUNNING):
+        return job
+    if os.path.isdir(gwb_path) or not os.path.isfile(ged_path):
+        return None
+    if job is not None and job.state == FAILED and os.path.getmtime(ged_path) <= job.submitted:
+        return job
+    return import_queue().submit(name, ged_path, gwb_path)
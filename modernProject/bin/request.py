@@ -1,11 +1,14 @@
 import sys
+import io
 import os
+import tempfile
 from pathlib import Path
 from typing import Optional, List, Callable, TypeVar, Any
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from lib import config, database, driver, util, name, logs, sosa, srcfile_display, secure, perso
+from lib import config, consang, database, driver, util, name, logs, sosa, srcfile_display, secure, perso
+from bin import import_queue
 
 
 T = TypeVar('T')
@@ -123,10 +126,9 @@ def w_base(none: Callable[[config.Config], T],
 
     try:
         full_path = os.path.join(secure.base_dir(), base_name)
-        return database.with_database(
+        return database.with_shared_database(
             full_path,
-            lambda base: callback(conf, base),
-            read_only=True
+            lambda base: callback(conf, base)
         )
     except Exception as e:
         logs.syslog(logs.LOG_ERR, f"Failed to open base {base_name}: {e}")
@@ -173,6 +175,16 @@ def incorrect_request(conf: config.Config, comment: Optional[str] = None):
     conf.output_conf.body(f"<body><h1>{msg}</h1></body></html>")
 
 
+def upload_too_large(conf: config.Config, limit: int):
+    conf.output_conf.status(413)
+    conf.output_conf.header("Content-type: text/html; charset=utf-8")
+    conf.output_conf.header("")
+
+    msg = f"Upload too large: the limit is {limit} bytes"
+    conf.output_conf.body(f"<html><head><title>{msg}</title></head>")
+    conf.output_conf.body(f"<body><h1>{msg}</h1></body></html>")
+
+
 def only_special_env(env: List[tuple[str, Any]]) -> bool:
     for key, _ in env:
         if not (key.startswith('_') or key == 'lang'):
@@ -180,46 +192,54 @@ def only_special_env(env: List[tuple[str, Any]]) -> bool:
     return True
 
 
-def handle_gedcom_upload(conf: config.Config):
-    try:
-        import re
+def upload_base_name(filename: str) -> Optional[str]:
+    name = os.path.basename(filename.replace('\\', '/'))
+    db_name = name.rsplit('.', 1)[0] if '.' in name else name
+    return db_name if import_queue.valid_base_name(db_name) else None
 
-        logs.info(f"Upload request received, method: {conf.method}")
-        logs.info(f"Body data length: {len(conf.body_data)}")
-
-        content_disp = conf.headers.get('content-disposition', '')
-        if content_disp:
-            filename_match = re.search(r'filename="([^"]+)"', content_disp)
-            if filename_match:
-                filename = filename_match.group(1)
 
-                gedcom_content = conf.body_data
-                if b'\r\n\r\n' in gedcom_content:
-                    header_end = gedcom_content.find(b'\r\n\r\n')
-                    gedcom_content = gedcom_content[header_end + 4:]
+def finish_upload(conf: config.Config, base_dir: str, db_name: str, part_path: str):
+    ged_path = os.path.join(base_dir, f"{db_name}.ged")
+    os.replace(part_path, ged_path)
+    logs.info(f"Uploaded GEDCOM file: {db_name}.ged ({os.path.getsize(ged_path)} bytes)")
+    import_queue.ensure_base(base_dir, db_name)
 
-                if b'--' in gedcom_content:
-                    lines = gedcom_content.split(b'\r\n')
-                    while lines and (not lines[-1] or lines[-1].startswith(b'--')):
-                        lines.pop()
-                    gedcom_content = b'\r\n'.join(lines) + b'\r\n'
+    conf.output_conf.status(303)
+    conf.output_conf.header("Content-type: text/html; charset=utf-8")
+    conf.output_conf.header(f"Location: /?b={db_name}&m=IMPORT")
+    conf.output_conf.header("")
+    conf.output_conf.body(f"<html><body>File {db_name}.ged uploaded successfully. Redirecting...</body></html>")
 
-                db_name = filename.rsplit('.', 1)[0] if '.' in filename else filename
 
-                base_dir = secure.base_dir()
-                ged_path = os.path.join(base_dir, f"{db_name}.ged")
+def handle_gedcom_upload(conf: config.Config):
+    import re
 
-                with open(ged_path, 'wb') as f:
-                    f.write(gedcom_content)
+    part_paths = []
+    try:
+        logs.info(f"Upload request received, method: {conf.method}")
+        src = conf.body_file if conf.body_file is not None else io.BytesIO(conf.body_data)
+        base_dir = secure.base_dir()
 
-                logs.info(f"Uploaded GEDCOM file: {db_name}.ged ({len(gedcom_content)} bytes)")
+        def open_part(filename: str):
+            db_name = upload_base_name(filename)
+            if db_name is None:
+                return None
+            fd, part_path = tempfile.mkstemp(prefix=f"{db_name}.", suffix=".ged.part", dir=base_dir)
+            part_paths.append((db_name, part_path))
+            return os.fdopen(fd, 'w+b')
 
-                conf.output_conf.status(303)
-                conf.output_conf.header("Content-type: text/html; charset=utf-8")
-                conf.output_conf.header("Location: /")
-                conf.output_conf.header("")
-                conf.output_conf.body(f"<html><body>File {db_name}.ged uploaded successfully. Redirecting...</body></html>")
+        content_disp = conf.headers.get('content-disposition', '')
+        filename_match = re.search(r'filename="([^"]+)"', content_disp)
+        if filename_match:
+            out = open_part(filename_match.group(1))
+            if out is None:
+                incorrect_request(conf, "Invalid database name")
                 return
+            with out:
+                import_queue.copy_raw_upload(src, out)
+            db_name, part_path = part_paths.pop()
+            finish_upload(conf, base_dir, db_name, part_path)
+            return
 
         content_type = conf.headers.get('content-type', '')
         if content_type.startswith('multipart/form-data'):
@@ -228,50 +248,86 @@ def handle_gedcom_upload(conf: config.Config):
                 incorrect_request(conf, "No boundary found in multipart data")
                 return
 
-            boundary = boundary_match.group(1).encode()
-            parts = conf.body_data.split(b'--' + boundary)
+            outs = []
 
-            gedcom_content = None
-            filename = None
+            def open_target(filename: str):
+                out = open_part(filename)
+                if out is not None:
+                    outs.append(out)
+                return out
 
-            for part in parts:
-                if b'Content-Disposition' in part and b'name="gedcom"' in part:
-                    filename_match = re.search(rb'filename="([^"]+)"', part)
-                    if filename_match:
-                        filename = filename_match.group(1).decode('utf-8', errors='ignore')
+            try:
+                filename = import_queue.copy_multipart_file(
+                    src, boundary_match.group(1).encode(), 'gedcom', open_target)
+            finally:
+                for out in outs:
+                    out.close()
 
-                    content_start = part.find(b'\r\n\r\n')
-                    if content_start != -1:
-                        gedcom_content = part[content_start + 4:].rstrip(b'\r\n')
-
-            if not gedcom_content or not filename:
+            if filename is None or not part_paths or os.path.getsize(part_paths[-1][1]) == 0:
                 incorrect_request(conf, "No GEDCOM file found in upload")
                 return
 
-            db_name = filename.rsplit('.', 1)[0] if '.' in filename else filename
-
-            base_dir = secure.base_dir()
-            ged_path = os.path.join(base_dir, f"{db_name}.ged")
-
-            with open(ged_path, 'wb') as f:
-                f.write(gedcom_content)
-
-            logs.info(f"Uploaded GEDCOM file: {db_name}.ged ({len(gedcom_content)} bytes)")
-
-            conf.output_conf.status(303)
-            conf.output_conf.header("Content-type: text/html; charset=utf-8")
-            conf.output_conf.header("Location: /")
-            conf.output_conf.header("")
-            conf.output_conf.body(f"<html><body>File {db_name}.ged uploaded successfully. Redirecting...</body></html>")
+            db_name, part_path = part_paths.pop()
+            finish_upload(conf, base_dir, db_name, part_path)
             return
 
         incorrect_request(conf, "Invalid upload format")
 
+    except import_queue.UploadTooLarge as e:
+        logs.warn(f"GEDCOM upload refused: {e}")
+        upload_too_large(conf, e.limit)
     except Exception as e:
         logs.err(f"Error handling GEDCOM upload: {e}")
         import traceback
         logs.err(traceback.format_exc())
         incorrect_request(conf, f"Upload failed: {e}")
+    finally:
+        for _, part_path in part_paths:
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+
+
+def print_import_status(conf: config.Config, job: Optional[import_queue.ImportJob]):
+    conf.output_conf.status(200)
+    conf.output_conf.header("Content-type: text/html; charset=utf-8")
+    conf.output_conf.header("Cache-Control: no-store")
+    conf.output_conf.header("")
+
+    running = job is not None and job.state in (import_queue.QUEUED, import_queue.RUNNING)
+    bname = util.escape_html(conf.bname)
+    conf.output_conf.body(f"<html><head><title>Importing {bname}</title>")
+    if running:
+        conf.output_conf.body("<meta http-equiv='refresh' content='2'>")
+    conf.output_conf.body("</head><body>")
+    conf.output_conf.body(f"<h1>Importing {bname}</h1>")
+    if job is None:
+        conf.output_conf.body(f"<p>The database is ready. <a href='?b={bname}'>Open {bname}</a></p>")
+    elif job.state == import_queue.FAILED:
+        conf.output_conf.body(f"<p>The import failed: {util.escape_html(job.error)}</p>")
+    elif job.state == import_queue.QUEUED:
+        conf.output_conf.body("<p>Waiting to start...</p>")
+    else:
+        conf.output_conf.body(f"<p>{job.stage.capitalize() or 'Starting'}: {job.percent()}%</p>")
+        conf.output_conf.body(f"<progress max='100' value='{job.percent()}'></progress>")
+    conf.output_conf.body("</body></html>")
+
+
+def handle_import_status(conf: config.Config):
+    if not conf.bname:
+        incorrect_request(conf, "No database given")
+        return
+    if not import_queue.valid_base_name(conf.bname):
+        incorrect_request(conf, "Invalid database name")
+        return
+
+    base_dir = secure.base_dir()
+    job = import_queue.ensure_base(base_dir, conf.bname)
+    if job is None and not os.path.isdir(os.path.join(base_dir, f"{conf.bname}.gwb")):
+        incorrect_request(conf, f"Unknown database: {conf.bname}")
+        return
+    print_import_status(conf, job)
 
 
 def treat_request(conf: config.Config):
@@ -317,6 +373,8 @@ def treat_request(conf: config.Config):
         handle_titles_page(conf)
     elif m == 'MISC':
         handle_misc_page(conf)
+    elif m == 'IMPORT':
+        handle_import_status(conf)
     else:
         incorrect_request(conf, f"Unknown module: {m}")
 
@@ -326,8 +384,10 @@ def default_person_page(conf: config.Config):
         srcfile_display.propose_base(conf)
         return
 
-    base_dir = secure.base_dir()
-    srcfile_display.convert_ged_if_needed(base_dir, conf.bname)
+    job = import_queue.ensure_base(secure.base_dir(), conf.bname)
+    if job is not None:
+        print_import_status(conf, job)
+        return
 
     i = util.p_getenv(conf.env, 'i')
     if i:
@@ -373,12 +433,43 @@ def handle_descend_page(conf: config.Config):
     conf.output_conf.body("</body></html>")
 
 
-def handle_relation_page(conf: config.Config):
+def relation_stub_page(conf: config.Config, base: Any = None):
     conf.output_conf.body("<html><body><h1>Relationship</h1>")
     conf.output_conf.body("<p><em>[Coming when relation.py is ready]</em></p>")
     conf.output_conf.body("</body></html>")
 
 
+def person_link(conf: config.Config, base: Any, ip: int) -> str:
+    p = driver.poi(base, ip)
+    first_name, surname = (s.decode('utf-8') if isinstance(s, bytes) else s
+                           for s in (driver.p_first_name(base, p), driver.p_surname(base, p)))
+    return (f"<a href=\"?b={util.escape_html(conf.bname)}&amp;i={ip}\">"
+            f"{util.escape_html(first_name)} {util.escape_html(surname)}</a>")
+
+
+def handle_relation_page(conf: config.Config):
+    def base_callback(c: config.Config, b: Any):
+        p1 = util.find_person_in_env(c, b, "")
+        p2 = util.find_person_in_env(c, b, "1")
+        if p1 is None or p2 is None:
+            return relation_stub_page(c, b)
+
+        ip1, ip2 = p1.key_index, p2.key_index
+        rel, tops = consang.relationship_engine(b).relationship(ip1, ip2)
+
+        c.output_conf.body("<html><body><h1>Relationship</h1>")
+        c.output_conf.body(f"<p>{person_link(c, b, ip1)} &ndash; {person_link(c, b, ip2)}</p>")
+        c.output_conf.body(f"<p>Relationship: {rel * 100:.4g}%</p>")
+        if tops:
+            c.output_conf.body("<h2>Common ancestors</h2><ul>")
+            for ip in tops:
+                c.output_conf.body(f"<li>{person_link(c, b, ip)}</li>")
+            c.output_conf.body("</ul>")
+        c.output_conf.body("</body></html>")
+
+    w_base(relation_stub_page, base_callback, conf, conf.bname)
+
+
 def handle_search_page(conf: config.Config):
     conf.output_conf.body("<html><body><h1>Search</h1>")
     conf.output_conf.body("<p><em>[Coming when searchName.py is ready]</em></p>")
@@ -1,8 +1,10 @@
 import sys
 import time
 import os
+import threading
+from collections import deque
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Deque, Dict, List, Tuple, Optional, Union
 from dataclasses import dataclass
 from enum import Enum
 
@@ -22,7 +24,7 @@ class UserType(Enum):
 
 @dataclass
 class Who:
-    acc_times: List[float]
+    acc_times: Union[List[float], Deque[float]]
     oldest_time: float
     nb_connect: int
     nbase: str
@@ -38,6 +40,7 @@ class Excl:
 
 
 min_disp_req = 20
+snapshot_interval = 30.0
 
 
 def robot_error(conf: config.Config, nb_conn: int, max_conn: int):
@@ -106,66 +109,144 @@ def save_robot_excl(excl: Excl, robot_file: str):
         logs.syslog(logs.LOG_ERR, f"Error writing robot file {robot_file}: {e}")
 
 
-def check(tm: float, from_addr: str, max_call: int, sec: int,
-          conf: config.Config, suicide: bool) -> Tuple[int, int, int, List[Tuple[str, float]]]:
-    excl, robot_file = robot_excl()
-
-    for addr, count in excl.excl:
-        if addr == from_addr:
-            if suicide:
-                excl.excl = [(a, c) for a, c in excl.excl if a != from_addr]
-                save_robot_excl(excl, robot_file)
-            robot_error(conf, count, max_call)
-
-    who_entry = excl.who.get(from_addr)
-
-    if who_entry is None:
-        utype = UserType.NORMAL
-        if conf.wizard:
-            utype = UserType.WIZARD
-        elif conf.friend:
-            utype = UserType.FRIEND
-
-        who_entry = Who(
-            acc_times=[tm],
-            oldest_time=tm,
-            nb_connect=1,
-            nbase=conf.bname,
-            utype=utype,
-            uname=conf.user
-        )
-        excl.who[from_addr] = who_entry
-    else:
+class RateLimiter:
+    def __init__(self, excl: Excl, robot_file: str, interval: float = None):
+        self.robot_file = robot_file
+        self.interval = snapshot_interval if interval is None else interval
+        self.lock = threading.Lock()
+        self.excl: Dict[str, int] = dict(excl.excl)
+        self.who: Dict[str, Who] = excl.who
+        self.max_conn = excl.max_conn
+        self.displayed: Dict[UserType, Dict[str, Who]] = {utype: {} for utype in UserType}
+        self.window: Optional[int] = None
+        self.dirty = False
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        for addr, who in self.who.items():
+            who.acc_times = deque(who.acc_times)
+            if who.nb_connect >= min_disp_req:
+                self.displayed[who.utype][addr] = who
+
+    def snapshot(self) -> Excl:
+        with self.lock:
+            self.dirty = False
+            return Excl(excl=list(self.excl.items()), who={}, max_conn=self.max_conn)
+
+    def flush(self) -> None:
+        if self.dirty:
+            save_robot_excl(self.snapshot(), self.robot_file)
+
+    def _snapshot_loop(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.flush()
+            self.prune(time.time())
+
+    def start(self) -> None:
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._snapshot_loop, daemon=True)
+            self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def prune(self, tm: float) -> None:
+        if self.window is None:
+            return
+        with self.lock:
+            for addr in [a for a, w in self.who.items() if not w.acc_times or w.acc_times[-1] < tm - self.window]:
+                self._forget(addr)
+
+    def _forget(self, addr: str) -> None:
+        who = self.who.pop(addr, None)
+        if who is not None:
+            self.displayed[who.utype].pop(addr, None)
+
+    def check(self, tm: float, from_addr: str, max_call: int, sec: int,
+              conf: config.Config, suicide: bool) -> Tuple[int, int, int, List[Tuple[str, float]]]:
+        self.window = sec
+        result = (0, 0, 0, [])
+        with self.lock:
+            count = self.excl.get(from_addr)
+            if count is not None:
+                if suicide:
+                    del self.excl[from_addr]
+                    self.dirty = True
+                blocked = count
+            else:
+                blocked = self._access(tm, from_addr, max_call, sec, conf)
+            if blocked is None:
+                result = (len(self.displayed[UserType.NORMAL]), len(self.displayed[UserType.WIZARD]),
+                          len(self.displayed[UserType.FRIEND]),
+                          [(w.uname, w.acc_times[-1]) for w in self.displayed[UserType.WIZARD].values()])
+        if blocked is not None:
+            robot_error(conf, blocked, max_call)
+        return result
+
+    def _access(self, tm: float, from_addr: str, max_call: int, sec: int,
+                conf: config.Config) -> Optional[int]:
+        who = self.who.get(from_addr)
+        if who is None:
+            utype = UserType.NORMAL
+            if conf.wizard:
+                utype = UserType.WIZARD
+            elif conf.friend:
+                utype = UserType.FRIEND
+            who = Who(acc_times=deque(), oldest_time=tm, nb_connect=0,
+                      nbase=conf.bname, utype=utype, uname=conf.user)
+            self.who[from_addr] = who
+
+        acc_times = who.acc_times
+        acc_times.append(tm)
         cutoff_time = tm - sec
-        recent_times = [t for t in who_entry.acc_times if t >= cutoff_time]
-        recent_times.append(tm)
+        while acc_times[0] < cutoff_time:
+            acc_times.popleft()
+        who.nb_connect = len(acc_times)
+        who.oldest_time = acc_times[0]
+
+        if who.nb_connect > max_call:
+            self.excl[from_addr] = who.nb_connect
+            self.dirty = True
+            self._forget(from_addr)
+            logs.syslog(logs.LOG_NOTICE,
+                        f"Robot blocked: {from_addr} ({who.nb_connect} connections)")
+            return who.nb_connect
 
-        who_entry.acc_times = recent_times
-        who_entry.nb_connect = len(recent_times)
-        who_entry.oldest_time = recent_times[0] if recent_times else tm
+        if who.nb_connect >= min_disp_req:
+            self.displayed[who.utype][from_addr] = who
+        else:
+            self.displayed[who.utype].pop(from_addr, None)
 
-        if who_entry.nb_connect > max_call:
-            excl.excl.append((from_addr, who_entry.nb_connect))
-            del excl.who[from_addr]
-            save_robot_excl(excl, robot_file)
+        if who.nb_connect > self.max_conn[0]:
+            self.max_conn = (who.nb_connect, from_addr)
+        return None
 
-            logs.syslog(logs.LOG_NOTICE,
-                       f"Robot blocked: {from_addr} ({who_entry.nb_connect} connections)")
-            robot_error(conf, who_entry.nb_connect, max_call)
 
-    max_conn_count, max_conn_addr = excl.max_conn
-    if who_entry.nb_connect > max_conn_count:
-        excl.max_conn = (who_entry.nb_connect, from_addr)
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
 
-    normal_robots = sum(1 for w in excl.who.values()
-                       if w.utype == UserType.NORMAL and w.nb_connect >= min_disp_req)
-    wizard_robots = sum(1 for w in excl.who.values()
-                       if w.utype == UserType.WIZARD and w.nb_connect >= min_disp_req)
-    friend_robots = sum(1 for w in excl.who.values()
-                       if w.utype == UserType.FRIEND and w.nb_connect >= min_disp_req)
+def limiter() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            excl, robot_file = robot_excl()
+            _limiter = RateLimiter(excl, robot_file)
+            _limiter.start()
+        return _limiter
 
-    wizard_list = [(w.uname, w.acc_times[-1] if w.acc_times else tm)
-                   for w in excl.who.values()
-                   if w.utype == UserType.WIZARD and w.nb_connect >= min_disp_req]
 
-    return normal_robots, wizard_robots, friend_robots, wizard_list
+def reset() -> None:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is not None:
+            _limiter.stop()
+        _limiter = None
+
+
+def check(tm: float, from_addr: str, max_call: int, sec: int,
+          conf: config.Config, suicide: bool) -> Tuple[int, int, int, List[Tuple[str, float]]]:
+    return limiter().check(tm, from_addr, max_call, sec, conf, suicide)
@@ -68,3 +68,4 @@ class Config:
     method: str = 'GET'
     headers: Dict[str, str] = field(default_factory=dict)
     body_data: bytes = b''
+    body_file: Optional[Any] = None
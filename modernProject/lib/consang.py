@@ -1,11 +1,18 @@
+import threading
+from array import array
+from collections import OrderedDict
 from enum import Enum
 from dataclasses import dataclass, field
-from typing import List, Tuple, Callable
+from typing import List, Optional, Tuple, Callable
 from lib import adef
+from lib import database
 from lib import driver
 from lib.collection import Marker
 
 
+COLUMN_BATCH = 4096
+
+
 class AncStat(Enum):
     MAYBE_ANC = 0
     IS_ANC = 1
@@ -32,7 +39,7 @@ class Relationship:
 
 @dataclass
 class RelationshipInfo:
-    tstab: Marker
+    tstab: array
     reltab: Marker
     queue: List[List[int]] = field(default_factory=lambda: [])
 
@@ -57,28 +64,35 @@ def new_mark() -> int:
 
 
 def _noloop_aux(base, error: Callable, tab: Marker, i: int):
-    visit_state = tab.get(i)
-    if visit_state == Visit.NOT_VISITED:
-        person = driver.poi(base, i)
-        parents_opt = driver.get_parents(person)
-        if parents_opt is not None:
-            fam = driver.foi(base, parents_opt)
-            fath = driver.get_father(fam)
-            moth = driver.get_mother(fam)
-            tab.set(i, Visit.BEING_VISITED)
-            _noloop_aux(base, error, tab, fath)
-            _noloop_aux(base, error, tab, moth)
-        tab.set(i, Visit.VISITED)
-    elif visit_state == Visit.BEING_VISITED:
-        from lib.gwdef import OwnAncestor
-        person = driver.poi(base, i)
-        error(OwnAncestor(person))
+    stack = [(i, False)]
+    while stack:
+        j, done = stack.pop()
+        if done:
+            tab.set(j, Visit.VISITED)
+            continue
+        visit_state = tab.get(j)
+        if visit_state == Visit.NOT_VISITED:
+            person = driver.poi(base, j)
+            parents_opt = driver.get_parents(person)
+            if parents_opt is not None:
+                fam = driver.foi(base, parents_opt)
+                tab.set(j, Visit.BEING_VISITED)
+                stack.append((j, True))
+                for y in (driver.get_mother(fam), driver.get_father(fam)):
+                    if y is not None and y >= 0:
+                        stack.append((y, False))
+            else:
+                tab.set(j, Visit.VISITED)
+        elif visit_state == Visit.BEING_VISITED:
+            from lib.gwdef import OwnAncestor
+            person = driver.poi(base, j)
+            error(OwnAncestor(person))
 
 
 def check_noloop(base, error: Callable):
     ipers = driver.ipers(base)
     tab = driver.iper_marker(ipers, Visit.NOT_VISITED)
-    for i in ipers:
+    for i in range(driver.nb_of_persons(base)):
         _noloop_aux(base, error, tab, i)
 
 
@@ -89,68 +103,103 @@ def check_noloop_for_person_list(base, error: Callable, person_list: List[int]):
         _noloop_aux(base, error, tab, i)
 
 
-def topological_sort(base, poi: Callable):
-    persons = driver.ipers(base)
-    tab = driver.iper_marker(persons, 0)
-    cnt = 0
+def _raise_own_ancestor(err):
+    from lib.gwdef import OwnAncestor
+    if isinstance(err, OwnAncestor):
+        raise TopologicalSortError(err.person)
+    raise AssertionError("Unexpected error type")
 
-    for i in persons:
-        a = poi(base, i)
-        parents_opt = driver.get_parents(a)
-        if parents_opt is not None:
-            cpl = driver.foi(base, parents_opt)
-            ifath = driver.get_father(cpl)
-            imoth = driver.get_mother(cpl)
-            tab.set(ifath, tab.get(ifath) + 1)
-            tab.set(imoth, tab.get(imoth) + 1)
 
-    todo = []
-    for i in persons:
-        if tab.get(i) == 0:
-            todo.append(i)
-
-    def loop(tval: int, lst: List[int]) -> int:
-        nonlocal cnt
-        if not lst:
-            return cnt
+def _topological_levels(fathers: array, mothers: array) -> Tuple[array, int]:
+    n = len(fathers)
+    tab = array('i', bytes(4 * n))
+    for parents in (fathers, mothers):
+        for y in parents:
+            if y >= 0:
+                tab[y] += 1
 
+    todo = [i for i in range(n) if tab[i] == 0]
+    tval = 0
+    cnt = 0
+    while todo:
         new_list = []
-        for i in lst:
-            a = poi(base, i)
-            tab.set(i, tval)
+        for i in todo:
+            tab[i] = tval
             cnt += 1
-            parents_opt = driver.get_parents(a)
-            if parents_opt is not None:
-                cpl = driver.foi(base, parents_opt)
-                ifath = driver.get_father(cpl)
-                imoth = driver.get_mother(cpl)
-                tab.set(ifath, tab.get(ifath) - 1)
-                tab.set(imoth, tab.get(imoth) - 1)
-                if tab.get(ifath) == 0:
-                    new_list.append(ifath)
-                if tab.get(imoth) == 0:
-                    new_list.append(imoth)
-
-        return loop(tval + 1, new_list)
-
-    loop(0, todo)
-
-    if cnt != driver.nb_of_persons(base):
-        def error_handler(err):
-            from lib.gwdef import OwnAncestor
-            if isinstance(err, OwnAncestor):
-                raise TopologicalSortError(err.person)
-            raise AssertionError("Unexpected error type")
-
-        check_noloop(base, error_handler)
-
+            for y in (fathers[i], mothers[i]):
+                if y >= 0:
+                    tab[y] -= 1
+                    if tab[y] == 0:
+                        new_list.append(y)
+        todo = new_list
+        tval += 1
+
+    return (tab, cnt)
+
+
+def int_field(v) -> Optional[int]:
+    if isinstance(v, int):
+        return v
+    if isinstance(v, dict):
+        fields = v.get('fields')
+        return int_field(fields[0]) if fields else None
+    if isinstance(v, list):
+        return int_field(v[0]) if v else None
+    return None
+
+
+def family_columns(base) -> Tuple[array, array]:
+    nb_families = driver.nb_of_families(base)
+    father = array('i', [-1]) * nb_families
+    mother = array('i', [-1]) * nb_families
+    for start in range(0, nb_families, COLUMN_BATCH):
+        batch = range(start, min(nb_families, start + COLUMN_BATCH))
+        for i, fam in zip(batch, driver.foi_many(base, batch, ('couple',))):
+            ifath, imoth = map(int_field, driver.get_parent_array(fam))
+            if ifath is not None:
+                father[i] = ifath
+            if imoth is not None:
+                mother[i] = imoth
+    return (father, mother)
+
+
+def parent_columns(base) -> Tuple[array, array, array]:
+    nb_persons = driver.nb_of_persons(base)
+    parents = array('i', [-1]) * nb_persons
+    for start in range(0, nb_persons, COLUMN_BATCH):
+        batch = range(start, min(nb_persons, start + COLUMN_BATCH))
+        for i, p in zip(batch, driver.poi_many(base, batch, ('ascend',))):
+            ifam = int_field(driver.get_parents(p))
+            if ifam is not None:
+                parents[i] = ifam
+    father, mother = family_columns(base)
+    return (parents, father, mother)
+
+
+def topological_sort(base) -> array:
+    parents, father, mother = parent_columns(base)
+    return topological_sort_columns(base, parents, father, mother)
+
+
+def topological_sort_columns(base, parents: array, father: array, mother: array) -> array:
+    n = len(parents)
+    fathers = array('i', [-1]) * n
+    mothers = array('i', [-1]) * n
+    for i, ifam in enumerate(parents):
+        if ifam >= 0:
+            fathers[i] = father[ifam]
+            mothers[i] = mother[ifam]
+
+    tab, cnt = _topological_levels(fathers, mothers)
+    if cnt != n:
+        check_noloop(base, _raise_own_ancestor)
     return tab
 
 
 PHONY_REL = Relationship()
 
 
-def make_relationship_info(base, tstab: Marker) -> RelationshipInfo:
+def make_relationship_info(base, tstab: array) -> RelationshipInfo:
     ipers = driver.ipers(base)
     tab = driver.iper_marker(ipers, PHONY_REL)
     return RelationshipInfo(tstab=tstab, reltab=tab, queue=[])
@@ -186,9 +235,11 @@ def insert_branch_len(ip: int, lens: List[Tuple[int, int, List[int]]], branch: T
 
 def consang_of(p) -> float:
     consang = driver.get_consang(p)
-    if consang == adef.NO_CONSANG:
-        return 0.0
-    return consang.to_float()
+    if isinstance(consang, adef.Fix):
+        return 0.0 if consang == adef.NO_CONSANG else consang.to_float()
+    if isinstance(consang, int) and consang >= 0:
+        return consang / 1000000.0
+    return 0.0
 
 
 def relationship_and_links(base, ri: RelationshipInfo, b: bool, ip1: int, ip2: int) -> Tuple[float, List[int]]:
@@ -227,12 +278,12 @@ def relationship_and_links(base, ri: RelationshipInfo, b: bool, ip1: int, ip2: i
             tu.anc_stat1 = AncStat.MAYBE_ANC
             tu.anc_stat2 = AncStat.MAYBE_ANC
 
-    qi = min(tstab.get(i1), tstab.get(i2))
+    qi = min(tstab[i1], tstab[i2])
     qmax = -1
 
     def insert(u: int):
         nonlocal qmax
-        v = tstab.get(u)
+        v = tstab[u]
         reset(u)
 
         if v >= len(ri.queue):
@@ -333,3 +384,106 @@ def relationship_and_links(base, ri: RelationshipInfo, b: bool, ip1: int, ip2: i
         qi += 1
 
     return (half(relationship_val), tops)
+
+
+RELATIONSHIP_CACHE_SIZE = 4096
+
+
+class RelationshipEngine:
+    def __init__(self, base, cache_size: int = RELATIONSHIP_CACHE_SIZE):
+        self.base = base
+        self.cache_size = cache_size
+        self.info = None
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def relationship_info(self) -> RelationshipInfo:
+        if self.info is None:
+            self.info = make_relationship_info(self.base, topological_sort(self.base))
+        return self.info
+
+    def relationship(self, ip1: int, ip2: int) -> Tuple[float, Tuple[int, ...]]:
+        key = (ip1, ip2) if ip1 <= ip2 else (ip2, ip1)
+        with self.lock:
+            result = self.cache.get(key)
+            if result is not None:
+                self.cache.move_to_end(key)
+                return result
+            rel, tops = relationship_and_links(self.base, self.relationship_info(), True, *key)
+            result = self.cache[key] = (rel, tuple(tops))
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return result
+
+    def clear(self):
+        with self.lock:
+            self.info = None
+            self.cache.clear()
+
+
+def relationship_engine(base) -> RelationshipEngine:
+    return database.shared_cache(base, 'relationship_engine', lambda: RelationshipEngine(base))
+
+
+def relationship_of_columns(tstab: array, parents: array, father: array, mother: array, consang: array,
+                            ip1: int, ip2: int) -> float:
+    if ip1 == ip2:
+        return 1.0
+    if ip1 < 0 or ip2 < 0:
+        return 0.0
+
+    weight1 = {ip1: 1.0, ip2: 0.0}
+    weight2 = {ip1: 0.0, ip2: 1.0}
+    rel = {ip1: 0.0, ip2: 0.0}
+    anc1 = {ip1}
+    anc2 = {ip2}
+    nb_anc1 = 1
+    nb_anc2 = 1
+    t1 = tstab[ip1]
+    t2 = tstab[ip2]
+    queue = {t1: [ip1]}
+    queue.setdefault(t2, []).append(ip2)
+    qi = min(t1, t2)
+    qmax = max(t1, t2)
+    relationship_val = 0.0
+
+    while qi <= qmax and nb_anc1 > 0 and nb_anc2 > 0:
+        for u in queue.pop(qi, ()):
+            w1 = weight1[u]
+            w2 = weight2[u]
+            cg = consang[u]
+            relationship_val += w1 * w2 - rel[u] * (1.0 + (cg / 1000000.0 if cg >= 0 else 0.0))
+            is_anc1 = u in anc1
+            is_anc2 = u in anc2
+            if is_anc1:
+                nb_anc1 -= 1
+            if is_anc2:
+                nb_anc2 -= 1
+            ifam = parents[u]
+            if ifam < 0:
+                continue
+            p1 = half(w1)
+            p2 = half(w2)
+            for y in (father[ifam], mother[ifam]):
+                if y < 0:
+                    continue
+                if y not in rel:
+                    weight1[y] = 0.0
+                    weight2[y] = 0.0
+                    rel[y] = 0.0
+                    ty = tstab[y]
+                    queue.setdefault(ty, []).append(y)
+                    if ty > qmax:
+                        qmax = ty
+                if is_anc1 and y not in anc1:
+                    anc1.add(y)
+                    nb_anc1 += 1
+                if is_anc2 and y not in anc2:
+                    anc2.add(y)
+                    nb_anc2 += 1
+                weight1[y] += p1
+                weight2[y] += p2
+                rel[y] += p1 * p2
+        qi += 1
+
+    return half(relationship_val)
@@ -1,5 +1,7 @@
 import sys
-from typing import Optional, Tuple, Callable
+import multiprocessing
+from array import array
+from typing import Optional, Tuple, Callable, List, Set
 from lib import driver
 from lib import consang
 from lib import adef
@@ -9,6 +11,8 @@ from lib import progr_bar
 
 _progress_bar = None
 
+PARALLEL_MIN_PAIRS = 32
+
 
 def _start_progress():
     global _progress_bar
@@ -65,13 +69,212 @@ def _consang_array(base) -> Tuple[Callable[[int], Optional[int]], Callable[[int]
     return (fget, cget, cset, patched)
 
 
-def compute(base, from_scratch: bool, verbosity: int = 2) -> bool:
+def _fix_value(v) -> int:
+    if isinstance(v, adef.Fix):
+        return v.value
+    if isinstance(v, dict) and 'value' in v:
+        return v['value']
+    value = consang.int_field(v)
+    return adef.NO_CONSANG.value if value is None else value
+
+
+def _consang_columns(base) -> Tuple[array, array, array, array]:
+    nb_persons = driver.nb_of_persons(base)
+    parents = array('i', [-1]) * nb_persons
+    consang_col = array('i', [-1]) * nb_persons
+
+    for start in range(0, nb_persons, consang.COLUMN_BATCH):
+        batch = range(start, min(nb_persons, start + consang.COLUMN_BATCH))
+        for i, p in zip(batch, driver.poi_many(base, batch, ('ascend',))):
+            ifam = consang.int_field(driver.get_parents(p))
+            if ifam is not None:
+                parents[i] = ifam
+            consang_col[i] = _fix_value(driver.get_consang(p))
+
+    father, mother = consang.family_columns(base)
+    return (parents, father, mother, consang_col)
+
+
+def _shared_int_array(values: array):
+    raw = multiprocessing.RawArray('i', len(values))
+    view = memoryview(raw).cast('B').cast('i')
+    view[:] = values
+    return (raw, view)
+
+
+_worker_columns = None
+
+
+def _init_worker(tstab: array, parents: array, father: array, mother: array, raw_cg):
+    global _worker_columns
+    _worker_columns = (tstab, parents, father, mother, memoryview(raw_cg).cast('B').cast('i'))
+
+
+def _worker_relationship(ifam: int) -> float:
+    tstab, parents, father, mother, cg = _worker_columns
+    return consang.relationship_of_columns(tstab, parents, father, mother, cg, father[ifam], mother[ifam])
+
+
+def _generation_levels(tstab: array) -> List[List[int]]:
+    levels = [[] for _ in range(max(tstab, default=-1) + 1)]
+    for i, t in enumerate(tstab):
+        levels[t].append(i)
+    levels.reverse()
+    return levels
+
+
+def descendants_closure(base, ipers, ifams) -> Set[int]:
+    seen_persons = set()
+    seen_families = set()
+    persons = list(ipers)
+    families = list(ifams)
+    for p in driver.poi_many(base, persons, ('ascend',)):
+        ifam = consang.int_field(driver.get_parents(p))
+        if ifam is not None:
+            families.append(ifam)
+
+    while persons or families:
+        persons = [ip for ip in dict.fromkeys(persons) if ip not in seen_persons]
+        seen_persons.update(persons)
+        families = [ifam for ifam in dict.fromkeys(families) if ifam not in seen_families]
+        seen_families.update(families)
+        next_families = []
+        for p in driver.poi_many(base, persons, ('union',)):
+            next_families.extend(consang.int_field(ifam) for ifam in driver.get_family(p) or [])
+        next_persons = []
+        for fam in driver.foi_many(base, families, ('descend',)):
+            next_persons.extend(consang.int_field(ip) for ip in driver.get_children(fam) or [])
+        persons = [ip for ip in next_persons if ip is not None]
+        families = [ifam for ifam in next_families if ifam is not None]
+
+    return seen_persons
+
+
+def compute_arrays(base, from_scratch: bool, verbosity: int = 2, jobs: int = 1,
+                   only: Optional[Set[int]] = None) -> bool:
+    from lib.gwdef import GenAscend
+    driver.load_ascends_array(base)
+    driver.load_couples_array(base)
+    parents, father, mother, old_consang = _consang_columns(base)
+    nb_persons = len(parents)
+    no_consang = adef.NO_CONSANG.value
+
+    if from_scratch:
+        cg = array('i', [no_consang]) * nb_persons
+    else:
+        cg = array('i', old_consang)
+        for i in only or ():
+            if 0 <= i < nb_persons:
+                cg[i] = no_consang
+    raw_cg = None
+    if jobs > 1:
+        raw_cg, cg = _shared_int_array(cg)
+    fam_cg = array('i', [no_consang]) * len(father)
+    max_cnt = 0
+    for i in range(nb_persons):
+        if cg[i] == no_consang:
+            max_cnt += 1
+        elif parents[i] >= 0:
+            fam_cg[parents[i]] = cg[i]
+
+    cnt = max_cnt
+    most = None
+    pool = None
+
+    try:
+        tstab = consang.topological_sort_columns(base, parents, father, mother)
+
+        if verbosity >= 1:
+            sys.stderr.write(f"To do: {max_cnt} persons\n")
+
+        if max_cnt != 0:
+            if verbosity >= 2:
+                sys.stderr.write("Computing consanguinity...")
+                sys.stderr.flush()
+            elif verbosity >= 1:
+                _start_progress()
+            if jobs > 1:
+                pool = multiprocessing.Pool(jobs, initializer=_init_worker,
+                                            initargs=(tstab, parents, father, mother, raw_cg))
+
+        for level in _generation_levels(tstab):
+            pairs = {}
+            for i in level:
+                ifam = parents[i]
+                if cg[i] == no_consang and ifam >= 0 and fam_cg[ifam] == no_consang:
+                    pairs[ifam] = None
+            pairs = list(pairs)
+            if pool is not None and len(pairs) >= PARALLEL_MIN_PAIRS:
+                chunksize = max(1, len(pairs) // (jobs * 4))
+                values = pool.map(_worker_relationship, pairs, chunksize)
+            else:
+                values = [consang.relationship_of_columns(tstab, parents, father, mother, cg, father[ifam], mother[ifam])
+                          for ifam in pairs]
+            fresh = dict(zip(pairs, values))
+            for ifam, relationship_val in fresh.items():
+                fam_cg[ifam] = adef.Fix.from_float(relationship_val).value
+
+            for i in level:
+                if cg[i] != no_consang:
+                    continue
+                ifam = parents[i]
+                v = fam_cg[ifam] if ifam >= 0 else 0
+                if ifam in fresh:
+                    relationship_val = fresh.pop(ifam)
+                    if verbosity >= 2 and (most is None or v > cg[most]):
+                        sys.stderr.write(f"\nMax consanguinity {relationship_val} for {gutil.designation(base, driver.poi(base, i))}... ")
+                        sys.stderr.flush()
+                        most = i
+                _trace(verbosity, cnt, max_cnt)
+                cnt -= 1
+                cg[i] = v
+
+        if max_cnt != 0:
+            if verbosity >= 2:
+                sys.stderr.write(" done   \n")
+                sys.stderr.flush()
+            elif verbosity >= 1:
+                _finish_progress()
+
+    except KeyboardInterrupt:
+        if verbosity > 0:
+            sys.stderr.write("\n")
+            sys.stderr.flush()
+
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    patched = False
+    for i in range(nb_persons):
+        if cg[i] != old_consang[i]:
+            ifam = parents[i]
+            driver.patch_ascend(base, i, GenAscend(parents=ifam if ifam >= 0 else None, consang=adef.Fix(cg[i])))
+            patched = True
+
+    if patched:
+        driver.commit_patches(base)
+
+    return patched
+
+
+def compute_incremental(base, ipers=(), ifams=(), verbosity: int = 0, jobs: int = 1) -> bool:
+    closure = descendants_closure(base, ipers, ifams)
+    if not closure:
+        return False
+    return compute_arrays(base, False, verbosity, jobs, only=closure)
+
+
+def compute(base, from_scratch: bool, verbosity: int = 2, fast: bool = False, jobs: int = 1) -> bool:
+    if fast or jobs > 1:
+        return compute_arrays(base, from_scratch, verbosity, jobs)
     driver.load_ascends_array(base)
     driver.load_couples_array(base)
     fget, cget, cset, patched = _consang_array(base)
 
     try:
-        ts = consang.topological_sort(base, driver.poi)
+        ts = consang.topological_sort(base)
         tab = consang.make_relationship_info(base, ts)
         persons = driver.ipers(base)
         families = driver.ifams(base)
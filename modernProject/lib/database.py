@@ -1,8 +1,11 @@
 import os
 import sys
 import struct
-from typing import Optional, List, Tuple, Callable, Any, Dict, TypeVar
-from dataclasses import dataclass
+import mmap
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Tuple, Callable, Any, Dict, Iterator, TypeVar
+from dataclasses import dataclass, field
 from lib.dbdisk import (
     DskPerson, DskAscend, DskUnion, DskFamily, DskCouple, DskDescend,
     RecordAccess, StringPersonIndex, BaseData, BaseFunc, BaseVersion, DskBase,
@@ -10,6 +13,7 @@ from lib.dbdisk import (
 )
 from lib.gwdef import BaseNotes
 from lib import iovalue
+from lib import page_cache
 from lib import secure
 from lib import name
 from lib import dutil
@@ -23,6 +27,8 @@ MAGIC_GNWB0022 = b"GnWb0022"
 MAGIC_GNWB0023 = b"GnWb0023"
 MAGIC_GNWB0024 = b"GnWb0024"
 MAGIC_PATCH = b"GnPa0001"
+MAGIC_STRINGS_INX = b"GnSi0001"
+MAGIC_NAMES_INX = b"GnNi0001"
 
 @dataclass
 class SynchroPath:
@@ -40,9 +46,9 @@ class PatchesHt:
     h_name: Dict[int, List[int]]
 
     def to_record(self):
-        def convert_ht(ht_tuple):
+        def convert_ht(ht_tuple, convert=lambda v: v):
             ref_list, ht_dict = ht_tuple
-            items = [{'tag': 0, 'fields': [k, v]} for k, v in ht_dict.items()]
+            items = [{'tag': 0, 'fields': [k, convert(v)]} for k, v in ht_dict.items()]
             return {'tag': 0, 'fields': [ref_list, items]}
 
         h_name_items = [{'tag': 0, 'fields': [k, v]} for k, v in self.h_name.items()]
@@ -51,7 +57,7 @@ class PatchesHt:
             'tag': 0,
             'fields': [
                 convert_ht(self.h_person),
-                convert_ht(self.h_ascend),
+                convert_ht(self.h_ascend, dutil.gen_ascend_to_dsk_ascend),
                 convert_ht(self.h_union),
                 convert_ht(self.h_family),
                 convert_ht(self.h_couple),
@@ -63,28 +69,28 @@ class PatchesHt:
 
     @classmethod
     def from_record(cls, record):
-        if not isinstance(record, dict) or 'fields' not in record:
-            return empty_patch_ht()
-
-        fields = record['fields']
-        if len(fields) != 8:
+        fields = block_fields(record)
+        if fields is None or len(fields) != 8:
             return empty_patch_ht()
 
         def convert_from_ht(ht_record):
-            if isinstance(ht_record, dict) and 'fields' in ht_record:
-                ref_list, items_list = ht_record['fields']
+            ht_fields = block_fields(ht_record)
+            if ht_fields is not None:
+                ref_list, items_list = ht_fields
                 items_dict = {}
                 for item in items_list:
-                    if isinstance(item, dict) and 'fields' in item:
-                        k, v = item['fields']
+                    item_fields = block_fields(item)
+                    if item_fields is not None:
+                        k, v = item_fields
                         items_dict[k] = v
                 return (ref_list, items_dict)
             return ([0], {})
 
         h_name_dict = {}
         for item in fields[7]:
-            if isinstance(item, dict) and 'fields' in item:
-                k, v = item['fields']
+            item_fields = block_fields(item)
+            if item_fields is not None:
+                k, v = item_fields
                 h_name_dict[k] = v
 
         return cls(
@@ -98,6 +104,22 @@ class PatchesHt:
             h_name=h_name_dict
         )
 
+def block_fields(v) -> Optional[list]:
+    if isinstance(v, dict):
+        return v.get('fields')
+    if isinstance(v, list):
+        return v
+    return None
+
+ACC_OFFSET = struct.Struct('>I')
+INT32 = struct.Struct('>i')
+
+def map_file(f) -> Optional[mmap.mmap]:
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        return None
+
 def input_binary_int(ic) -> int:
     data = ic.read(4)
     if len(data) < 4:
@@ -168,6 +190,14 @@ def input_synchro(bname: str) -> SynchroPath:
         return SynchroPath(synch_list=[])
 
 def with_database(bname: str, k: Callable[[DskBase], T], read_only: bool = False) -> T:
+    base, close = open_database(bname, read_only)
+    try:
+        return k(base)
+    finally:
+        close()
+
+
+def open_database(bname: str, read_only: bool = False) -> Tuple[DskBase, Callable[[], None]]:
     if not bname.endswith(".gwb"):
         bname = bname + ".gwb"
 
@@ -201,7 +231,11 @@ def with_database(bname: str, k: Callable[[DskBase], T], read_only: bool = False
         except:
             pass
 
-    with secure.open_in_bin(base_file) as ic:
+    ic = secure.open_in_bin(base_file)
+    ic_acc = None
+    base_map = None
+    acc_map = None
+    try:
         version = None
         if check_magic(MAGIC_GNWB0024, ic):
             version = BaseVersion.GNWB0024
@@ -232,9 +266,11 @@ def with_database(bname: str, k: Callable[[DskBase], T], read_only: bool = False
         norigin_file = iovalue.input_value(ic)
 
         base_acc_file = os.path.join(bname, "base.acc")
-        ic_acc = None
         if os.path.exists(base_acc_file):
             ic_acc = open(base_acc_file, 'rb')
+            acc_map = map_file(ic_acc)
+            if acc_map is not None:
+                base_map = map_file(ic)
 
         bnotes = BaseNotes(
             nread=lambda fname, mode: "",
@@ -242,39 +278,49 @@ def with_database(bname: str, k: Callable[[DskBase], T], read_only: bool = False
             efiles=lambda: []
         )
 
+        strings_lookup = StringsLookup(bname, strings_len)
+
+        lock = threading.Lock()
         shift = 0
         im_persons = make_immut_record_access(
-            read_only, ic, ic_acc, shift, persons_array_pos, persons_len, "persons"
+            read_only, ic, ic_acc, shift, persons_array_pos, persons_len, "persons", lock,
+            base_map=base_map, acc_map=acc_map
         )
         shift += persons_len * iovalue.SIZEOF_LONG
 
         im_ascends = make_immut_record_access(
-            read_only, ic, ic_acc, shift, ascends_array_pos, persons_len, "ascends"
+            read_only, ic, ic_acc, shift, ascends_array_pos, persons_len, "ascends", lock,
+            base_map=base_map, acc_map=acc_map
         )
         shift += persons_len * iovalue.SIZEOF_LONG
 
         im_unions = make_immut_record_access(
-            read_only, ic, ic_acc, shift, unions_array_pos, persons_len, "unions"
+            read_only, ic, ic_acc, shift, unions_array_pos, persons_len, "unions", lock,
+            base_map=base_map, acc_map=acc_map
         )
         shift += persons_len * iovalue.SIZEOF_LONG
 
         im_families = make_immut_record_access(
-            read_only, ic, ic_acc, shift, families_array_pos, families_len, "families"
+            read_only, ic, ic_acc, shift, families_array_pos, families_len, "families", lock,
+            base_map=base_map, acc_map=acc_map
         )
         shift += families_len * iovalue.SIZEOF_LONG
 
         im_couples = make_immut_record_access(
-            read_only, ic, ic_acc, shift, couples_array_pos, families_len, "couples"
+            read_only, ic, ic_acc, shift, couples_array_pos, families_len, "couples", lock,
+            base_map=base_map, acc_map=acc_map
         )
         shift += families_len * iovalue.SIZEOF_LONG
 
         im_descends = make_immut_record_access(
-            read_only, ic, ic_acc, shift, descends_array_pos, families_len, "descends"
+            read_only, ic, ic_acc, shift, descends_array_pos, families_len, "descends", lock,
+            base_map=base_map, acc_map=acc_map
         )
         shift += families_len * iovalue.SIZEOF_LONG
 
         im_strings = make_immut_record_access(
-            read_only, ic, ic_acc, shift, strings_array_pos, strings_len, "strings"
+            read_only, ic, ic_acc, shift, strings_array_pos, strings_len, "strings", lock,
+            base_map=base_map, acc_map=acc_map
         )
 
         persons = make_record_access(im_persons, patches.h_person, pending.h_person, persons_len)
@@ -301,7 +347,12 @@ def with_database(bname: str, k: Callable[[DskBase], T], read_only: bool = False
             perm=perm
         )
 
-        persons_of_name_fn = persons_of_name(bname, patches.h_name)
+        names_index = NamesIndex(bname)
+        persons_of_name_fn = persons_of_name(bname, patches.h_name, names_index)
+        strings_of_sname_lookup = strings_of_fsname(version, bname, strings, patches.h_person, 1, 0,
+                                                    name.split_sname, lambda p: p.surname, names_index)
+        strings_of_fname_lookup = strings_of_fsname(version, bname, strings, patches.h_person, 2, 1,
+                                                    name.split_fname, lambda p: p.first_name, names_index)
         persons_of_surname_fn = persons_of_surname(version, base_data, patches.h_person[1], bname)
         persons_of_first_name_fn = persons_of_first_name(version, base_data, patches.h_person[1], bname)
 
@@ -347,23 +398,26 @@ def with_database(bname: str, k: Callable[[DskBase], T], read_only: bool = False
             pending.h_descend[0][0] = descends.len
             pending.h_descend[1][i] = d
 
+        string_ids: Dict[str, int] = {}
+
         def insert_string_fn(s: str) -> int:
-            for i, existing in pending.h_string[1].items():
-                if existing == s:
-                    return i
-            for i, existing in patches.h_string[1].items():
-                if existing == s:
-                    return i
-            for i in range(strings.len):
-                try:
-                    if strings.get_nopending(i) == s:
-                        return i
-                except:
-                    pass
+            if not string_ids:
+                for i, existing in patches.h_string[1].items():
+                    string_ids.setdefault(string_value(existing), i)
+                for i, existing in pending.h_string[1].items():
+                    string_ids.setdefault(string_value(existing), i)
+            i = string_ids.get(s)
+            if i is not None:
+                return i
+            i = strings_lookup.find(s, strings.get_nopending)
+            if i is not None:
+                string_ids[s] = i
+                return i
             i = strings.len
             strings.len = strings.len + 1
             pending.h_string[0][0] = strings.len
             pending.h_string[1][i] = s
+            string_ids[s] = i
             return i
 
         def patch_name_fn(s: str, ip: int) -> None:
@@ -420,6 +474,7 @@ def with_database(bname: str, k: Callable[[DskBase], T], read_only: bool = False
                 oc.write(MAGIC_PATCH)
                 iovalue.output(oc, patches.to_record())
             move_with_backup(tmp_fname, fname)
+            page_cache.invalidate(bname)
 
         def commit_notes_fn(fnotes: str, s: str) -> None:
             if perm == Perm.RDONLY:
@@ -456,10 +511,21 @@ def with_database(bname: str, k: Callable[[DskBase], T], read_only: bool = False
             return person_of_key(persons, strings, persons_of_name_fn, first_name, surname, occ)
 
         def strings_of_sname_fn(s: str) -> List[int]:
-            return strings_of_fsname(version, bname, strings, patches.h_person, 1, 0, name.split_sname, lambda p: p.surname)(s)
+            return strings_of_sname_lookup(s)
 
         def strings_of_fname_fn(s: str) -> List[int]:
-            return strings_of_fsname(version, bname, strings, patches.h_person, 2, 1, name.split_fname, lambda p: p.first_name)(s)
+            return strings_of_fname_lookup(s)
+
+        def pending_changes_fn() -> Tuple[set, set]:
+            ipers = set(pending.h_person[1]) | set(pending.h_ascend[1]) | set(pending.h_union[1])
+            ifams = set(pending.h_family[1]) | set(pending.h_couple[1]) | set(pending.h_descend[1])
+            return (ipers, ifams)
+
+        def patched_persons_fn() -> set:
+            return set(patches.h_person[1]) | set(pending.h_person[1])
+
+        def date_of_last_change_fn() -> float:
+            return last_change(bname)
 
         base_func = BaseFunc(
             person_of_key=person_of_key_fn,
@@ -481,7 +547,10 @@ def with_database(bname: str, k: Callable[[DskBase], T], read_only: bool = False
             commit_wiznotes=commit_wiznotes_fn,
             nb_of_real_persons=nb_of_real_persons_fn,
             iper_exists=iper_exists_fn,
-            ifam_exists=ifam_exists_fn
+            ifam_exists=ifam_exists_fn,
+            pending_changes=pending_changes_fn,
+            patched_persons=patched_persons_fn,
+            date_of_last_change=date_of_last_change_fn
         )
 
         base = DskBase(
@@ -490,12 +559,200 @@ def with_database(bname: str, k: Callable[[DskBase], T], read_only: bool = False
             version=version
         )
 
+    except BaseException:
+        close_files(ic, ic_acc, base_map, acc_map)
+        raise
+
+    def close() -> None:
+        close_files(ic, ic_acc, base_map, acc_map, strings_lookup, names_index)
+
+    return base, close
+
+def string_value(v: Any) -> Any:
+    if isinstance(v, (bytes, bytearray)):
+        return bytes(v).decode('utf-8', errors='replace')
+    return v
+
+
+class StringsLookup:
+    def __init__(self, bname: str, strings_len: int):
+        self.bname = bname
+        self.strings_len = strings_len
+        self.loaded = False
+        self.inx = None
+        self.taba_size = 0
+        self.ids: Optional[Dict[Any, int]] = None
+
+    def load(self, get: Callable[[int], Any]) -> None:
+        self.loaded = True
+        fname = os.path.join(self.bname, "strings.inx")
+        if os.path.exists(fname):
+            with secure.open_in_bin(fname) as ic:
+                inx = map_file(ic)
+            if inx is not None:
+                taba_size = 0
+                if inx[:len(MAGIC_STRINGS_INX)] == MAGIC_STRINGS_INX:
+                    taba_size = ACC_OFFSET.unpack_from(inx, len(MAGIC_STRINGS_INX))[0]
+                expected = len(MAGIC_STRINGS_INX) + INT_SIZE * (1 + taba_size + self.strings_len)
+                if taba_size > 0 and len(inx) == expected:
+                    self.inx = inx
+                    self.taba_size = taba_size
+                    return
+                inx.close()
+        self.ids = {}
+        for i in range(self.strings_len - 1, -1, -1):
+            self.ids[string_value(get(i))] = i
+
+    def find(self, s: str, get: Callable[[int], Any]) -> Optional[int]:
+        if not self.loaded:
+            self.load(get)
+        if self.ids is not None:
+            return self.ids.get(s)
+        taba_pos = len(MAGIC_STRINGS_INX) + INT_SIZE
+        tabl_pos = taba_pos + INT_SIZE * self.taba_size
+        ia = dutil.stable_hash(s) % self.taba_size
+        i = INT32.unpack_from(self.inx, taba_pos + INT_SIZE * ia)[0]
+        while 0 <= i < self.strings_len:
+            if string_value(get(i)) == s:
+                return i
+            i = INT32.unpack_from(self.inx, tabl_pos + INT_SIZE * i)[0]
+        return None
+
+    def close(self) -> None:
+        if self.inx is not None:
+            self.inx.close()
+            self.inx = None
+
+
+def close_files(*files) -> None:
+    for f in files:
+        if f is not None:
+            f.close()
+
+
+def base_stamp(bname: str) -> Tuple[Optional[Tuple[int, int]], ...]:
+    stamp = []
+    for fname in ("base", "patches", "commit_timestamp"):
         try:
-            result = k(base)
-            return result
+            st = os.stat(os.path.join(bname, fname))
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def last_change(bname: str) -> float:
+    for fname in ("patches", "base"):
+        try:
+            return os.stat(os.path.join(bname, fname)).st_mtime
+        except OSError:
+            pass
+    return 0.0
+
+
+@dataclass
+class OpenBase:
+    base: DskBase
+    close: Callable[[], None]
+    stamp: Tuple[Optional[Tuple[int, int]], ...]
+    users: int = 0
+    stale: bool = False
+    caches: Dict[str, Any] = field(default_factory=dict)
+
+    def shutdown(self) -> None:
+        self.caches.clear()
+        self.close()
+
+
+class BaseRegistry:
+    def __init__(self, max_open: int = 8):
+        self.max_open = max_open
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, OpenBase]" = OrderedDict()
+        self.opening: Dict[str, threading.Event] = {}
+
+    def _retire(self, key: str) -> None:
+        entry = self.entries.pop(key)
+        entry.stale = True
+        if entry.users == 0:
+            entry.shutdown()
+
+    def acquire(self, bname: str) -> OpenBase:
+        if not bname.endswith(".gwb"):
+            bname = bname + ".gwb"
+        key = os.path.abspath(bname)
+        stamp = base_stamp(key)
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry.stamp == stamp:
+                    self.entries.move_to_end(key)
+                    entry.users += 1
+                    return entry
+                opening = self.opening.get(key)
+                if opening is None:
+                    opening = self.opening[key] = threading.Event()
+                    break
+            opening.wait()
+            stamp = base_stamp(key)
+
+        try:
+            base, close = open_database(key, read_only=True)
+        except BaseException:
+            with self.lock:
+                del self.opening[key]
+            opening.set()
+            raise
+
+        with self.lock:
+            del self.opening[key]
+            opening.set()
+            if key in self.entries:
+                self._retire(key)
+            entry = OpenBase(base=base, close=close, stamp=stamp, users=1)
+            self.entries[key] = entry
+            while len(self.entries) > max(1, self.max_open):
+                self._retire(next(iter(self.entries)))
+            return entry
+
+    def release(self, entry: OpenBase) -> None:
+        with self.lock:
+            entry.users -= 1
+            if entry.stale and entry.users == 0:
+                entry.shutdown()
+
+    def cached(self, base: DskBase, name: str, make: Callable[[], T]) -> T:
+        with self.lock:
+            for entry in self.entries.values():
+                if entry.base is base:
+                    value = entry.caches.get(name)
+                    if value is None:
+                        value = entry.caches[name] = make()
+                    return value
+        return make()
+
+    def with_base(self, bname: str, k: Callable[[DskBase], T]) -> T:
+        entry = self.acquire(bname)
+        try:
+            return k(entry.base)
         finally:
-            if ic_acc:
-                ic_acc.close()
+            self.release(entry)
+
+    def clear(self) -> None:
+        with self.lock:
+            for key in list(self.entries):
+                self._retire(key)
+
+
+base_registry = BaseRegistry()
+
+
+def with_shared_database(bname: str, k: Callable[[DskBase], T]) -> T:
+    return base_registry.with_base(bname, k)
+
+
+def shared_cache(base: DskBase, name: str, make: Callable[[], T]) -> T:
+    return base_registry.cached(base, name, make)
 
 def apply_patches(arr: List[T], patches: Dict[int, T], new_len: int) -> List[T]:
     if isinstance(arr, (bytes, bytearray)):
@@ -515,9 +772,20 @@ def apply_patches(arr: List[T], patches: Dict[int, T], new_len: int) -> List[T]:
 
     return result
 
+def iter_patched(arr, patches: Dict[int, T], length: int) -> Iterator[T]:
+    arr_len = len(arr)
+    for i in range(length):
+        if i in patches:
+            yield patches[i]
+        elif i < arr_len:
+            yield arr[i]
+        else:
+            yield None
+
 class ImmutRecord:
     def __init__(self, read_only: bool, ic, ic_acc, shift: int, array_pos: int,
-                 len_val: int, name: str):
+                 len_val: int, name: str, lock: Optional[threading.Lock] = None,
+                 base_map=None, acc_map=None):
         self.read_only = read_only
         self.ic = ic
         self.ic_acc = ic_acc
@@ -527,6 +795,9 @@ class ImmutRecord:
         self.name = name
         self.cached_array = None
         self.cleared = False
+        self.lock = lock
+        self.base_map = base_map
+        self.acc_map = acc_map
 
     def im_get(self, i: int) -> Any:
         if self.cached_array is not None:
@@ -535,20 +806,37 @@ class ImmutRecord:
         if i < 0 or i >= self.len:
             raise IndexError(f"access {self.name} out of bounds; i = {i}")
 
-        if self.ic_acc is not None:
-            self.ic_acc.seek(self.shift + (iovalue.SIZEOF_LONG * i))
-            pos = input_binary_int(self.ic_acc)
-            self.ic.seek(pos)
-            return iovalue.input_value(self.ic)
-        else:
+        if self.acc_map is not None and self.base_map is not None:
+            pos = ACC_OFFSET.unpack_from(self.acc_map, self.shift + iovalue.SIZEOF_LONG * i)[0]
+            return iovalue.input_value(iovalue.BufferReader(self.base_map, pos))
+
+        if self.ic_acc is None:
             raise RuntimeError("Sorry; I really need base.acc")
 
+        if self.lock is not None:
+            with self.lock:
+                return self._read_at(i)
+        return self._read_at(i)
+
+    def _read_at(self, i: int) -> Any:
+        self.ic_acc.seek(self.shift + (iovalue.SIZEOF_LONG * i))
+        pos = input_binary_int(self.ic_acc)
+        self.ic.seek(pos)
+        return iovalue.input_value(self.ic)
+
     def im_array(self) -> List[Any]:
         if self.cached_array is not None:
             return self.cached_array
 
-        self.ic.seek(self.array_pos)
-        self.cached_array = iovalue.input_value(self.ic)
+        if self.base_map is not None:
+            self.cached_array = iovalue.input_value(iovalue.BufferReader(self.base_map, self.array_pos))
+        elif self.lock is not None:
+            with self.lock:
+                self.ic.seek(self.array_pos)
+                self.cached_array = iovalue.input_value(self.ic)
+        else:
+            self.ic.seek(self.array_pos)
+            self.cached_array = iovalue.input_value(self.ic)
         return self.cached_array
 
     def im_clear_array(self) -> None:
@@ -556,8 +844,11 @@ class ImmutRecord:
         self.cached_array = None
 
 def make_immut_record_access(read_only: bool, ic, ic_acc, shift: int,
-                              array_pos: int, len_val: int, name: str) -> ImmutRecord:
-    return ImmutRecord(read_only, ic, ic_acc, shift, array_pos, len_val, name)
+                              array_pos: int, len_val: int, name: str,
+                              lock: Optional[threading.Lock] = None,
+                              base_map=None, acc_map=None) -> ImmutRecord:
+    return ImmutRecord(read_only, ic, ic_acc, shift, array_pos, len_val, name, lock,
+                       base_map=base_map, acc_map=acc_map)
 
 def make_record_access(immut_record: ImmutRecord,
                        patches: Tuple[List[int], Dict[int, Any]],
@@ -581,12 +872,11 @@ def make_record_access(immut_record: ImmutRecord,
     def load_array() -> None:
         immut_record.im_array()
 
-    def output_array(oc) -> None:
+    def output_array(writer: iovalue.ValueWriter) -> List[int]:
         arr = immut_record.im_array()
         if immut_record.read_only:
             raise RuntimeError("cannot modify read-only data")
-        patched_arr = apply_patches(arr, patches_dict, current_len)
-        dutil.output_value_no_sharing(oc, patched_arr)
+        return writer.output_array(iter_patched(arr, patches_dict, current_len), current_len)
 
     def clear_array() -> None:
         immut_record.im_clear_array()
@@ -604,8 +894,16 @@ TABLE_SIZE = 0x3FFF
 INT_SIZE = 4
 
 def name_index(s: str) -> int:
+    return dutil.stable_hash(name.crush_lower(s)) % TABLE_SIZE
+
+def legacy_name_index(s: str) -> int:
     return hash(name.crush_lower(s)) % TABLE_SIZE
 
+def names_inx_layout(ic) -> Tuple[int, Callable[[str], int]]:
+    if check_magic(MAGIC_NAMES_INX, ic):
+        return len(MAGIC_NAMES_INX), name_index
+    return 0, legacy_name_index
+
 def binary_search(arr: List[Tuple[Any, Any]], cmp: Callable[[Tuple[Any, Any]], int]) -> int:
     if not arr:
         raise KeyError("Not found")
@@ -711,29 +1009,86 @@ def compare_fnames_i(base_data: BaseData, is1: int, is2: int) -> int:
     s2 = base_data.strings.get(is2)
     return compare_fnames(base_data, s1, s2)
 
-def persons_of_name(bname: str, patches_h_name: Dict[int, List[int]]) -> Callable[[str], List[int]]:
-    cached_table = [None]
+class NamesIndex:
+    def __init__(self, bname: str, cache_size: int = 1024):
+        self.bname = bname
+        self.cache_size = cache_size
+        self.lock = threading.RLock()
+        self.opened = False
+        self.inx = None
+        self.acc = None
+        self.start = 0
+        self.index_of: Callable[[str], int] = name_index
+        self.tables: Dict[Optional[int], List[Any]] = {}
+        self.buckets: "OrderedDict[Tuple[int, int], List[int]]" = OrderedDict()
+
+    def open(self) -> None:
+        if self.opened:
+            return
+        with self.lock:
+            if self.opened:
+                return
+            with secure.open_in_bin(os.path.join(self.bname, "names.inx")) as ic_inx:
+                self.start, self.index_of = names_inx_layout(ic_inx)
+                self.inx = map_file(ic_inx)
+                if self.inx is None:
+                    ic_inx.seek(0)
+                    self.inx = ic_inx.read()
+            names_acc_file = os.path.join(self.bname, "names.acc")
+            if os.path.exists(names_acc_file):
+                with secure.open_in_bin(names_acc_file) as ic_acc:
+                    self.acc = map_file(ic_acc)
+            self.opened = True
+
+    def bucket(self, acc_slot: int, i: int, header_offset: Optional[int] = None) -> List[int]:
+        with self.lock:
+            self.open()
+            if self.acc is not None:
+                key = (acc_slot, i)
+                ai = self.buckets.get(key)
+                if ai is not None:
+                    self.buckets.move_to_end(key)
+                    return ai
+                pos = ACC_OFFSET.unpack_from(self.acc, iovalue.SIZEOF_LONG * (acc_slot * TABLE_SIZE + i))[0]
+                ai = iovalue.input_value_from_buffer(self.inx, pos)[0]
+                if self.cache_size > 0:
+                    self.buckets[key] = ai
+                    if len(self.buckets) > self.cache_size:
+                        self.buckets.popitem(last=False)
+                return ai
+            table = self.tables.get(header_offset)
+            if table is None:
+                if header_offset is None:
+                    pos = self.start + INT_SIZE
+                else:
+                    pos = ACC_OFFSET.unpack_from(self.inx, self.start + header_offset)[0]
+                table = iovalue.input_value_from_buffer(self.inx, pos)[0]
+                self.tables[header_offset] = table
+            return table[i]
+
+    def close(self) -> None:
+        with self.lock:
+            for f in (self.inx, self.acc):
+                if isinstance(f, mmap.mmap):
+                    f.close()
+            self.inx = None
+            self.acc = None
+            self.tables.clear()
+            self.buckets.clear()
+            self.opened = False
+
+def persons_of_name(bname: str, patches_h_name: Dict[int, List[int]],
+                    names_index: Optional[NamesIndex] = None) -> Callable[[str], List[int]]:
+    if names_index is None:
+        names_index = NamesIndex(bname)
 
     def lookup(s: str) -> List[int]:
-        i = name_index(s)
-        names_inx_file = os.path.join(bname, "names.inx")
-        names_acc_file = os.path.join(bname, "names.acc")
-
-        with secure.open_in_bin(names_inx_file) as ic_inx:
-            if os.path.exists(names_acc_file):
-                with secure.open_in_bin(names_acc_file) as ic_inx_acc:
-                    ic_inx_acc.seek(iovalue.SIZEOF_LONG * i)
-                    pos = input_binary_int(ic_inx_acc)
-                ic_inx.seek(pos)
-                ai = iovalue.input_value(ic_inx)
-            else:
-                if cached_table[0] is None:
-                    ic_inx.seek(INT_SIZE)
-                    cached_table[0] = iovalue.input_value(ic_inx)
-                ai = cached_table[0][i]
+        names_index.open()
+        ai = names_index.bucket(0, names_index.index_of(s))
 
         result = list(ai) if isinstance(ai, (list, tuple)) else []
 
+        i = name_index(s)
         if i in patches_h_name:
             patch_list = patches_h_name[i]
             for ip in patch_list:
@@ -939,29 +1294,17 @@ def strings_of_fsname(version: BaseVersion, bname: str, strings: RecordAccess,
                       patches_h_person: Tuple[List[int], Dict[int, DskPerson]],
                       offset_acc: int, offset_inx: int,
                       split_fn: Callable[[str], List[str]],
-                      get_fn: Callable[[DskPerson], int]) -> Callable[[str], List[int]]:
-    if version == BaseVersion.GNWB0024 or version == BaseVersion.GNWB0023:
-        cached_table = [None]
+                      get_fn: Callable[[DskPerson], int],
+                      names_index: Optional[NamesIndex] = None) -> Callable[[str], List[int]]:
+    if names_index is None:
+        names_index = NamesIndex(bname)
 
+    if version == BaseVersion.GNWB0024 or version == BaseVersion.GNWB0023:
         def lookup(s: str) -> List[int]:
-            i = name_index(s)
-            names_inx_file = os.path.join(bname, "names.inx")
-            names_acc_file = os.path.join(bname, "names.acc")
-
-            with secure.open_in_bin(names_inx_file) as ic_inx:
-                if os.path.exists(names_acc_file):
-                    with secure.open_in_bin(names_acc_file) as ic_inx_acc:
-                        ic_inx_acc.seek(iovalue.SIZEOF_LONG * ((offset_acc * TABLE_SIZE) + i))
-                        pos = input_binary_int(ic_inx_acc)
-                    ic_inx.seek(pos)
-                    ai = iovalue.input_value(ic_inx)
-                else:
-                    if cached_table[0] is None:
-                        ic_inx.seek(offset_inx)
-                        pos = input_binary_int(ic_inx)
-                        ic_inx.seek(pos)
-                        cached_table[0] = iovalue.input_value(ic_inx)
-                    ai = cached_table[0][i]
+            names_index.open()
+            index_of = names_index.index_of
+            i = index_of(s)
+            ai = names_index.bucket(offset_acc, i, offset_inx * INT_SIZE)
 
             result = list(ai) if isinstance(ai, (list, tuple)) else []
 
@@ -972,41 +1315,26 @@ def strings_of_fsname(version: BaseVersion, bname: str, strings: RecordAccess,
                 if istr not in result:
                     parts = split_fn(str_val)
                     if len(parts) == 1:
-                        if i == name_index(parts[0]):
+                        if i == index_of(parts[0]):
                             result.append(istr)
                     else:
                         for part in parts:
-                            if i == name_index(part):
+                            if i == index_of(part):
                                 result.append(istr)
                                 break
                         if str_val not in [strings.get(r) for r in result]:
-                            if i == name_index(str_val):
+                            if i == index_of(str_val):
                                 result.append(istr)
 
             return result
 
         return lookup
     else:
-        cached_table = [None]
-
         def lookup_old(s: str) -> List[int]:
-            i = name_index(s)
-            names_inx_file = os.path.join(bname, "names.inx")
-            names_acc_file = os.path.join(bname, "names.acc")
-
-            with secure.open_in_bin(names_inx_file) as ic_inx:
-                if os.path.exists(names_acc_file):
-                    with secure.open_in_bin(names_acc_file) as ic_inx_acc:
-                        ic_inx_acc.seek(iovalue.SIZEOF_LONG * (TABLE_SIZE + i))
-                        pos = input_binary_int(ic_inx_acc)
-                    ic_inx.seek(pos)
-                    ai = iovalue.input_value(ic_inx)
-                else:
-                    if cached_table[0] is None:
-                        pos = input_binary_int(ic_inx)
-                        ic_inx.seek(pos)
-                        cached_table[0] = iovalue.input_value(ic_inx)
-                    ai = cached_table[0][i]
+            names_index.open()
+            index_of = names_index.index_of
+            i = index_of(s)
+            ai = names_index.bucket(1, i, 0)
 
             result = list(ai) if isinstance(ai, (list, tuple)) else []
 
@@ -1017,11 +1345,11 @@ def strings_of_fsname(version: BaseVersion, bname: str, strings: RecordAccess,
                 if istr not in result:
                     parts = split_fn(str_val)
                     if len(parts) == 1:
-                        if i == name_index(parts[0]):
+                        if i == index_of(parts[0]):
                             result.append(istr)
                     else:
                         for part in parts:
-                            if i == name_index(part):
+                            if i == index_of(part):
                                 result.append(istr)
                                 break
 
@@ -1039,8 +1367,8 @@ def record_access_of(tab: List[Any]) -> RecordAccess:
     def get_nopending_fn(i: int) -> Any:
         return tab[i]
 
-    def output_array_fn(oc) -> None:
-        dutil.output_value_no_sharing(oc, tab)
+    def output_array_fn(writer: iovalue.ValueWriter) -> List[int]:
+        return writer.output_array(tab)
 
     def clear_array_fn() -> None:
         pass
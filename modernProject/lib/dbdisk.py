@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from enum import Enum, auto
-from typing import Callable, List, Optional, Any, TYPE_CHECKING
+from typing import Callable, List, Optional, Any, Set, Tuple, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from lib.gwdef import GenPerson, GenFamily
@@ -24,7 +24,7 @@ class RecordAccess:
     get: Callable[[int], Any]
     get_nopending: Callable[[int], Any]
     len: int
-    output_array: Callable[[Any], None]
+    output_array: Callable[[Any], List[int]]
     clear_array: Callable[[], None]
 
 
@@ -85,6 +85,9 @@ class BaseFunc:
     nb_of_real_persons: Callable[[], int]
     iper_exists: Callable[[int], bool]
     ifam_exists: Callable[[int], bool]
+    pending_changes: Optional[Callable[[], Tuple[Set[int], Set[int]]]] = None
+    patched_persons: Optional[Callable[[], Set[int]]] = None
+    date_of_last_change: Optional[Callable[[], float]] = None
 
 
 class BaseVersion(Enum):
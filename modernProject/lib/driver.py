@@ -1,4 +1,4 @@
-from typing import Optional, List, Callable, Any, Tuple
+from typing import Optional, List, Callable, Any, Set, Tuple
 from dataclasses import dataclass
 from lib import dutil
 from lib.gwdef import GenPerson, GenFamily, GenAscend, GenUnion, GenCouple, GenDescend
@@ -130,20 +130,24 @@ class Person:
     gen_ascend: Optional[GenAscend] = None
     gen_union: Optional[GenUnion] = None
 
-    def _ensure_loaded(self):
+    def _ensure_person(self):
         if self.gen_person is None:
-            persons_get = self.base.data.persons.get
-            ascends_get = self.base.data.ascends.get
-            unions_get = self.base.data.unions.get
-            strings_get = self.base.data.strings.get
+            dsk_person = self.base.data.persons.get(self.index)
+            self.gen_person = dutil.person_to_gen_person(dsk_person, self.base.data.strings.get, self.index)
 
-            dsk_person = persons_get(self.index)
-            dsk_ascend = ascends_get(self.index)
-            dsk_union = unions_get(self.index)
+    def _ensure_ascend(self):
+        if self.gen_ascend is None:
+            self.gen_ascend = dutil.ascend_to_gen_ascend(self.base.data.ascends.get(self.index))
 
-            self.gen_person = dutil.person_to_gen_person(dsk_person, strings_get, self.index)
-            self.gen_ascend = dutil.ascend_to_gen_ascend(dsk_ascend)
-            self.gen_union = dutil.union_to_gen_union(dsk_union)
+    def _ensure_union(self):
+        if self.gen_union is None:
+            self.gen_union = dutil.union_to_gen_union(self.base.data.unions.get(self.index))
+
+    def _ensure_loaded(self):
+        if self.gen_person is None:
+            self._ensure_person()
+            self._ensure_ascend()
+            self._ensure_union()
 
 
 @dataclass
@@ -154,20 +158,62 @@ class Family:
     gen_couple: Optional[GenCouple] = None
     gen_descend: Optional[GenDescend] = None
 
+    def _ensure_family(self):
+        if self.gen_family is None:
+            dsk_family = self.base.data.families.get(self.index)
+            self.gen_family = dutil.family_to_gen_family(dsk_family, self.base.data.strings.get, self.index)
+
+    def _ensure_couple(self):
+        if self.gen_couple is None:
+            self.gen_couple = dutil.couple_to_gen_couple(self.base.data.couples.get(self.index))
+
+    def _ensure_descend(self):
+        if self.gen_descend is None:
+            self.gen_descend = dutil.descend_to_gen_descend(self.base.data.descends.get(self.index))
+
     def _ensure_loaded(self):
         if self.gen_family is None:
-            families_get = self.base.data.families.get
-            couples_get = self.base.data.couples.get
-            descends_get = self.base.data.descends.get
-            strings_get = self.base.data.strings.get
+            self._ensure_family()
+            self._ensure_couple()
+            self._ensure_descend()
+
+
+PERSON_KINDS = {'person': Person._ensure_person, 'ascend': Person._ensure_ascend, 'union': Person._ensure_union}
+FAMILY_KINDS = {'family': Family._ensure_family, 'couple': Family._ensure_couple, 'descend': Family._ensure_descend}
 
-            dsk_family = families_get(self.index)
-            dsk_couple = couples_get(self.index)
-            dsk_descend = descends_get(self.index)
 
-            self.gen_family = dutil.family_to_gen_family(dsk_family, strings_get, self.index)
-            self.gen_couple = dutil.couple_to_gen_couple(dsk_couple)
-            self.gen_descend = dutil.descend_to_gen_descend(dsk_descend)
+def _check_kinds(kinds, all_kinds):
+    if kinds is None:
+        return set(all_kinds)
+    unknown = set(kinds) - set(all_kinds)
+    if unknown:
+        raise ValueError(f"Unknown record kinds: {', '.join(sorted(unknown))}")
+    return set(kinds)
+
+
+def _load_many(make, cls, loaders, kinds, indexes):
+    loaded = {}
+    for i in indexes:
+        if i not in loaded:
+            loaded[i] = make(i)
+    order = sorted(i for i, x in loaded.items() if isinstance(x, cls))
+    for kind, load in loaders.items():
+        if kind in kinds:
+            for i in order:
+                load(loaded[i])
+    return [loaded[i] for i in indexes]
+
+
+def poi_many(base, ipers, kinds=None) -> List[Person]:
+    ipers = list(ipers)
+    kinds = _check_kinds(kinds, PERSON_KINDS)
+    return _load_many(lambda i: poi(base, i), Person, PERSON_KINDS, kinds, ipers)
+
+
+def foi_many(base, ifams, kinds=None) -> List[Family]:
+    ifams = list(ifams)
+    kinds = _check_kinds(kinds, FAMILY_KINDS)
+    return _load_many(lambda i: foi(base, i), Family, FAMILY_KINDS, kinds, ifams)
 
 
 def poi(base, i: iper) -> Person:
@@ -234,187 +280,187 @@ def get_iper(person: Person) -> iper:
 
 
 def get_first_name(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.first_name
 
 
 def get_surname(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.surname
 
 
 def get_occ(person: Person) -> int:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.occ
 
 
 def get_image(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.image
 
 
 def get_public_name(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.public_name
 
 
 def get_qualifiers(person: Person) -> List[istr]:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.qualifiers
 
 
 def get_aliases(person: Person) -> List[istr]:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.aliases
 
 
 def get_first_names_aliases(person: Person) -> List[istr]:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.first_names_aliases
 
 
 def get_surnames_aliases(person: Person) -> List[istr]:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.surnames_aliases
 
 
 def get_titles(person: Person) -> List[Any]:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.titles
 
 
 def get_related(person: Person) -> List[iper]:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.related
 
 
 def get_rparents(person: Person) -> List[Any]:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.rparents
 
 
 def get_occupation(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.occupation
 
 
 def get_sex(person: Person) -> Any:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.sex
 
 
 def get_access(person: Person) -> Any:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.access
 
 
 def get_birth(person: Person) -> Any:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.birth
 
 
 def get_birth_place(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.birth_place
 
 
 def get_birth_note(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.birth_note
 
 
 def get_birth_src(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.birth_src
 
 
 def get_baptism(person: Person) -> Any:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.baptism
 
 
 def get_baptism_place(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.baptism_place
 
 
 def get_baptism_note(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.baptism_note
 
 
 def get_baptism_src(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.baptism_src
 
 
 def get_death(person: Person) -> Any:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.death
 
 
 def get_death_place(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.death_place
 
 
 def get_death_note(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.death_note
 
 
 def get_death_src(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.death_src
 
 
 def get_burial(person: Person) -> Any:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.burial
 
 
 def get_burial_place(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.burial_place
 
 
 def get_burial_note(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.burial_note
 
 
 def get_burial_src(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.burial_src
 
 
 def get_pevents(person: Person) -> List[Any]:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.pevents
 
 
 def get_notes(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.notes
 
 
 def get_psources(person: Person) -> istr:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person.psources
 
 
 def get_consang(person: Person) -> Any:
-    person._ensure_loaded()
+    person._ensure_ascend()
     return person.gen_ascend.consang
 
 
 def get_parents(person: Person) -> Optional[ifam]:
-    person._ensure_loaded()
+    person._ensure_ascend()
     return person.gen_ascend.parents
 
 
 def get_family(person: Person) -> List[ifam]:
-    person._ensure_loaded()
+    person._ensure_union()
     return person.gen_union.family
 
 
@@ -423,77 +469,77 @@ def get_ifam(family: Family) -> ifam:
 
 
 def get_father(family: Family) -> iper:
-    family._ensure_loaded()
+    family._ensure_couple()
     return family.gen_couple.father
 
 
 def get_mother(family: Family) -> iper:
-    family._ensure_loaded()
+    family._ensure_couple()
     return family.gen_couple.mother
 
 
 def get_parent_array(family: Family) -> Tuple[iper, iper]:
-    family._ensure_loaded()
+    family._ensure_couple()
     return (family.gen_couple.father, family.gen_couple.mother)
 
 
 def get_children(family: Family) -> List[iper]:
-    family._ensure_loaded()
+    family._ensure_descend()
     return family.gen_descend.children
 
 
 def get_marriage(family: Family) -> Any:
-    family._ensure_loaded()
+    family._ensure_family()
     return family.gen_family.marriage
 
 
 def get_marriage_place(family: Family) -> istr:
-    family._ensure_loaded()
+    family._ensure_family()
     return family.gen_family.marriage_place
 
 
 def get_marriage_note(family: Family) -> istr:
-    family._ensure_loaded()
+    family._ensure_family()
     return family.gen_family.marriage_note
 
 
 def get_marriage_src(family: Family) -> istr:
-    family._ensure_loaded()
+    family._ensure_family()
     return family.gen_family.marriage_src
 
 
 def get_divorce(family: Family) -> Any:
-    family._ensure_loaded()
+    family._ensure_family()
     return family.gen_family.divorce
 
 
 def get_witnesses(family: Family) -> List[iper]:
-    family._ensure_loaded()
+    family._ensure_family()
     return family.gen_family.witnesses
 
 
 def get_relation(family: Family) -> Any:
-    family._ensure_loaded()
+    family._ensure_family()
     return family.gen_family.relation
 
 
 def get_fevents(family: Family) -> List[Any]:
-    family._ensure_loaded()
+    family._ensure_family()
     return family.gen_family.fevents
 
 
 def get_comment(family: Family) -> istr:
-    family._ensure_loaded()
+    family._ensure_family()
     return family.gen_family.comment
 
 
 def get_fsources(family: Family) -> istr:
-    family._ensure_loaded()
+    family._ensure_family()
     return family.gen_family.fsources
 
 
 def get_origin_file(family: Family) -> istr:
-    family._ensure_loaded()
+    family._ensure_family()
     return family.gen_family.origin_file
 
 
@@ -625,6 +671,17 @@ def insert_string(base, s: str) -> istr:
     return Istr.EMPTY
 
 
+def pending_changes(base) -> Tuple[Set[iper], Set[ifam]]:
+    if hasattr(base, 'func') and getattr(base.func, 'pending_changes', None) is not None:
+        return base.func.pending_changes()
+    return (set(), set())
+
+
+def title_index(base):
+    from lib import title_index as title_index_mod
+    return title_index_mod.for_base(base)
+
+
 def commit_patches(base):
     if hasattr(base, 'func') and hasattr(base.func, 'commit_patches'):
         base.func.commit_patches()
@@ -786,17 +843,17 @@ def clear_families_array(base):
 
 
 def gen_person_of_person(person: Person) -> GenPerson:
-    person._ensure_loaded()
+    person._ensure_person()
     return person.gen_person
 
 
 def gen_ascend_of_person(person: Person) -> GenAscend:
-    person._ensure_loaded()
+    person._ensure_ascend()
     return person.gen_ascend
 
 
 def gen_union_of_person(person: Person) -> GenUnion:
-    person._ensure_loaded()
+    person._ensure_union()
     return person.gen_union
 
 
@@ -809,17 +866,17 @@ def new_ifam(base) -> ifam:
 
 
 def gen_couple_of_family(family: Family) -> GenCouple:
-    family._ensure_loaded()
+    family._ensure_couple()
     return family.gen_couple
 
 
 def gen_descend_of_family(family: Family) -> GenDescend:
-    family._ensure_loaded()
+    family._ensure_descend()
     return family.gen_descend
 
 
 def gen_family_of_family(family: Family) -> GenFamily:
-    family._ensure_loaded()
+    family._ensure_family()
     return family.gen_family
 
 
@@ -1267,9 +1324,8 @@ def write_nldb(base, nldb):
 
 
 def date_of_last_change(base) -> float:
-    if hasattr(base, 'func') and hasattr(base.func, 'date_of_last_change'):
-        return base.func.date_of_last_change()
-    return 0.0
+    f = getattr(getattr(base, 'func', None), 'date_of_last_change', None)
+    return f() if f is not None else 0.0
 
 
 def string_gen_person(base, p: GenPerson) -> GenPerson:
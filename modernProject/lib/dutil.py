@@ -1,3 +1,4 @@
+import zlib
 from typing import Any, List
 from lib import iovalue
 from lib import name
@@ -38,9 +39,15 @@ def output_value_no_sharing(oc, v: Any) -> None:
     iovalue.output(oc, v)
 
 
+def stable_hash(s) -> int:
+    if isinstance(s, str):
+        s = s.encode('utf-8')
+    return zlib.crc32(s)
+
+
 def name_index(s: str) -> int:
     from lib.database import TABLE_SIZE
-    return hash(name.crush_lower(s)) % TABLE_SIZE
+    return stable_hash(name.crush_lower(s)) % TABLE_SIZE
 
 
 def compare_snames(base_data, s1: str, s2: str) -> int:
@@ -115,6 +122,17 @@ def person_to_gen_person(dsk_person, strings_get, iper):
     return dsk_person
 
 
+def _option_value(v):
+    if isinstance(v, dict) and 'tag' in v:
+        if v['tag'] == 1 and v.get('fields'):
+            return v['fields'][0]
+        if v['tag'] == 0:
+            return None
+    if isinstance(v, list):
+        return v[0] if v else None
+    return v
+
+
 def ascend_to_gen_ascend(dsk_ascend):
     from lib.gwdef import GenAscend
     if isinstance(dsk_ascend, GenAscend):
@@ -129,19 +147,23 @@ def ascend_to_gen_ascend(dsk_ascend):
         consang = dsk_ascend.get('consang', {'tag': 'Fix', 'value': -1})
         return GenAscend(parents=parents, consang=consang)
     if isinstance(dsk_ascend, (list, tuple)) and len(dsk_ascend) >= 2:
-        parents = dsk_ascend[0]
-        if isinstance(parents, dict) and 'tag' in parents:
-            if parents['tag'] == 0:
-                parents = None
-            elif parents['tag'] == 1 and 'fields' in parents:
-                parents = parents['fields'][0] if parents['fields'] else None
         return GenAscend(
-            parents=parents,
+            parents=_option_value(dsk_ascend[0]),
             consang=dsk_ascend[1]
         )
     return dsk_ascend
 
 
+def gen_ascend_to_dsk_ascend(a):
+    from lib.gwdef import GenAscend
+    from lib.adef import Fix
+    if not isinstance(a, GenAscend):
+        return a
+    parents = {'tag': 1, 'fields': [a.parents]} if a.parents is not None else {'tag': 0, 'fields': []}
+    consang = a.consang.value if isinstance(a.consang, Fix) else a.consang
+    return {'tag': 0, 'fields': [parents, consang]}
+
+
 def union_to_gen_union(dsk_union):
     from lib.gwdef import GenUnion
     if isinstance(dsk_union, GenUnion):
@@ -217,7 +239,7 @@ def couple_to_gen_couple(dsk_couple):
 
         return Couple(father=father, mother=mother)
     if isinstance(dsk_couple, (list, tuple)) and len(dsk_couple) >= 2:
-        return Couple(father=dsk_couple[0], mother=dsk_couple[1])
+        return Couple(father=_option_value(dsk_couple[0]), mother=_option_value(dsk_couple[1]))
     return dsk_couple
 
 
@@ -0,0 +1,103 @@
+import heapq
+import itertools
+import pickle
+import shutil
+import tempfile
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from lib import iovalue
+
+RUN_SIZE = 1 << 16
+RUN_BATCH = 4096
+
+
+def _read_run(f) -> Iterator[Any]:
+    f.seek(0)
+    while True:
+        try:
+            batch = pickle.load(f)
+        except EOFError:
+            return
+        yield from batch
+
+
+class ExternalSorter:
+    def __init__(self, run_size: int = RUN_SIZE, tmpdir: Optional[str] = None):
+        self.run_size = run_size
+        self.tmpdir = tmpdir
+        self.items: List[Any] = []
+        self.runs = []
+
+    def add(self, item: Any) -> None:
+        self.items.append(item)
+        if len(self.items) >= self.run_size:
+            self.spill()
+
+    def spill(self) -> None:
+        if not self.items:
+            return
+        self.items.sort()
+        f = tempfile.TemporaryFile(dir=self.tmpdir)
+        for start in range(0, len(self.items), RUN_BATCH):
+            pickle.dump(self.items[start:start + RUN_BATCH], f, pickle.HIGHEST_PROTOCOL)
+        self.runs.append(f)
+        self.items = []
+
+    def __iter__(self) -> Iterator[Any]:
+        self.items.sort()
+        if not self.runs:
+            return iter(self.items)
+        return heapq.merge(*(_read_run(f) for f in self.runs), self.items)
+
+    def unique(self) -> Iterator[Any]:
+        return (item for item, _ in itertools.groupby(self))
+
+    def close(self) -> None:
+        for f in self.runs:
+            f.close()
+        self.runs = []
+        self.items = []
+
+    def __enter__(self) -> 'ExternalSorter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def output_buckets(writer: iovalue.ValueWriter, size: int,
+                   pairs: Iterable[Tuple[int, Any]]) -> List[int]:
+    offsets = []
+    iovalue.encode_block_header(writer.buf, 0, size)
+    groups = itertools.groupby(pairs, key=lambda pair: pair[0])
+    bucket, group = next(groups, (size, None))
+    for i in range(size):
+        offsets.append(writer.tell())
+        if i == bucket:
+            writer.output([value for _, value in group])
+            bucket, group = next(groups, (size, None))
+        else:
+            writer.output([])
+    return offsets
+
+
+def output_name_lists(oc_dat, oc_inx, entries: Iterable[Tuple[Any, ...]],
+                      key: Callable[[Tuple[Any, ...]], Any], value: Callable[[Tuple[Any, ...]], int],
+                      tmpdir: Optional[str] = None) -> None:
+    count = 0
+    with tempfile.TemporaryFile(dir=tmpdir) as spool:
+        writer = iovalue.ValueWriter(spool)
+        for istr, group in itertools.groupby(entries, key=key):
+            values = [value(entry) for entry in group]
+            pos = oc_dat.tell()
+            oc_dat.write(len(values).to_bytes(4, 'big'))
+            oc_dat.write(b''.join(v.to_bytes(4, 'big') for v in values))
+            writer.output([istr, pos])
+            count += 1
+        writer.flush()
+
+        buf = bytearray()
+        iovalue.encode_block_header(buf, 0, count)
+        oc_inx.write(buf)
+        spool.seek(0)
+        shutil.copyfileobj(spool, oc_inx)
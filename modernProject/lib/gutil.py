@@ -4,6 +4,7 @@ from lib import date
 from lib import buff
 from lib import mutil
 from lib import adef
+from lib import driver
 
 
 def father(cpl):
@@ -33,9 +34,9 @@ def spouse(ip, cpl):
 
 
 def designation(base, p) -> str:
-    first_name = base.p_first_name(p)
-    nom = base.p_surname(p)
-    return f"{first_name}.{base.get_occ(p)} {nom}"
+    first_name, nom = (s.decode('utf-8') if isinstance(s, bytes) else s
+                       for s in (driver.p_first_name(base, p), driver.p_surname(base, p)))
+    return f"{first_name}.{driver.get_occ(p)} {nom}"
 
 
 def person_is_key(base, p, k: str) -> bool:
@@ -1,6 +1,7 @@
+import io
 import struct
 import sys
-from typing import Any, BinaryIO, Callable
+from typing import Any, BinaryIO, Callable, List
 from dataclasses import dataclass
 
 SIZEOF_LONG = 4
@@ -34,6 +35,30 @@ class OutFuns:
     output_binary_int: Callable[[BinaryIO, int], None]
     output_data: Callable[[BinaryIO, bytes], None]
 
+class BufferReader:
+    __slots__ = ('buf', 'pos')
+
+    def __init__(self, buf, pos: int = 0):
+        self.buf = buf
+        self.pos = pos
+
+    def read(self, n: int = -1) -> bytes:
+        start = self.pos
+        end = len(self.buf) if n < 0 else min(start + n, len(self.buf))
+        self.pos = end
+        return bytes(self.buf[start:end])
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        if whence == 1:
+            pos += self.pos
+        elif whence == 2:
+            pos += len(self.buf)
+        self.pos = pos
+        return pos
+
+    def tell(self) -> int:
+        return self.pos
+
 def sign_extend(x: int) -> int:
     if SIGN_EXTEND_SHIFT <= 0:
         return x
@@ -159,7 +184,91 @@ def input_loop(ifuns: InFuns, ic: BinaryIO) -> Any:
     else:
         raise ValueError(f"Invalid code: 0x{code:02x}")
 
+INT8 = struct.Struct('>b')
+INT16 = struct.Struct('>h')
+INT32 = struct.Struct('>i')
+UINT32 = struct.Struct('>I')
+UINT64 = struct.Struct('>Q')
+
+def decode_string(buf, pos: int, length: int):
+    end = pos + length
+    if end > len(buf):
+        raise EOFError("Unexpected end of file")
+    return bytes(buf[pos:end]), end
+
+def decode_block(buf, pos: int, tag: int, size: int):
+    items = [None] * size
+    for i in range(size):
+        code = buf[pos]
+        if code >= PREFIX_SMALL_BLOCK:
+            if code == PREFIX_SMALL_BLOCK:
+                items[i] = []
+                pos += 1
+            else:
+                items[i], pos = decode_at(buf, pos)
+        elif code >= PREFIX_SMALL_INT:
+            items[i] = code & 0x3F
+            pos += 1
+        elif code >= PREFIX_SMALL_STRING:
+            items[i], pos = decode_string(buf, pos + 1, code & 0x1F)
+        else:
+            items[i], pos = decode_at(buf, pos)
+    if tag == 0:
+        return items, pos
+    return {'tag': tag, 'fields': items}, pos
+
+def decode_at(buf, pos: int):
+    code = buf[pos]
+    pos += 1
+
+    if code >= PREFIX_SMALL_BLOCK:
+        return decode_block(buf, pos, code & 0xF, (code >> 4) & 0x7)
+    if code >= PREFIX_SMALL_INT:
+        return code & 0x3F, pos
+    if code >= PREFIX_SMALL_STRING:
+        return decode_string(buf, pos, code & 0x1F)
+    if code == CODE_INT8:
+        return INT8.unpack_from(buf, pos)[0], pos + 1
+    if code == CODE_INT16:
+        return INT16.unpack_from(buf, pos)[0], pos + 2
+    if code == CODE_INT32:
+        return INT32.unpack_from(buf, pos)[0], pos + 4
+    if code == CODE_INT64:
+        if sys.maxsize <= 2**31:
+            raise ValueError("64-bit integers not supported on 32-bit systems")
+        return UINT64.unpack_from(buf, pos)[0], pos + 8
+    if code == CODE_BLOCK32:
+        header = UINT32.unpack_from(buf, pos)[0]
+        return decode_block(buf, pos + 4, header & 0xFF, header >> 10)
+    if code == CODE_BLOCK64:
+        if sys.maxsize <= 2**31:
+            raise ValueError("64-bit blocks not supported on 32-bit systems")
+        header = UINT64.unpack_from(buf, pos)[0]
+        return decode_block(buf, pos + 8, header & 0xFF, header >> 10)
+    if code == CODE_STRING8:
+        return decode_string(buf, pos + 1, buf[pos])
+    if code == CODE_STRING32:
+        return decode_string(buf, pos + 4, UINT32.unpack_from(buf, pos)[0])
+    raise ValueError(f"Invalid code: 0x{code:02x}")
+
+def input_value_from_buffer(buf, pos: int = 0):
+    try:
+        return decode_at(buf, pos)
+    except (IndexError, struct.error):
+        raise EOFError("Unexpected end of file")
+
 def input_value(ic: BinaryIO) -> Any:
+    if isinstance(ic, BufferReader):
+        value, ic.pos = input_value_from_buffer(ic.buf, ic.pos)
+        return value
+    if isinstance(ic, io.BytesIO):
+        buf = ic.getbuffer()
+        try:
+            value, end = input_value_from_buffer(buf, ic.tell())
+        finally:
+            buf.release()
+        ic.seek(end)
+        return value
     return input_loop(in_channel_funs, ic)
 
 def output_binary_int64(ofuns: OutFuns, oc: BinaryIO, x: int) -> None:
@@ -238,8 +347,131 @@ def output_loop(ofuns: OutFuns, oc: BinaryIO, x: Any) -> None:
     else:
         raise TypeError(f"Unsupported type for output: {type(x)}")
 
+FLUSH_SIZE = 1 << 20
+
+INT16_BYTES = struct.Struct('>h')
+INT32_BYTES = struct.Struct('>i')
+
+def encode_block_header(buf: bytearray, tag: int, size: int) -> None:
+    if tag < 16 and size < 8:
+        buf.append(PREFIX_SMALL_BLOCK + tag + (size << 4))
+        return
+    hd = (size << 10) + tag
+    if sys.maxsize > 2**31 and hd >= (1 << 32):
+        buf.append(CODE_BLOCK64)
+        buf += UINT64.pack(hd & 0xFFFFFFFFFFFFFFFF)
+    else:
+        buf.append(CODE_BLOCK32)
+        buf.append((size >> 14) & 0xFF)
+        buf.append((size >> 6) & 0xFF)
+        buf.append((size << 2) & 0xFF)
+        buf.append(((size << 10) + tag) & 0xFF)
+
+def encode_value(buf: bytearray, x: Any) -> None:
+    if isinstance(x, int):
+        if 0 <= x < 0x40:
+            buf.append(PREFIX_SMALL_INT + x)
+        elif -128 <= x < 128:
+            buf.append(CODE_INT8)
+            buf.append(x & 0xFF)
+        elif -32768 <= x <= 32767:
+            buf.append(CODE_INT16)
+            buf += INT16_BYTES.pack(x)
+        elif -1073741824 <= x <= 1073741823:
+            buf.append(CODE_INT32)
+            buf += INT32_BYTES.pack(x)
+        else:
+            buf.append(CODE_INT64)
+            buf += UINT64.pack(x & 0xFFFFFFFFFFFFFFFF)
+
+    elif isinstance(x, (bytes, bytearray)):
+        length = len(x)
+        if length < 0x20:
+            buf.append(PREFIX_SMALL_STRING + length)
+        elif length < 0x100:
+            buf.append(CODE_STRING8)
+            buf.append(length)
+        else:
+            buf.append(CODE_STRING32)
+            buf += UINT32.pack(length & 0xFFFFFFFF)
+        buf += x
+
+    elif isinstance(x, str):
+        encode_value(buf, x.encode('utf-8'))
+
+    elif isinstance(x, (list, tuple)):
+        encode_block_header(buf, 0, len(x))
+        for item in x:
+            encode_value(buf, item)
+
+    elif isinstance(x, dict) and 'tag' in x and 'fields' in x:
+        fields = x['fields']
+        encode_block_header(buf, x['tag'], len(fields))
+        for field in fields:
+            encode_value(buf, field)
+
+    elif x is None:
+        buf.append(PREFIX_SMALL_BLOCK)
+
+    else:
+        raise TypeError(f"Unsupported type for output: {type(x)}")
+
+class ValueWriter:
+    def __init__(self, oc: BinaryIO, pos: int = 0, flush_size: int = FLUSH_SIZE):
+        self.oc = oc
+        self.buf = bytearray()
+        self.flushed = pos
+        self.flush_size = flush_size
+
+    def tell(self) -> int:
+        return self.flushed + len(self.buf)
+
+    def flush(self) -> None:
+        if self.buf:
+            self.oc.write(self.buf)
+            self.flushed += len(self.buf)
+            self.buf = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.buf += data
+        if len(self.buf) >= self.flush_size:
+            self.flush()
+
+    def output(self, value: Any) -> None:
+        if isinstance(value, (list, tuple)):
+            self.output_array(value)
+        else:
+            encode_value(self.buf, value)
+            if len(self.buf) >= self.flush_size:
+                self.flush()
+
+    def output_array(self, items, count: int = None) -> List[int]:
+        offsets = []
+        buf = self.buf
+        encode_block_header(buf, 0, len(items) if count is None else count)
+        for item in items:
+            offsets.append(self.flushed + len(buf))
+            encode_value(buf, item)
+            if len(buf) >= self.flush_size:
+                self.flush()
+                buf = self.buf
+        return offsets
+
+    def output_encoded_array(self, count: int, chunks) -> List[int]:
+        offsets = []
+        encode_block_header(self.buf, 0, count)
+        for blob, sizes in chunks:
+            pos = self.tell()
+            for size in sizes:
+                offsets.append(pos)
+                pos += size
+            self.write(blob)
+        return offsets
+
 def output(oc: BinaryIO, value: Any) -> None:
-    output_loop(out_channel_funs, oc, value)
+    writer = ValueWriter(oc)
+    writer.output(value)
+    writer.flush()
 
 def calculate_size(ofuns: OutFuns, value: Any) -> int:
     size_counter = [0]
@@ -263,7 +495,9 @@ def calculate_size(ofuns: OutFuns, value: Any) -> int:
     return size_counter[0]
 
 def size(value: Any) -> int:
-    return calculate_size(out_channel_funs, value)
+    buf = bytearray()
+    encode_value(buf, value)
+    return len(buf)
 
 def array_header_size(arr_len: int) -> int:
     if arr_len < 8:
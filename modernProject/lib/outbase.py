@@ -1,13 +1,17 @@
 import os
+import struct
 import sys
 from typing import List, Tuple, Callable, Any, Set
 from lib.dbdisk import DskBase, DskPerson
 from lib import iovalue
+from lib import database
 from lib import dutil
 from lib import name
 from lib import mutil
 from lib import secure
 from lib import filesystem
+from lib import extsort
+from lib import title_index
 
 verbose = False
 
@@ -41,18 +45,13 @@ def input_binary_int(ic) -> int:
     return int.from_bytes(b, byteorder='big', signed=False)
 
 def output_index_aux(oc_inx, oc_inx_acc, ni):
-    bpos = oc_inx.tell()
-    dutil.output_value_no_sharing(oc_inx, ni)
-    output_array_access(oc_inx_acc, lambda i: ni[i], len(ni), bpos)
+    writer = iovalue.ValueWriter(oc_inx, oc_inx.tell())
+    offsets = writer.output_array(ni)
+    writer.flush()
+    for pos in offsets:
+        output_binary_int(oc_inx_acc, pos)
 
-def output_array_access(oc, get_fn, length, shift):
-    for i in range(length):
-        pos = oc.tell()
-        output_binary_int(oc, pos + shift)
-
-def make_name_index(base: DskBase):
-    from lib.database import TABLE_SIZE
-    t = [[] for _ in range(TABLE_SIZE)]
+def sort_name_index(base: DskBase, sorter: extsort.ExternalSorter) -> None:
     for i in range(base.data.persons.len):
         p = base.data.persons.get(i)
         first_name = get_person_field(p, 'first_name', 0)
@@ -61,17 +60,66 @@ def make_name_index(base: DskBase):
             key_index = get_person_field(p, 'key_index', 34)
             if key_index is None or key_index < 0:
                 key_index = i
-            misc_names = dsk_person_misc_names(base, p)
-            indices = []
-            for n in misc_names:
-                idx = dutil.name_index(n)
-                if idx not in indices:
-                    indices.append(idx)
-            indices.sort()
-            for idx in indices:
-                if key_index not in t[idx]:
-                    t[idx].append(key_index)
-    return [list(x) for x in t]
+            for n in dsk_person_misc_names(base, p):
+                sorter.add((dutil.name_index(n), key_index))
+
+def buckets_of_pairs(pairs) -> List[List[int]]:
+    from lib.database import TABLE_SIZE
+    t = [[] for _ in range(TABLE_SIZE)]
+    for idx, value in pairs:
+        t[idx].append(value)
+    return t
+
+class BaseWriter:
+    def __init__(self, oc, oc_acc):
+        self.oc = oc
+        self.oc_acc = oc_acc
+        self.writer = None
+        self.strings_len_pos = 0
+        self.positions = []
+
+    def output_header(self, persons_len: int, families_len: int, strings_len: int,
+                      origin_file: Any) -> None:
+        self.oc.write(database.MAGIC_GNWB0024)
+        output_binary_int(self.oc, persons_len)
+        output_binary_int(self.oc, families_len)
+        self.strings_len_pos = self.oc.tell()
+        output_binary_int(self.oc, strings_len)
+        for _ in range(7):
+            output_binary_int(self.oc, 0)
+        self.writer = iovalue.ValueWriter(self.oc, self.oc.tell())
+        self.writer.output(origin_file)
+
+    def output_offsets(self, offsets: List[int]) -> None:
+        self.oc_acc.write(b''.join(database.ACC_OFFSET.pack(offset) for offset in offsets))
+
+    def output_array(self, items, count: int = None) -> None:
+        self.positions.append(self.writer.tell())
+        self.output_offsets(self.writer.output_array(items, count))
+
+    def output_encoded_array(self, count: int, chunks) -> None:
+        self.positions.append(self.writer.tell())
+        self.output_offsets(self.writer.output_encoded_array(count, chunks))
+
+    def output_record_access(self, arr) -> None:
+        self.positions.append(self.writer.tell())
+        self.output_offsets(arr.output_array(self.writer))
+
+    def finish(self, strings_len: int = None) -> None:
+        self.writer.flush()
+        end = self.oc.tell()
+        if strings_len is not None:
+            self.oc.seek(self.strings_len_pos)
+            output_binary_int(self.oc, strings_len)
+        self.oc.seek(self.strings_len_pos + 4)
+        for pos in self.positions:
+            output_binary_int(self.oc, pos)
+        self.oc.seek(end)
+
+def make_name_index(base: DskBase):
+    with extsort.ExternalSorter() as sorter:
+        sort_name_index(base, sorter)
+        return buckets_of_pairs(sorter.unique())
 
 def dsk_person_misc_names(base: DskBase, p: DskPerson) -> List[str]:
     result = []
@@ -86,16 +134,23 @@ def dsk_person_misc_names(base: DskBase, p: DskPerson) -> List[str]:
     result.append(f"{fn} {sn}")
     return result
 
-def create_name_index(oc_inx, oc_inx_acc, base: DskBase) -> None:
-    output_index_aux(oc_inx, oc_inx_acc, make_name_index(base))
-
-def make_strings_of_fsname_aux(split_fn: Callable, get_fn: Callable, base: DskBase):
+def output_sorted_index(oc_inx, oc_inx_acc, sort_fn: Callable, base: DskBase) -> None:
     from lib.database import TABLE_SIZE
-    t = [set() for _ in range(TABLE_SIZE)]
+    with extsort.ExternalSorter() as sorter:
+        sort_fn(base, sorter)
+        writer = iovalue.ValueWriter(oc_inx, oc_inx.tell())
+        offsets = extsort.output_buckets(writer, TABLE_SIZE, sorter.unique())
+        writer.flush()
+    for pos in offsets:
+        output_binary_int(oc_inx_acc, pos)
+
+def create_name_index(oc_inx, oc_inx_acc, base: DskBase) -> None:
+    output_sorted_index(oc_inx, oc_inx_acc, sort_name_index, base)
 
+def sort_strings_of_fsname(split_fn: Callable, get_fn: Callable, base: DskBase,
+                           sorter: extsort.ExternalSorter) -> None:
     def add_name(key: str, value: int):
-        idx = dutil.name_index(key)
-        t[idx].add(value)
+        sorter.add((dutil.name_index(key), value))
 
     for i in range(base.data.persons.len):
         p = base.data.persons.get(i)
@@ -107,47 +162,44 @@ def make_strings_of_fsname_aux(split_fn: Callable, get_fn: Callable, base: DskBa
             add_name(s, istr)
             split_fn(lambda start, length: add_name(s[start:start+length], istr), s)
 
-    result = []
-    for s in t:
-        arr = sorted(list(s))
-        result.append(arr)
-    return result
+def make_strings_of_fsname_aux(split_fn: Callable, get_fn: Callable, base: DskBase):
+    with extsort.ExternalSorter() as sorter:
+        sort_strings_of_fsname(split_fn, get_fn, base, sorter)
+        return buckets_of_pairs(sorter.unique())
+
+def get_first_name(p):
+    if hasattr(p, 'first_name'):
+        return p.first_name
+    elif isinstance(p, dict):
+        return p['first_name']
+    else:
+        return p[0]
+
+def get_surname(p):
+    if hasattr(p, 'surname'):
+        return p.surname
+    elif isinstance(p, dict):
+        return p['surname']
+    else:
+        return p[1]
+
+def sort_strings_of_fname(base: DskBase, sorter: extsort.ExternalSorter) -> None:
+    sort_strings_of_fsname(name.split_fname_callback, get_first_name, base, sorter)
+
+def sort_strings_of_sname(base: DskBase, sorter: extsort.ExternalSorter) -> None:
+    sort_strings_of_fsname(name.split_sname_callback, get_surname, base, sorter)
 
 def make_strings_of_fname(base: DskBase):
-    def get_first_name(p):
-        if hasattr(p, 'first_name'):
-            return p.first_name
-        elif isinstance(p, dict):
-            return p['first_name']
-        else:
-            return p[0]
-
-    return make_strings_of_fsname_aux(
-        name.split_fname_callback,
-        get_first_name,
-        base
-    )
+    return make_strings_of_fsname_aux(name.split_fname_callback, get_first_name, base)
 
 def make_strings_of_sname(base: DskBase):
-    def get_surname(p):
-        if hasattr(p, 'surname'):
-            return p.surname
-        elif isinstance(p, dict):
-            return p['surname']
-        else:
-            return p[1]
-
-    return make_strings_of_fsname_aux(
-        name.split_sname_callback,
-        get_surname,
-        base
-    )
+    return make_strings_of_fsname_aux(name.split_sname_callback, get_surname, base)
 
 def create_strings_of_sname(oc_inx, oc_inx_acc, base: DskBase) -> None:
-    output_index_aux(oc_inx, oc_inx_acc, make_strings_of_sname(base))
+    output_sorted_index(oc_inx, oc_inx_acc, sort_strings_of_sname, base)
 
 def create_strings_of_fname(oc_inx, oc_inx_acc, base: DskBase) -> None:
-    output_index_aux(oc_inx, oc_inx_acc, make_strings_of_fname(base))
+    output_sorted_index(oc_inx, oc_inx_acc, sort_strings_of_fname, base)
 
 def is_prime(a: int) -> bool:
     if a < 2:
@@ -165,81 +217,47 @@ def prime_after(n: int) -> int:
         n += 1
     return n
 
+def write_strings_hash(oc, get: Callable[[int], Any], length: int) -> None:
+    taba_size = min(sys.maxsize, prime_after(max(2, 10 * length)))
+    taba = [-1] * taba_size
+    tabl = [-1] * length
+    for i in range(length):
+        ia = dutil.stable_hash(get(i)) % taba_size
+        tabl[i] = taba[ia]
+        taba[ia] = i
+    oc.write(database.MAGIC_STRINGS_INX)
+    output_binary_int(oc, taba_size)
+    oc.write(struct.pack(f'>{taba_size}i', *taba))
+    oc.write(struct.pack(f'>{length}i', *tabl))
+
 def output_strings_hash(tmp_strings_inx: str, base: DskBase) -> None:
     with secure.open_out_bin(tmp_strings_inx) as oc:
         base.data.strings.load_array()
-        strings_array = base.data.strings
-        taba_size = min(sys.maxsize, prime_after(max(2, 10 * strings_array.len)))
-        taba = [-1] * taba_size
-        tabl = [-1] * strings_array.len
-        for i in range(strings_array.len):
-            ia = hash(base.data.strings.get(i)) % len(taba)
-            tabl[i] = taba[ia]
-            taba[ia] = i
-        output_binary_int(oc, len(taba))
-        for i in range(len(taba)):
-            output_binary_int(oc, taba[i])
-        for i in range(len(tabl)):
-            output_binary_int(oc, tabl[i])
-
-def output_name_index_aux(cmp_fn: Callable, get_fn: Callable, base: DskBase,
+        write_strings_hash(oc, base.data.strings.get, base.data.strings.len)
+
+def output_name_index_aux(get_fn: Callable, base: DskBase,
                           names_inx: str, names_dat: str) -> None:
-    ht = {}
-    for i in range(base.data.persons.len):
-        p = base.data.persons.get(i)
-        k = get_fn(p)
-        key_index = get_person_field(p, 'key_index', 34)
-        if key_index is None or key_index < 0:
-            key_index = i
-        if k in ht:
-            ht[k].append(key_index)
-        else:
-            ht[k] = [key_index]
-
-    a = [(k, v) for k, v in ht.items()]
-    a.sort(key=lambda x: (cmp_fn(x[0], x[0]), x[0]))
-
-    with secure.open_out_bin(names_dat) as oc_n_dat:
-        bt2 = []
-        for k, ipl in a:
-            off = oc_n_dat.tell()
-            output_binary_int(oc_n_dat, len(ipl))
-            for ip in ipl:
-                output_binary_int(oc_n_dat, ip)
-            bt2.append((k, off))
-
-    with secure.open_out_bin(names_inx) as oc_n_inx:
-        dutil.output_value_no_sharing(oc_n_inx, bt2)
+    with extsort.ExternalSorter() as sorter:
+        for i in range(base.data.persons.len):
+            p = base.data.persons.get(i)
+            key_index = get_person_field(p, 'key_index', 34)
+            if key_index is None or key_index < 0:
+                key_index = i
+            sorter.add((get_fn(p), i, key_index))
+
+        with secure.open_out_bin(names_dat) as oc_n_dat, secure.open_out_bin(names_inx) as oc_n_inx:
+            extsort.output_name_lists(oc_n_dat, oc_n_inx, sorter,
+                                      lambda entry: entry[0], lambda entry: entry[2])
 
 def output_surname_index(base: DskBase, tmp_snames_inx: str, tmp_snames_dat: str) -> None:
-    def get_surname(p):
-        if hasattr(p, 'surname'):
-            return p.surname
-        elif isinstance(p, dict):
-            return p['surname']
-        else:
-            return p[1]
-
-    output_name_index_aux(
-        lambda k1, k2: dutil.compare_snames_i(base.data, k1, k2),
-        get_surname,
-        base, tmp_snames_inx, tmp_snames_dat
-    )
+    output_name_index_aux(get_surname, base, tmp_snames_inx, tmp_snames_dat)
 
 def output_first_name_index(base: DskBase, tmp_fnames_inx: str, tmp_fnames_dat: str) -> None:
-    def get_first_name(p):
-        if hasattr(p, 'first_name'):
-            return p.first_name
-        elif isinstance(p, dict):
-            return p['first_name']
-        else:
-            return p[0]
-
-    output_name_index_aux(
-        lambda k1, k2: dutil.compare_fnames_i(base.data, k1, k2),
-        get_first_name,
-        base, tmp_fnames_inx, tmp_fnames_dat
-    )
+    output_name_index_aux(get_first_name, base, tmp_fnames_inx, tmp_fnames_dat)
+
+def output_title_index(base: DskBase, tmp_titles_inx: str) -> None:
+    persons = base.data.persons
+    title_index.write(tmp_titles_inx, title_index.build(persons.get(i) for i in range(persons.len)))
 
 def output_particles_file(particles: List[str], fname: str) -> None:
     with open(fname, 'w') as oc:
@@ -284,6 +302,7 @@ def output(base: DskBase) -> None:
     tmp_fnames_inx = os.path.join(bname, "1fnames.inx")
     tmp_fnames_dat = os.path.join(bname, "1fnames.dat")
     tmp_strings_inx = os.path.join(bname, "1strings.inx")
+    tmp_titles_inx = os.path.join(bname, "1" + title_index.TITLES_INX)
     tmp_notes = os.path.join(bname, "1notes")
     tmp_notes_d = os.path.join(bname, "1notes_d")
 
@@ -299,46 +318,18 @@ def output(base: DskBase) -> None:
         oc = secure.open_out_bin(tmp_base)
         oc_acc = secure.open_out_bin(tmp_base_acc)
 
-        def output_array(arrname: str, arr):
-            bpos = oc.tell()
+        base_writer = BaseWriter(oc, oc_acc)
+        base_writer.output_header(base.data.persons.len, base.data.families.len,
+                                  base.data.strings.len, base.data.bnotes.norigin_file)
+        for arrname, arr in (("persons", base.data.persons), ("ascends", base.data.ascends),
+                             ("unions", base.data.unions), ("families", base.data.families),
+                             ("couples", base.data.couples), ("descends", base.data.descends),
+                             ("strings", base.data.strings)):
             if verbose:
                 print(f"*** saving {arrname} array", file=sys.stderr)
                 sys.stderr.flush()
-            arr.output_array(oc)
-            output_array_access(oc_acc, arr.get, arr.len, bpos)
-
-        oc.write(b"GnWb0024")
-        output_binary_int(oc, base.data.persons.len)
-        output_binary_int(oc, base.data.families.len)
-        output_binary_int(oc, base.data.strings.len)
-        array_start_indexes = oc.tell()
-        for _ in range(7):
-            output_binary_int(oc, 0)
-        dutil.output_value_no_sharing(oc, base.data.bnotes.norigin_file)
-
-        persons_array_pos = oc.tell()
-        output_array("persons", base.data.persons)
-        ascends_array_pos = oc.tell()
-        output_array("ascends", base.data.ascends)
-        unions_array_pos = oc.tell()
-        output_array("unions", base.data.unions)
-        families_array_pos = oc.tell()
-        output_array("families", base.data.families)
-        couples_array_pos = oc.tell()
-        output_array("couples", base.data.couples)
-        descends_array_pos = oc.tell()
-        output_array("descends", base.data.descends)
-        strings_array_pos = oc.tell()
-        output_array("strings", base.data.strings)
-
-        oc.seek(array_start_indexes)
-        output_binary_int(oc, persons_array_pos)
-        output_binary_int(oc, ascends_array_pos)
-        output_binary_int(oc, unions_array_pos)
-        output_binary_int(oc, families_array_pos)
-        output_binary_int(oc, couples_array_pos)
-        output_binary_int(oc, descends_array_pos)
-        output_binary_int(oc, strings_array_pos)
+            base_writer.output_record_access(arr)
+        base_writer.finish()
 
         base.data.families.clear_array()
         base.data.descends.clear_array()
@@ -348,6 +339,7 @@ def output(base: DskBase) -> None:
         with secure.open_out_bin(tmp_names_inx) as oc_inx:
             with secure.open_out_bin(tmp_names_acc) as oc_inx_acc:
                 trace("create name index")
+                oc_inx.write(database.MAGIC_NAMES_INX)
                 output_binary_int(oc_inx, 0)
                 output_binary_int(oc_inx, 0)
                 create_name_index(oc_inx, oc_inx_acc, base)
@@ -361,9 +353,8 @@ def output(base: DskBase) -> None:
                 first_name_pos = oc_inx.tell()
                 trace("create strings of fname")
                 create_strings_of_fname(oc_inx, oc_inx_acc, base)
-                oc_inx.seek(0)
+                oc_inx.seek(len(database.MAGIC_NAMES_INX))
                 output_binary_int(oc_inx, surname_pos)
-                oc_inx.seek(4)
                 output_binary_int(oc_inx, first_name_pos)
 
         trace("create string index")
@@ -372,6 +363,8 @@ def output(base: DskBase) -> None:
         output_surname_index(base, tmp_snames_inx, tmp_snames_dat)
         trace("create first name index")
         output_first_name_index(base, tmp_fnames_inx, tmp_fnames_dat)
+        trace("create title index")
+        output_title_index(base, tmp_titles_inx)
         output_notes(base, tmp_notes)
         output_notes_d(base, tmp_notes_d)
         output_particles_file(base.data.particles_txt, tmp_particles)
@@ -407,7 +400,7 @@ def output(base: DskBase) -> None:
                 oc_acc.close()
             except:
                 pass
-        for f in [tmp_base, tmp_base_acc, tmp_names_inx, tmp_names_acc, tmp_strings_inx]:
+        for f in [tmp_base, tmp_base_acc, tmp_names_inx, tmp_names_acc, tmp_strings_inx, tmp_titles_inx]:
             if os.path.exists(f):
                 os.remove(f)
         if os.path.exists(tmp_notes_d):
@@ -423,6 +416,7 @@ def output(base: DskBase) -> None:
     safe_rename(tmp_fnames_dat, os.path.join(bname, "fnames.dat"))
     safe_rename(tmp_fnames_inx, os.path.join(bname, "fnames.inx"))
     safe_rename(tmp_strings_inx, os.path.join(bname, "strings.inx"))
+    safe_rename(tmp_titles_inx, os.path.join(bname, title_index.TITLES_INX))
     safe_rename(tmp_particles, os.path.join(bname, "particles.txt"))
 
     notes_file = os.path.join(bname, "notes")
@@ -0,0 +1,203 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+KEY_PARAMS = ('m', 'i', 'p', 'n', 'oc', 'lang', 'v')
+PERSON_MODES = ('', 'P', 'A', 'D', 'F')
+CREDENTIAL_HEADERS = ('authorization', 'cookie')
+
+
+def base_dir_of(bname: str) -> str:
+    if not bname.endswith(".gwb"):
+        bname = bname + ".gwb"
+    return os.path.abspath(bname)
+
+
+def access_level(conf) -> str:
+    if getattr(conf, 'wizard', False):
+        return 'wizard'
+    if getattr(conf, 'friend', False):
+        return 'friend'
+    return 'visitor'
+
+
+def credentials(conf) -> str:
+    headers = getattr(conf, 'headers', None) or {}
+    return '\0'.join(headers.get(h, '') for h in CREDENTIAL_HEADERS)
+
+
+def cacheable(conf) -> bool:
+    if conf.method not in ('GET', 'HEAD') or not conf.bname:
+        return False
+    if access_level(conf) != 'visitor' or credentials(conf).strip('\0'):
+        return False
+    env = conf.env if isinstance(conf.env, dict) else dict(conf.env)
+    if any(k not in KEY_PARAMS and k != 'b' for k in env):
+        return False
+    m = env.get('m', '')
+    return m in PERSON_MODES and bool(m or any(env.get(k) for k in ('i', 'p', 'n')))
+
+
+def page_size(page: str) -> int:
+    return len(page.encode('utf-8'))
+
+
+class PageCache:
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, disk_max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = max_bytes if disk_max_bytes is None else disk_max_bytes
+        self.lock = threading.Lock()
+        self.disk_lock = threading.Lock()
+        self.pages: "OrderedDict[Tuple[Any, ...], Tuple[str, int]]" = OrderedDict()
+        self.size = 0
+        self.disk_size = sum(size for _, size, _ in self._disk_files()) if disk_dir else 0
+        self.generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, bdir: str) -> int:
+        with self.lock:
+            return self.generations.get(bdir, 0)
+
+    def key(self, conf, full_path: str) -> Optional[Tuple[Any, ...]]:
+        from lib import database
+        if not cacheable(conf):
+            return None
+        access = access_level(conf)
+        env = conf.env if isinstance(conf.env, dict) else dict(conf.env)
+        bdir = base_dir_of(full_path)
+        name = os.path.basename(bdir)[:-len(".gwb")]
+        return ((name, self.generation(bdir), database.base_stamp(bdir))
+                + tuple(env.get(k, '') for k in KEY_PARAMS) + (access,))
+
+    def _disk_path(self, key: Tuple[Any, ...]) -> str:
+        base = hashlib.sha1(key[0].encode('utf-8')).hexdigest()[:16]
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, base, name)
+
+    def _disk_files(self, subdir: str = '') -> List[Tuple[float, int, str]]:
+        files = []
+        for root, _, names in os.walk(os.path.join(self.disk_dir, subdir)):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _evict_disk(self) -> None:
+        files = sorted(self._disk_files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self.disk_size = total
+
+    def _remember(self, key: Tuple[Any, ...], page: str, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        old = self.pages.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        self.pages[key] = (page, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self.pages.popitem(last=False)
+            self.size -= evicted
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[str]:
+        with self.lock:
+            entry = self.pages.get(key)
+            if entry is not None:
+                self.pages.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                data = None
+            if data is not None:
+                page = data.decode('utf-8')
+                with self.lock:
+                    self._remember(key, page, len(data))
+                    self.hits += 1
+                return page
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: Tuple[Any, ...], page: str) -> None:
+        data = page.encode('utf-8')
+        with self.lock:
+            self._remember(key, page, len(data))
+        if self.disk_dir and len(data) <= self.disk_max_bytes:
+            path = self._disk_path(key)
+            with self.disk_lock:
+                try:
+                    old = os.path.getsize(path)
+                except OSError:
+                    old = 0
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(data)
+                    os.replace(tmp, path)
+                except OSError:
+                    return
+                self.disk_size += len(data) - old
+                if self.disk_size > self.disk_max_bytes:
+                    self._evict_disk()
+
+    def invalidate(self, bdir: str) -> None:
+        bdir = base_dir_of(bdir)
+        bname = os.path.basename(bdir)[:-len(".gwb")]
+        with self.lock:
+            self.generations[bdir] = self.generations.get(bdir, 0) + 1
+            for key in [k for k in self.pages if k[0] == bname]:
+                self.size -= self.pages.pop(key)[1]
+        if self.disk_dir:
+            base = hashlib.sha1(bname.encode('utf-8')).hexdigest()[:16]
+            with self.disk_lock:
+                self.disk_size -= sum(size for _, size, _ in self._disk_files(base))
+                shutil.rmtree(os.path.join(self.disk_dir, base), ignore_errors=True)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.pages.clear()
+            self.size = 0
+
+
+_cache: Optional[PageCache] = None
+
+
+def configure(max_bytes: int, disk_dir: Optional[str] = None,
+              disk_max_bytes: Optional[int] = None) -> Optional[PageCache]:
+    global _cache
+    _cache = PageCache(max_bytes, disk_dir, disk_max_bytes) if max_bytes > 0 else None
+    return _cache
+
+
+def cache() -> Optional[PageCache]:
+    return _cache
+
+
+def invalidate(bdir: str) -> None:
+    if _cache is not None:
+        _cache.invalidate(bdir)
@@ -555,8 +555,7 @@ def gen_interp_templ(menu, title: str, templ_fname: str, conf: config.Config, ba
             conf.output_conf.body("<h2>Siblings</h2>")
             conf.output_conf.body("<div class='info-section'>")
             conf.output_conf.body("<ul>")
-            for sib_ip in siblings:
-                sibling = driver.poi(base, sib_ip)
+            for sib_ip, sibling in zip(siblings, driver.poi_many(base, siblings, ('person',))):
                 sib_first = driver.sou(base, driver.get_first_name(sibling)).decode('utf-8')
                 sib_last = driver.sou(base, driver.get_surname(sibling)).decode('utf-8')
                 sib_ip_int = int(sib_ip)
@@ -592,11 +591,8 @@ def gen_interp_templ(menu, title: str, templ_fname: str, conf: config.Config, ba
                 conf.output_conf.body("<h2>Children</h2>")
                 conf.output_conf.body("<div class='info-section'>")
                 conf.output_conf.body("<ul>")
-                for child_ip in children:
-                    child_ip_decoded = decode_variant_iper(child_ip)
-                    if child_ip_decoded is None:
-                        continue
-                    child = driver.poi(base, child_ip_decoded)
+                child_ips = [c for c in map(decode_variant_iper, children) if c is not None]
+                for child_ip_decoded, child in zip(child_ips, driver.poi_many(base, child_ips, ('person',))):
                     child_first = driver.sou(base, driver.get_first_name(child)).decode('utf-8')
                     child_last = driver.sou(base, driver.get_surname(child)).decode('utf-8')
                     child_ip_int = int(child_ip_decoded)
@@ -1,16 +1,21 @@
 import sys
 import time
+from typing import Callable, Optional
 
 
 class ProgressBar:
-    def __init__(self, width: int = 60, empty: str = '.', full: str = '#', disabled: bool = False):
+    def __init__(self, width: int = 60, empty: str = '.', full: str = '#', disabled: bool = False,
+                 report: Optional[Callable[[int, int], None]] = None):
         self.width = width
         self.empty = empty
         self.full = full
         self.disabled = disabled
+        self.report = report
         self.last_output = 0.0
 
     def progress(self, current: int, total: int) -> None:
+        if self.report is not None:
+            self.report(current, total)
         if self.disabled:
             return
         now = time.time()
@@ -25,34 +25,6 @@ def get_date(conf: config.Config) -> str:
     return f"{now.day:02d}/{now.month:02d}/{now.year}"
 
 
-def convert_ged_if_needed(base_dir: str, db_name: str) -> bool:
-    base_path = Path(base_dir)
-    ged_file = base_path / f"{db_name}.ged"
-    gwb_dir = base_path / f"{db_name}.gwb"
-
-    if ged_file.exists() and not gwb_dir.exists():
-        try:
-            import subprocess
-            logs.info(f"Auto-converting {db_name}.ged to {db_name}.gwb")
-            result = subprocess.run(
-                ['python', '-m', 'bin.ged2gwb', str(ged_file), '-o', str(gwb_dir)],
-                cwd=str(Path(__file__).parent.parent),
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
-            if result.returncode == 0:
-                logs.info(f"Successfully converted {db_name}.ged")
-                return True
-            else:
-                logs.err(f"Failed to convert {db_name}.ged: {result.stderr}")
-                return False
-        except Exception as e:
-            logs.err(f"Error converting {db_name}.ged: {e}")
-            return False
-    return gwb_dir.exists()
-
-
 def list_databases(base_dir: str = ".") -> List[str]:
     try:
         base_path = Path(base_dir)
@@ -19,6 +19,44 @@ def _pget(conf, base, ip):
     return driver.poi(base, ip)
 
 
+def _persons(base, ipers=None, batch_size=1024):
+    batch = []
+    for i in (range(driver.nb_of_persons(base)) if ipers is None else ipers):
+        batch.append(i)
+        if len(batch) >= batch_size:
+            yield from driver.poi_many(base, batch, ('person',))
+            batch = []
+    if batch:
+        yield from driver.poi_many(base, batch, ('person',))
+
+
+def _matching(base, istrs, absolute: bool, s: str) -> List[Any]:
+    if absolute:
+        return [i for i in istrs if driver.sou(base, i) == s]
+    sl = name.lower(s)
+    return [i for i in istrs if name.lower(driver.sou(base, i)) == sl]
+
+
+def _ipers_of_title(base, absolute: bool, title: str):
+    index = driver.title_index(base)
+    if index is None:
+        return None
+    return index.ipers_of_idents(_matching(base, index.idents(), absolute, title))
+
+
+def _ipers_of_place(base, place: str):
+    index = driver.title_index(base)
+    if index is None:
+        return None
+    return index.ipers_of_places(_matching(base, index.places(), False, place))
+
+
+def _unfiltered_index(conf, base):
+    if getattr(conf, 'allowed_titles', None) or getattr(conf, 'denied_titles', None):
+        return None
+    return driver.title_index(base)
+
+
 def date_interval(conf, base, t: DateSearch, x) -> Optional[Tuple[Any, Any]]:
     d1 = SimpleNamespace(day=0, month=0, year=2147483647, prec=Precision.SURE, delta=0)
     d2 = SimpleNamespace(day=0, month=0, year=0, prec=Precision.SURE, delta=0)
@@ -207,8 +245,7 @@ def select_title_place(conf, base, absolute: bool, title: str, place: str) -> Tu
     tl1 = name.lower(title)
     pl1 = name.lower(place)
 
-    for i in driver.ipers(base):
-        x = _pget(conf, base, i)
+    for x in _persons(base, _ipers_of_title(base, absolute, title)):
         titles = _nobtit(conf, base, x)
 
         for t in titles:
@@ -235,8 +272,7 @@ def select_all_with_place(conf, base, place: str) -> List[Tuple[Any, Any]]:
     p = name.lower(place)
     result = []
 
-    for i in driver.ipers(base):
-        x = _pget(conf, base, i)
+    for x in _persons(base, _ipers_of_place(base, place)):
         titles = _nobtit(conf, base, x)
 
         for t in titles:
@@ -253,8 +289,7 @@ def select_title(conf, base, absolute: bool, title: str) -> Tuple[List[str], Lis
 
     tl = name.lower(title)
 
-    for i in driver.ipers(base):
-        x = _pget(conf, base, i)
+    for x in _persons(base, _ipers_of_title(base, absolute, title)):
         titles = _nobtit(conf, base, x)
 
         for t in titles:
@@ -281,8 +316,7 @@ def select_place(conf, base, place: str) -> List[str]:
     names = {}
     p = name.lower(place)
 
-    for i in driver.ipers(base):
-        x = _pget(conf, base, i)
+    for x in _persons(base, _ipers_of_place(base, place)):
         titles = _nobtit(conf, base, x)
 
         for t in titles:
@@ -296,8 +330,7 @@ def select_place(conf, base, place: str) -> List[str]:
 def select_all(proj: Callable, conf, base) -> List[str]:
     ht = {}
 
-    for i in driver.ipers(base):
-        x = _pget(conf, base, i)
+    for x in _persons(base):
         titles = _nobtit(conf, base, x)
 
         for t in titles:
@@ -310,8 +343,7 @@ def select_all(proj: Callable, conf, base) -> List[str]:
 def select_all_with_counter(proj: Callable, conf, base) -> List[Tuple[str, int]]:
     ht = {}
 
-    for i in driver.ipers(base):
-        x = _pget(conf, base, i)
+    for x in _persons(base):
         titles = _nobtit(conf, base, x)
 
         for t in titles:
@@ -325,8 +357,14 @@ def select_all_with_counter(proj: Callable, conf, base) -> List[Tuple[str, int]]
 
 
 def select_all_titles(conf, base) -> List[Tuple[str, int]]:
+    index = _unfiltered_index(conf, base)
+    if index is not None:
+        return [(driver.sou(base, istr), count) for istr, count in index.ident_counts()]
     return select_all_with_counter(lambda t: t.t_ident, conf, base)
 
 
 def select_all_places(conf, base) -> List[str]:
+    index = _unfiltered_index(conf, base)
+    if index is not None:
+        return [driver.sou(base, istr) for istr in index.places()]
     return select_all(lambda t: t.t_place, conf, base)
@@ -0,0 +1,159 @@
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from lib import database
+from lib import iovalue
+
+TITLES_INX = "titles.inx"
+MAGIC_TITLES_INX = b"GnTi0001"
+
+
+def _fields(v) -> List[Any]:
+    if isinstance(v, dict) and 'fields' in v:
+        return v['fields']
+    return v if isinstance(v, (list, tuple)) else []
+
+
+def person_titles(p) -> List[Any]:
+    if hasattr(p, 'titles'):
+        return p.titles or []
+    if isinstance(p, dict) and 'titles' in p:
+        return p['titles'] or []
+    fields = _fields(p)
+    return fields[9] if len(fields) > 9 and isinstance(fields[9], list) else []
+
+
+def title_keys(t) -> Tuple[int, int]:
+    if hasattr(t, 't_ident'):
+        return (t.t_ident, t.t_place)
+    fields = _fields(t)
+    return (fields[1], fields[2])
+
+
+def person_keys(p) -> List[Tuple[int, int]]:
+    return [title_keys(t) for t in person_titles(p)]
+
+
+class TitleIndex:
+    def __init__(self):
+        self.by_ident: Dict[int, Dict[int, int]] = {}
+        self.by_place: Dict[int, Dict[int, int]] = {}
+        self.keys_of: Dict[int, List[Tuple[int, int]]] = {}
+        self.records: Dict[int, Any] = {}
+
+    def _count(self, table: Dict[int, Dict[int, int]], key: int, iper: int, delta: int) -> None:
+        counts = table.setdefault(key, {})
+        n = counts.get(iper, 0) + delta
+        if n > 0:
+            counts[iper] = n
+        else:
+            counts.pop(iper, None)
+            if not counts:
+                del table[key]
+
+    def add_person(self, iper: int, keys: List[Tuple[int, int]]) -> None:
+        for ident, place in self.keys_of.pop(iper, []):
+            self._count(self.by_ident, ident, iper, -1)
+            self._count(self.by_place, place, iper, -1)
+        if keys:
+            self.keys_of[iper] = keys
+            for ident, place in keys:
+                self._count(self.by_ident, ident, iper, 1)
+                self._count(self.by_place, place, iper, 1)
+
+    def idents(self) -> List[int]:
+        return list(self.by_ident)
+
+    def places(self) -> List[int]:
+        return list(self.by_place)
+
+    def ident_counts(self) -> List[Tuple[int, int]]:
+        return [(ident, sum(counts.values())) for ident, counts in self.by_ident.items()]
+
+    def place_counts(self) -> List[Tuple[int, int]]:
+        return [(place, sum(counts.values())) for place, counts in self.by_place.items()]
+
+    def ipers_of_idents(self, idents: Iterable[int]) -> List[int]:
+        return sorted({ip for ident in idents for ip in self.by_ident.get(ident, ())})
+
+    def ipers_of_places(self, places: Iterable[int]) -> List[int]:
+        return sorted({ip for place in places for ip in self.by_place.get(place, ())})
+
+    def update(self, persons, ipers: Iterable[int]) -> None:
+        ipers = {ip for ip in ipers if ip >= 0}
+        for ip in [ip for ip in self.records if ip not in ipers]:
+            del self.records[ip]
+            self.add_person(ip, person_keys(persons.get(ip)) if ip < persons.len else [])
+        for ip in ipers:
+            p = persons.get(ip)
+            if self.records.get(ip) is not p:
+                self.records[ip] = p
+                self.add_person(ip, person_keys(p))
+
+
+def _table_value(table: Dict[int, Dict[int, int]]) -> List[Any]:
+    return [[key, list(counts.keys()), list(counts.values())] for key, counts in table.items()]
+
+
+def build(persons: Iterable[Any]) -> TitleIndex:
+    index = TitleIndex()
+    for ip, p in enumerate(persons):
+        index.add_person(ip, person_keys(p))
+    return index
+
+
+def write(path: str, index: TitleIndex) -> None:
+    with open(path, 'wb') as oc:
+        oc.write(MAGIC_TITLES_INX)
+        iovalue.output(oc, [_table_value(index.by_ident), _table_value(index.by_place)])
+
+
+def read(path: str) -> Optional[TitleIndex]:
+    try:
+        with open(path, 'rb') as ic:
+            if ic.read(len(MAGIC_TITLES_INX)) != MAGIC_TITLES_INX:
+                return None
+            by_ident, by_place = iovalue.input_value(ic)
+    except (OSError, EOFError, ValueError):
+        return None
+
+    index = TitleIndex()
+    pairs: Dict[int, List[Tuple[int, int]]] = {}
+    for key, ipers, counts in by_ident:
+        index.by_ident[key] = dict(zip(ipers, counts))
+        for ip, n in zip(ipers, counts):
+            pairs.setdefault(ip, []).extend([key] * n)
+    places: Dict[int, List[int]] = {}
+    for key, ipers, counts in by_place:
+        index.by_place[key] = dict(zip(ipers, counts))
+        for ip, n in zip(ipers, counts):
+            places.setdefault(ip, []).extend([key] * n)
+    for ip, idents in pairs.items():
+        index.keys_of[ip] = list(zip(idents, places.get(ip, [])))
+    return index
+
+
+_indexes: Dict[str, Tuple[Tuple[Any, ...], TitleIndex]] = {}
+_indexes_lock = threading.Lock()
+
+
+def for_base(base) -> Optional[TitleIndex]:
+    data = getattr(base, 'data', None)
+    bdir = getattr(data, 'bdir', None)
+    if not isinstance(bdir, str):
+        return None
+    patched = getattr(getattr(base, 'func', None), 'patched_persons', None)
+    stamp = database.base_stamp(bdir)
+    with _indexes_lock:
+        cached = _indexes.get(bdir)
+        if cached is None or cached[0] != stamp:
+            index = read(os.path.join(bdir, TITLES_INX))
+            if index is None:
+                _indexes.pop(bdir, None)
+                return None
+            cached = _indexes[bdir] = (stamp, index)
+        index = cached[1]
+        if patched is not None:
+            index.update(data.persons, patched())
+        return index
@@ -0,0 +1,47 @@
+import io
+import sys
+import time
+
+from lib import iovalue
+
+
+def make_persons(n):
+    persons = []
+    for i in range(n):
+        persons.append([
+            2 * i, 2 * i + 1, i % 7, [], i, [], [], [], [], [], i % 3,
+            {'tag': 0, 'fields': [i * 37, 1]}, 0, [], {'tag': 1, 'fields': [i]},
+            0, [], 0, [], 0, [], 0, i % 2, [], [i, i + 1], i
+        ])
+    return persons
+
+
+def timed(label, fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<14} {best:8.3f}s")
+    return result, best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    out = io.BytesIO()
+    iovalue.output(out, make_persons(n))
+    data = out.getvalue()
+    print(f"persons array: {n} records, {len(data)} bytes")
+
+    slow, t_slow = timed("input_loop", lambda: iovalue.input_loop(iovalue.in_channel_funs, io.BytesIO(data)), repeat)
+    fast, t_fast = timed("buffer decoder", lambda: iovalue.input_value_from_buffer(data)[0], repeat)
+
+    assert slow == fast
+    print(f"speedup        {t_slow / t_fast:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
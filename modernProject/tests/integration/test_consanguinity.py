@@ -23,7 +23,7 @@ def test_family_relationships(temp_dir):
         children = driver.get_children(family)
 
         assert father_id == 0
-        assert mother_id == []
+        assert mother_id is None
         assert children == []
 
         return True
@@ -65,7 +65,7 @@ def test_database_family_lifecycle(temp_dir):
         father_id = driver.get_father(family)
         assert father_id == 0
         mother_id = driver.get_mother(family)
-        assert mother_id == []
+        assert mother_id is None
         return True
 
     result = database.with_database(gwb_path, check_families)
@@ -10,6 +10,7 @@ class MockBase:
         self.persons = persons
         self.families = families
         self.nb_persons = len(persons)
+        self.nb_families = len(families)
 
     def get_person(self, i):
         return self.persons.get(i)
@@ -31,6 +32,14 @@ class MockDriver:
     def foi(base, i):
         return base.get_family(i)
 
+    @staticmethod
+    def poi_many(base, ipers, kinds):
+        return [base.get_person(i) for i in ipers]
+
+    @staticmethod
+    def foi_many(base, ifams, kinds):
+        return [base.get_family(i) for i in ifams]
+
     @staticmethod
     def get_parents(person):
         return person.parents
@@ -47,10 +56,18 @@ class MockDriver:
     def get_consang(person):
         return person.consang
 
+    @staticmethod
+    def get_parent_array(family):
+        return [family.father, family.mother]
+
     @staticmethod
     def nb_of_persons(base):
         return base.nb_persons
 
+    @staticmethod
+    def nb_of_families(base):
+        return base.nb_families
+
     @staticmethod
     def iper_marker(ipers, default_value):
         data = {}
@@ -350,6 +367,10 @@ def test_topological_sort():
     from lib import driver as RealDriver
     original_ipers = RealDriver.ipers
     original_foi = RealDriver.foi
+    original_poi_many = RealDriver.poi_many
+    original_foi_many = RealDriver.foi_many
+    original_get_parent_array = RealDriver.get_parent_array
+    original_nb_of_families = RealDriver.nb_of_families
     original_get_parents = RealDriver.get_parents
     original_get_father = RealDriver.get_father
     original_get_mother = RealDriver.get_mother
@@ -359,6 +380,10 @@ def test_topological_sort():
     try:
         RealDriver.ipers = MockDriver.ipers
         RealDriver.foi = MockDriver.foi
+        RealDriver.poi_many = MockDriver.poi_many
+        RealDriver.foi_many = MockDriver.foi_many
+        RealDriver.get_parent_array = MockDriver.get_parent_array
+        RealDriver.nb_of_families = MockDriver.nb_of_families
         RealDriver.get_parents = MockDriver.get_parents
         RealDriver.get_father = MockDriver.get_father
         RealDriver.get_mother = MockDriver.get_mother
@@ -384,18 +409,17 @@ def test_topological_sort():
             families={0: f0}
         )
 
-        def poi(b, i):
-            return b.get_person(i)
-
-        tab = consang.topological_sort(base, poi)
+        tab = consang.topological_sort(base)
 
-        assert tab.get(2) == 0
-        assert tab.get(0) == 1
-        assert tab.get(1) == 1
+        assert list(tab) == [1, 1, 0]
 
     finally:
         RealDriver.ipers = original_ipers
         RealDriver.foi = original_foi
+        RealDriver.poi_many = original_poi_many
+        RealDriver.foi_many = original_foi_many
+        RealDriver.get_parent_array = original_get_parent_array
+        RealDriver.nb_of_families = original_nb_of_families
         RealDriver.get_parents = original_get_parents
         RealDriver.get_father = original_get_father
         RealDriver.get_mother = original_get_mother
@@ -408,6 +432,10 @@ def test_topological_sort_with_loop():
     original_ipers = RealDriver.ipers
     original_poi = RealDriver.poi
     original_foi = RealDriver.foi
+    original_poi_many = RealDriver.poi_many
+    original_foi_many = RealDriver.foi_many
+    original_get_parent_array = RealDriver.get_parent_array
+    original_nb_of_families = RealDriver.nb_of_families
     original_get_parents = RealDriver.get_parents
     original_get_father = RealDriver.get_father
     original_get_mother = RealDriver.get_mother
@@ -418,6 +446,10 @@ def test_topological_sort_with_loop():
         RealDriver.ipers = MockDriver.ipers
         RealDriver.poi = MockDriver.poi
         RealDriver.foi = MockDriver.foi
+        RealDriver.poi_many = MockDriver.poi_many
+        RealDriver.foi_many = MockDriver.foi_many
+        RealDriver.get_parent_array = MockDriver.get_parent_array
+        RealDriver.nb_of_families = MockDriver.nb_of_families
         RealDriver.get_parents = MockDriver.get_parents
         RealDriver.get_father = MockDriver.get_father
         RealDriver.get_mother = MockDriver.get_mother
@@ -441,11 +473,8 @@ def test_topological_sort_with_loop():
             families={0: f0}
         )
 
-        def poi(b, i):
-            return b.get_person(i)
-
         try:
-            tab = consang.topological_sort(base, poi)
+            tab = consang.topological_sort(base)
             assert False, "Should have raised TopologicalSortError"
         except TopologicalSortError as e:
             assert e.person == p0
@@ -454,6 +483,10 @@ def test_topological_sort_with_loop():
         RealDriver.ipers = original_ipers
         RealDriver.poi = original_poi
         RealDriver.foi = original_foi
+        RealDriver.poi_many = original_poi_many
+        RealDriver.foi_many = original_foi_many
+        RealDriver.get_parent_array = original_get_parent_array
+        RealDriver.nb_of_families = original_nb_of_families
         RealDriver.get_parents = original_get_parents
         RealDriver.get_father = original_get_father
         RealDriver.get_mother = original_get_mother
@@ -579,6 +612,11 @@ def test_relationship_and_links_siblings():
     original_ipers = RealDriver.ipers
     original_poi = RealDriver.poi
     original_foi = RealDriver.foi
+    original_poi_many = RealDriver.poi_many
+    original_foi_many = RealDriver.foi_many
+    original_get_parent_array = RealDriver.get_parent_array
+    original_nb_of_persons = RealDriver.nb_of_persons
+    original_nb_of_families = RealDriver.nb_of_families
     original_get_parents = RealDriver.get_parents
     original_get_father = RealDriver.get_father
     original_get_mother = RealDriver.get_mother
@@ -589,6 +627,11 @@ def test_relationship_and_links_siblings():
         RealDriver.ipers = MockDriver.ipers
         RealDriver.poi = MockDriver.poi
         RealDriver.foi = MockDriver.foi
+        RealDriver.poi_many = MockDriver.poi_many
+        RealDriver.foi_many = MockDriver.foi_many
+        RealDriver.get_parent_array = MockDriver.get_parent_array
+        RealDriver.nb_of_persons = MockDriver.nb_of_persons
+        RealDriver.nb_of_families = MockDriver.nb_of_families
         RealDriver.get_parents = MockDriver.get_parents
         RealDriver.get_father = MockDriver.get_father
         RealDriver.get_mother = MockDriver.get_mother
@@ -616,10 +659,7 @@ def test_relationship_and_links_siblings():
             families={0: f0}
         )
 
-        def poi(b, i):
-            return b.get_person(i)
-
-        tstab = consang.topological_sort(base, poi)
+        tstab = consang.topological_sort(base)
         ri = consang.make_relationship_info(base, tstab)
 
         rel, tops = consang.relationship_and_links(base, ri, True, 2, 3)
@@ -630,6 +670,11 @@ def test_relationship_and_links_siblings():
         RealDriver.ipers = original_ipers
         RealDriver.poi = original_poi
         RealDriver.foi = original_foi
+        RealDriver.poi_many = original_poi_many
+        RealDriver.foi_many = original_foi_many
+        RealDriver.get_parent_array = original_get_parent_array
+        RealDriver.nb_of_persons = original_nb_of_persons
+        RealDriver.nb_of_families = original_nb_of_families
         RealDriver.get_parents = original_get_parents
         RealDriver.get_father = original_get_father
         RealDriver.get_mother = original_get_mother
@@ -642,6 +687,11 @@ def test_relationship_and_links_unrelated():
     original_ipers = RealDriver.ipers
     original_poi = RealDriver.poi
     original_foi = RealDriver.foi
+    original_poi_many = RealDriver.poi_many
+    original_foi_many = RealDriver.foi_many
+    original_get_parent_array = RealDriver.get_parent_array
+    original_nb_of_persons = RealDriver.nb_of_persons
+    original_nb_of_families = RealDriver.nb_of_families
     original_get_parents = RealDriver.get_parents
     original_get_father = RealDriver.get_father
     original_get_mother = RealDriver.get_mother
@@ -652,6 +702,11 @@ def test_relationship_and_links_unrelated():
         RealDriver.ipers = MockDriver.ipers
         RealDriver.poi = MockDriver.poi
         RealDriver.foi = MockDriver.foi
+        RealDriver.poi_many = MockDriver.poi_many
+        RealDriver.foi_many = MockDriver.foi_many
+        RealDriver.get_parent_array = MockDriver.get_parent_array
+        RealDriver.nb_of_persons = MockDriver.nb_of_persons
+        RealDriver.nb_of_families = MockDriver.nb_of_families
         RealDriver.get_parents = MockDriver.get_parents
         RealDriver.get_father = MockDriver.get_father
         RealDriver.get_mother = MockDriver.get_mother
@@ -671,10 +726,7 @@ def test_relationship_and_links_unrelated():
             families={}
         )
 
-        def poi(b, i):
-            return b.get_person(i)
-
-        tstab = consang.topological_sort(base, poi)
+        tstab = consang.topological_sort(base)
         ri = consang.make_relationship_info(base, tstab)
 
         rel, tops = consang.relationship_and_links(base, ri, False, 0, 1)
@@ -685,6 +737,11 @@ def test_relationship_and_links_unrelated():
         RealDriver.ipers = original_ipers
         RealDriver.poi = original_poi
         RealDriver.foi = original_foi
+        RealDriver.poi_many = original_poi_many
+        RealDriver.foi_many = original_foi_many
+        RealDriver.get_parent_array = original_get_parent_array
+        RealDriver.nb_of_persons = original_nb_of_persons
+        RealDriver.nb_of_families = original_nb_of_families
         RealDriver.get_parents = original_get_parents
         RealDriver.get_father = original_get_father
         RealDriver.get_mother = original_get_mother
@@ -702,3 +759,140 @@ def test_phony_rel():
     assert consang.PHONY_REL.elim_ancestors is False
     assert consang.PHONY_REL.anc_stat1 == AncStat.MAYBE_ANC
     assert consang.PHONY_REL.anc_stat2 == AncStat.MAYBE_ANC
+
+
+def cousins_columns():
+    from array import array
+    parents = array('i', [-1, -1, 0, 0, -1, -1, 1, 2, 3, 3])
+    father = array('i', [0, 2, 5, 6])
+    mother = array('i', [1, 4, 3, 7])
+    return parents, father, mother
+
+
+def test_topological_sort_columns():
+    parents, father, mother = cousins_columns()
+    tstab = consang.topological_sort_columns(None, parents, father, mother)
+    assert list(tstab) == [3, 3, 2, 2, 2, 2, 1, 1, 0, 0]
+
+
+def test_topological_sort_columns_with_loop():
+    from array import array
+    from unittest.mock import patch
+    parents = array('i', [0, 1])
+    father = array('i', [1, 0])
+    mother = array('i', [-1, -1])
+    with patch('lib.consang.check_noloop', side_effect=TopologicalSortError(None)) as check:
+        try:
+            consang.topological_sort_columns(None, parents, father, mother)
+            assert False
+        except TopologicalSortError:
+            pass
+    check.assert_called_once()
+
+
+def test_relationship_of_columns():
+    from array import array
+    parents, father, mother = cousins_columns()
+    tstab = consang.topological_sort_columns(None, parents, father, mother)
+    cg = array('i', [0] * 10)
+    assert consang.relationship_of_columns(tstab, parents, father, mother, cg, 6, 7) == 0.0625
+    assert consang.relationship_of_columns(tstab, parents, father, mother, cg, 2, 3) == 0.25
+    assert consang.relationship_of_columns(tstab, parents, father, mother, cg, 4, 5) == 0.0
+    assert consang.relationship_of_columns(tstab, parents, father, mother, cg, 8, 8) == 1.0
+    assert consang.relationship_of_columns(tstab, parents, father, mother, cg, -1, 8) == 0.0
+
+
+def test_deep_pedigree_without_recursion():
+    import sys
+    from types import SimpleNamespace
+    from unittest.mock import patch
+    depth = sys.getrecursionlimit() * 2
+    persons = {i: SimpleNamespace(parents=i if i + 1 < depth else None) for i in range(depth)}
+    families = {i: SimpleNamespace(father=i + 1, mother=-1) for i in range(depth)}
+    base = MockBase(persons=persons, families=families)
+
+    with patch('lib.driver.ipers', lambda b: list(range(depth))), \
+         patch('lib.driver.poi', MockDriver.poi), \
+         patch('lib.driver.foi', MockDriver.foi), \
+         patch('lib.driver.poi_many', MockDriver.poi_many), \
+         patch('lib.driver.foi_many', MockDriver.foi_many), \
+         patch('lib.driver.get_parent_array', MockDriver.get_parent_array), \
+         patch('lib.driver.nb_of_persons', MockDriver.nb_of_persons), \
+         patch('lib.driver.nb_of_families', MockDriver.nb_of_families), \
+         patch('lib.driver.get_parents', MockDriver.get_parents), \
+         patch('lib.driver.get_father', MockDriver.get_father), \
+         patch('lib.driver.get_mother', MockDriver.get_mother), \
+         patch('lib.driver.iper_marker', MockDriver.iper_marker):
+        tab = consang.topological_sort(base)
+        errors = []
+        consang.check_noloop_for_person_list(base, errors.append, [0])
+
+    assert tab[0] == 0
+    assert tab[depth - 1] == depth - 1
+    assert errors == []
+
+
+def test_int_field():
+    assert consang.int_field(3) == 3
+    assert consang.int_field({'tag': 1, 'fields': [4]}) == 4
+    assert consang.int_field({'tag': 0, 'fields': []}) is None
+    assert consang.int_field([]) is None
+
+
+def test_consang_of_raw_values():
+    from types import SimpleNamespace
+    from unittest.mock import patch
+    with patch('lib.driver.get_consang', side_effect=lambda p: p.consang):
+        assert consang.consang_of(SimpleNamespace(consang=adef.Fix(250000))) == 0.25
+        assert consang.consang_of(SimpleNamespace(consang=adef.NO_CONSANG)) == 0.0
+        assert consang.consang_of(SimpleNamespace(consang=62500)) == 0.0625
+        assert consang.consang_of(SimpleNamespace(consang=-1)) == 0.0
+        assert consang.consang_of(SimpleNamespace(consang=[])) == 0.0
+
+
+def test_relationship_engine_caches_and_reuses_info():
+    from unittest.mock import patch
+    engine = consang.RelationshipEngine("base", cache_size=2)
+    with patch.object(consang, 'topological_sort', return_value='tstab') as tsort, \
+         patch.object(consang, 'make_relationship_info', return_value='info') as make_info, \
+         patch.object(consang, 'relationship_and_links', side_effect=lambda b, ri, links, i1, i2: (i1 + i2, [i1])) as rel:
+        assert engine.relationship(3, 1) == (4, (1,))
+        assert engine.relationship(1, 3) == (4, (1,))
+        assert engine.relationship(1, 4) == (5, (1,))
+        assert engine.relationship(2, 4) == (6, (2,))
+        assert engine.relationship(1, 3) == (4, (1,))
+
+    tsort.assert_called_once()
+    make_info.assert_called_once_with("base", 'tstab')
+    assert rel.call_count == 4
+    assert rel.call_args_list[0].args == ("base", 'info', True, 1, 3)
+    assert list(engine.cache) == [(2, 4), (1, 3)]
+
+    engine.clear()
+    assert engine.info is None
+    assert not engine.cache
+
+
+def test_relationship_engine_lives_with_registry_entry():
+    from types import SimpleNamespace
+    from unittest.mock import patch
+    from lib import database
+
+    def fake_open(bname, read_only=False):
+        return SimpleNamespace(name=bname), lambda: None
+
+    registry = database.BaseRegistry(max_open=1)
+    with patch('lib.database.open_database', side_effect=fake_open), \
+         patch('lib.database.base_stamp', return_value=()), \
+         patch.object(database, 'base_registry', registry):
+        engine = registry.with_base("/a", consang.relationship_engine)
+        assert registry.with_base("/a", consang.relationship_engine) is engine
+        entry = registry.entries["/a.gwb"]
+        assert engine.base is entry.base
+        other = registry.with_base("/b", consang.relationship_engine)
+        assert other is not engine
+        assert entry.caches == {}
+        assert registry.with_base("/a", consang.relationship_engine) is not engine
+
+        loose = SimpleNamespace()
+        assert consang.relationship_engine(loose) is not consang.relationship_engine(loose)
@@ -226,7 +226,7 @@ def test_compute_empty_base():
         RealDriver.ifam_marker = MockDriver.ifam_marker
         RealDriver.commit_patches = MockDriver.commit_patches
 
-        def mock_topological_sort(base, poi):
+        def mock_topological_sort(base):
             data = {}
             return Marker(get=lambda k: data.get(k, 0), set=lambda k, v: data.__setitem__(k, v))
 
@@ -290,7 +290,7 @@ def test_compute_single_person_no_parents():
         RealDriver.commit_patches = MockDriver.commit_patches
         RealDriver.nb_of_persons = MockDriver.nb_of_persons
 
-        def mock_topological_sort(base, poi):
+        def mock_topological_sort(base):
             data = {}
             return Marker(get=lambda k: data.get(k, 0), set=lambda k, v: data.__setitem__(k, v))
 
@@ -384,7 +384,7 @@ def test_compute_with_parents():
         RealDriver.commit_patches = MockDriver.commit_patches
         RealDriver.nb_of_persons = MockDriver.nb_of_persons
 
-        def mock_topological_sort(base, poi):
+        def mock_topological_sort(base):
             data = {0: 1, 1: 1, 2: 0}
             return Marker(get=lambda k: data.get(k, 0), set=lambda k, v: data.__setitem__(k, v))
 
@@ -487,7 +487,7 @@ def test_compute_not_from_scratch():
         RealDriver.commit_patches = MockDriver.commit_patches
         RealDriver.nb_of_persons = MockDriver.nb_of_persons
 
-        def mock_topological_sort(base, poi):
+        def mock_topological_sort(base):
             data = {}
             return Marker(get=lambda k: data.get(k, 0), set=lambda k, v: data.__setitem__(k, v))
 
@@ -573,7 +573,7 @@ def test_compute_with_verbosity_1():
         RealDriver.commit_patches = MockDriver.commit_patches
         RealDriver.nb_of_persons = MockDriver.nb_of_persons
 
-        def mock_topological_sort(base, poi):
+        def mock_topological_sort(base):
             data = {}
             return Marker(get=lambda k: data.get(k, 0), set=lambda k, v: data.__setitem__(k, v))
 
@@ -660,7 +660,7 @@ def test_compute_with_verbosity_2():
         RealDriver.commit_patches = MockDriver.commit_patches
         RealDriver.nb_of_persons = MockDriver.nb_of_persons
 
-        def mock_topological_sort(base, poi):
+        def mock_topological_sort(base):
             data = {}
             return Marker(get=lambda k: data.get(k, 0), set=lambda k, v: data.__setitem__(k, v))
 
@@ -729,7 +729,7 @@ def test_compute_with_keyboard_interrupt():
         RealDriver.ifams = MockDriver.ifams
         RealDriver.commit_patches = MockDriver.commit_patches
 
-        def mock_topological_sort(base, poi):
+        def mock_topological_sort(base):
             raise KeyboardInterrupt()
 
         def mock_make_relationship_info(base, ts):
@@ -796,3 +796,144 @@ def test_relationship_wrapper():
         RealDriver.ipers = original_ipers
         RealDriver.iper_marker = original_iper_marker
         RealConsang.relationship_and_links = original_relationship_and_links
+
+
+def test_fix_value():
+    assert consang_all._fix_value(adef.Fix(250)) == 250
+    assert consang_all._fix_value(125) == 125
+    assert consang_all._fix_value([]) == -1
+    assert consang_all._fix_value({'tag': 'Fix', 'value': -1}) == -1
+
+
+def test_compute_arrays_patches_only_changed():
+    from array import array
+    from unittest.mock import patch
+    parents = array('i', [-1, -1, 0, 0, -1, -1, 1, 2, 3, 3])
+    father = array('i', [0, 2, 5, 6])
+    mother = array('i', [1, 4, 3, 7])
+    old = array('i', [0, 0, 0, 0, 0, 0, 0, 0, -1, -1])
+    patched = {}
+
+    with patch.object(consang_all, '_consang_columns', return_value=(parents, father, mother, old)), \
+         patch('lib.driver.patch_ascend', side_effect=lambda base, i, a: patched.__setitem__(i, a)), \
+         patch('lib.driver.commit_patches') as commit:
+        result = consang_all.compute(None, from_scratch=False, verbosity=0, fast=True)
+
+    assert result is True
+    assert sorted(patched) == [8, 9]
+    assert patched[8].parents == 3
+    assert patched[8].consang == adef.Fix(62500)
+    commit.assert_called_once()
+
+
+def test_compute_arrays_nothing_to_do():
+    from array import array
+    from unittest.mock import patch
+    columns = (array('i', [-1]), array('i'), array('i'), array('i', [0]))
+
+    with patch.object(consang_all, '_consang_columns', return_value=columns), \
+         patch('lib.driver.patch_ascend') as patch_ascend, \
+         patch('lib.driver.commit_patches') as commit:
+        assert consang_all.compute_arrays(None, from_scratch=True, verbosity=0) is False
+
+    patch_ascend.assert_not_called()
+    commit.assert_not_called()
+
+
+def test_generation_levels():
+    from array import array
+    assert consang_all._generation_levels(array('i', [1, 0, 2, 0])) == [[2], [0], [1, 3]]
+    assert consang_all._generation_levels(array('i')) == []
+
+
+def test_compute_arrays_parallel_matches_serial():
+    from array import array
+    from unittest.mock import patch
+    parents = array('i', [-1, -1, 0, 0, -1, -1, 1, 2, 3, 3])
+    father = array('i', [0, 2, 5, 6])
+    mother = array('i', [1, 4, 3, 7])
+    results = []
+
+    for jobs in (1, 2):
+        patched = {}
+        columns = (parents, father, mother, array('i', [-1] * 10))
+        with patch.object(consang_all, '_consang_columns', return_value=columns), \
+             patch.object(consang_all, 'PARALLEL_MIN_PAIRS', 1), \
+             patch('lib.driver.patch_ascend', side_effect=lambda base, i, a: patched.__setitem__(i, a.consang.value)), \
+             patch('lib.driver.commit_patches'):
+            consang_all.compute_arrays(None, from_scratch=True, verbosity=0, jobs=jobs)
+        results.append(patched)
+
+    assert results[0] == results[1]
+    assert results[0][8] == results[0][9] == 62500
+
+
+def test_compute_arrays_reports_max_with_designation(capsys):
+    from array import array
+    from unittest.mock import patch
+    parents = array('i', [-1, -1, 0, 0, -1, -1, 1, 2, 3, 3])
+    father = array('i', [0, 2, 5, 6])
+    mother = array('i', [1, 4, 3, 7])
+    columns = (parents, father, mother, array('i', [-1] * 10))
+    with patch.object(consang_all, '_consang_columns', return_value=columns), \
+         patch('lib.driver.poi', side_effect=lambda base, i: i), \
+         patch('lib.gutil.designation', side_effect=lambda base, p: f"P{p}") as designation, \
+         patch('lib.driver.patch_ascend'), \
+         patch('lib.driver.commit_patches'):
+        consang_all.compute_arrays(None, from_scratch=True, verbosity=2)
+
+    designation.assert_called_with(None, 8)
+    assert "for P8" in capsys.readouterr().err
+
+
+def family_tree_base():
+    from types import SimpleNamespace
+    from lib.gwdef import GenUnion, GenDescend
+    parents = [None, None, 0, 0, None, None, 1, 2, 3, 3]
+    unions = {0: [0], 1: [0], 2: [1], 3: [2], 4: [1], 5: [2], 6: [3], 7: [3]}
+    children = {0: [2, 3], 1: [6], 2: [7], 3: [8, 9]}
+    data = SimpleNamespace(
+        ascends=SimpleNamespace(get=lambda i: GenAscend(parents=parents[i], consang=adef.NO_CONSANG)),
+        unions=SimpleNamespace(get=lambda i: GenUnion(family=unions.get(i, []))),
+        descends=SimpleNamespace(get=lambda i: GenDescend(children=children[i])))
+    return SimpleNamespace(data=data)
+
+
+def test_descendants_closure_from_family():
+    base = family_tree_base()
+    assert consang_all.descendants_closure(base, [], [3]) == {8, 9}
+    assert consang_all.descendants_closure(base, [], [1]) == {6, 8, 9}
+
+
+def test_descendants_closure_from_person_includes_siblings():
+    base = family_tree_base()
+    assert consang_all.descendants_closure(base, [2], []) == {2, 3, 6, 7, 8, 9}
+    assert consang_all.descendants_closure(base, [9], []) == {8, 9}
+    assert consang_all.descendants_closure(base, [], []) == set()
+
+
+def test_compute_incremental_resets_only_closure():
+    from array import array
+    from unittest.mock import patch
+    parents = array('i', [-1, -1, 0, 0, -1, -1, 1, 2, 3, 3])
+    father = array('i', [0, 2, 5, 6])
+    mother = array('i', [1, 4, 3, 7])
+    old = array('i', [0, 0, 0, 0, 0, 0, 0, 0, 0, 62500])
+    patched = {}
+
+    with patch.object(consang_all, '_consang_columns', return_value=(parents, father, mother, old)), \
+         patch.object(consang_all, 'descendants_closure', return_value={8, 9}) as closure, \
+         patch('lib.driver.patch_ascend', side_effect=lambda base, i, a: patched.__setitem__(i, a.consang.value)), \
+         patch('lib.driver.commit_patches'):
+        assert consang_all.compute_incremental(None, ifams=[3]) is True
+
+    closure.assert_called_once_with(None, (), [3])
+    assert patched == {8: 62500}
+
+
+def test_compute_incremental_empty_closure():
+    from unittest.mock import patch
+    with patch.object(consang_all, 'descendants_closure', return_value=set()), \
+         patch.object(consang_all, 'compute_arrays') as compute_arrays:
+        assert consang_all.compute_incremental(None) is False
+    compute_arrays.assert_not_called()
@@ -1,5 +1,7 @@
 import os
 import tempfile
+import pytest
+import threading
 from io import StringIO
 import struct
 from lib import database
@@ -172,6 +174,12 @@ def test_apply_patches():
     assert result[7] == 80
     assert result[0] == 1
 
+def test_iter_patched_matches_apply_patches():
+    arr = [1, 2, 3]
+    patches = {1: 20, 4: 50}
+    assert list(database.iter_patched(arr, patches, 6)) == database.apply_patches(arr, patches, 6)
+    assert list(database.iter_patched(arr, patches, 6)) == [1, 20, 3, None, 50, None]
+
 def test_immut_record_array_loading():
     from lib import iovalue
     import io
@@ -884,6 +892,47 @@ def test_commit_patches_serialization():
         result = database.with_database(gwb_path, callback, read_only=False)
         assert result == "success"
 
+def test_commit_patches_ascend_round_trip():
+    from tests.gwb_generator import create_minimal_gwb
+    from lib import adef, dutil
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        secure.add_assets(tmpdir)
+        gwb_path = create_minimal_gwb(tmpdir, "test")
+
+        def write(base):
+            base.func.patch_ascend(1, GenAscend(parents=0, consang=adef.Fix(62500)))
+            base.func.commit_patches()
+
+        database.with_database(gwb_path, write, read_only=False)
+
+        def read(base):
+            return dutil.ascend_to_gen_ascend(base.data.ascends.get(1))
+
+        ascend = database.with_database(gwb_path, read, read_only=True)
+        assert ascend.parents == 0
+        assert ascend.consang == 62500
+
+def test_pending_changes():
+    from tests.gwb_generator import create_minimal_gwb
+    from lib import adef, driver
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        secure.add_assets(tmpdir)
+        gwb_path = create_minimal_gwb(tmpdir, "test")
+
+        def callback(base):
+            assert driver.pending_changes(base) == (set(), set())
+            base.func.patch_ascend(1, GenAscend(parents=None, consang=adef.Fix(0)))
+            base.func.patch_couple(0, {'tag': 0, 'fields': [0, 1]})
+            changes = driver.pending_changes(base)
+            base.func.commit_patches()
+            return changes, driver.pending_changes(base)
+
+        changes, after_commit = database.with_database(gwb_path, callback, read_only=False)
+        assert changes == ({1}, {0})
+        assert after_commit == (set(), set())
+
 def test_commit_patches_family():
     from tests.gwb_generator import create_minimal_gwb
 
@@ -1184,3 +1233,324 @@ def test_database_from_record_conversion():
 
 
     assert db_instance.h_name == {'name1': 'value_name1', 'name2': 'value_name2'}
+
+
+def test_base_registry_reuses_open_base():
+    from tests.gwb_generator import create_minimal_gwb
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        secure.add_assets(tmpdir)
+        gwb_path = create_minimal_gwb(tmpdir, "test")
+        registry = database.BaseRegistry()
+
+        with patch('lib.database.open_database', wraps=database.open_database) as mock_open_db:
+            first = registry.with_base(gwb_path, lambda base: base)
+            second = registry.with_base(gwb_path[:-4], lambda base: base)
+
+        assert first is second
+        assert mock_open_db.call_count == 1
+        assert second.data.persons.len == 2
+        registry.clear()
+
+
+def test_base_registry_reopens_after_patches_change():
+    from tests.gwb_generator import create_minimal_gwb
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        secure.add_assets(tmpdir)
+        gwb_path = create_minimal_gwb(tmpdir, "test")
+        registry = database.BaseRegistry()
+
+        first = registry.with_base(gwb_path, lambda base: base)
+        with open(os.path.join(gwb_path, "commit_timestamp"), 'w') as f:
+            f.write("now")
+        second = registry.with_base(gwb_path, lambda base: base)
+
+        assert first is not second
+        assert second.data.perm == Perm.RDONLY
+        assert len(registry.entries) == 1
+        registry.clear()
+
+
+def test_base_registry_evicts_least_recently_used():
+    closed = []
+
+    def fake_open(bname, read_only=False):
+        return bname, lambda: closed.append(bname)
+
+    registry = database.BaseRegistry(max_open=2)
+    with (
+        patch('lib.database.open_database', side_effect=fake_open),
+        patch('lib.database.base_stamp', return_value=()),
+    ):
+        registry.with_base("/a", lambda base: None)
+        registry.with_base("/b", lambda base: None)
+        registry.with_base("/a", lambda base: None)
+        registry.with_base("/c", lambda base: None)
+
+    assert closed == ["/b.gwb"]
+    assert list(registry.entries) == ["/a.gwb", "/c.gwb"]
+
+
+def test_base_registry_defers_close_while_in_use():
+    closed = []
+
+    def fake_open(bname, read_only=False):
+        return bname, lambda: closed.append(bname)
+
+    registry = database.BaseRegistry(max_open=1)
+    with (
+        patch('lib.database.open_database', side_effect=fake_open),
+        patch('lib.database.base_stamp', return_value=()),
+    ):
+        entry = registry.acquire("/a")
+        registry.with_base("/b", lambda base: None)
+        assert closed == []
+        registry.release(entry)
+
+    assert closed == ["/a.gwb"]
+
+
+def test_base_registry_opens_outside_lock():
+    opened = []
+    gate = threading.Event()
+    started = threading.Event()
+
+    def fake_open(bname, read_only=False):
+        opened.append(bname)
+        if bname == "/slow.gwb":
+            started.set()
+            gate.wait(5)
+        return bname, lambda: None
+
+    registry = database.BaseRegistry()
+    results = []
+    with (
+        patch('lib.database.open_database', side_effect=fake_open),
+        patch('lib.database.base_stamp', return_value=()),
+    ):
+        slow = [threading.Thread(target=lambda: results.append(registry.with_base("/slow", lambda b: b)))
+                for _ in range(2)]
+        slow[0].start()
+        assert started.wait(5)
+        slow[1].start()
+        assert registry.with_base("/fast", lambda b: b) == "/fast.gwb"
+        gate.set()
+        for t in slow:
+            t.join(5)
+
+    assert results == ["/slow.gwb", "/slow.gwb"]
+    assert opened.count("/slow.gwb") == 1
+    assert registry.opening == {}
+
+
+def test_base_registry_open_failure_releases_marker():
+    registry = database.BaseRegistry()
+    with (
+        patch('lib.database.open_database', side_effect=OSError("boom")),
+        patch('lib.database.base_stamp', return_value=()),
+    ):
+        with pytest.raises(OSError):
+            registry.acquire("/a")
+        with pytest.raises(OSError):
+            registry.acquire("/a")
+    assert registry.opening == {}
+
+
+def test_immut_record_reads_from_mapped_buffers():
+    import io
+
+    values = [b"alpha", 7, [1, 2, {'tag': 1, 'fields': [b"x"]}]]
+    base = io.BytesIO()
+    base.write(b"HEADER")
+    offsets = []
+    for v in values:
+        offsets.append(base.tell())
+        iovalue.output(base, v)
+    acc = b"".join(struct.pack('>I', off) for off in offsets)
+
+    immut = database.make_immut_record_access(
+        read_only=True, ic=None, ic_acc=None, shift=0, array_pos=0,
+        len_val=len(values), name="test",
+        base_map=base.getvalue(), acc_map=acc
+    )
+
+    assert [immut.im_get(i) for i in range(3)] == values
+
+
+def test_open_database_maps_files():
+    from tests.gwb_generator import create_minimal_gwb
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        secure.add_assets(tmpdir)
+        gwb_path = create_minimal_gwb(tmpdir, "test")
+
+        base, close = database.open_database(gwb_path, read_only=True)
+        try:
+            strings = base.data.strings
+            mapped = [strings.get(i) for i in range(strings.len)]
+        finally:
+            close()
+
+        with patch('lib.database.map_file', return_value=None):
+            unmapped = database.with_database(
+                gwb_path, lambda b: [b.data.strings.get(i) for i in range(b.data.strings.len)])
+
+        assert mapped == unmapped
+
+
+def _write_strings_inx(gwb_path, strings):
+    from lib import outbase
+    with open(os.path.join(gwb_path, "strings.inx"), 'wb') as f:
+        outbase.write_strings_hash(f, strings.__getitem__, len(strings))
+
+
+def test_insert_string_finds_base_string_through_strings_inx():
+    from tests.gwb_generator import create_minimal_gwb
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        secure.add_assets(tmpdir)
+        gwb_path = create_minimal_gwb(tmpdir, "test")
+        _write_strings_inx(gwb_path, ["", "John", "Doe", "Jane", "Smith"])
+
+        def callback(base):
+            with patch('lib.database.string_value', wraps=database.string_value) as mock_value:
+                assert base.func.insert_string("Jane") == 3
+                assert mock_value.call_count <= 2
+            new_idx = base.func.insert_string("Brand new")
+            assert new_idx == 5
+            assert base.func.insert_string("Brand new") == new_idx
+            assert base.func.insert_string("Smith") == 4
+            return "success"
+
+        assert database.with_database(gwb_path, callback, read_only=False) == "success"
+
+
+def test_insert_string_without_index_scans_once():
+    from tests.gwb_generator import create_minimal_gwb
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        secure.add_assets(tmpdir)
+        gwb_path = create_minimal_gwb(tmpdir, "test")
+
+        def callback(base):
+            assert base.func.insert_string("Doe") == 2
+            with patch.object(database.StringsLookup, 'load') as mock_load:
+                assert base.func.insert_string("John") == 1
+                mock_load.assert_not_called()
+            return "success"
+
+        assert database.with_database(gwb_path, callback, read_only=False) == "success"
+
+
+def test_strings_lookup_ignores_stale_index():
+    from tests.gwb_generator import create_minimal_gwb
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        secure.add_assets(tmpdir)
+        gwb_path = create_minimal_gwb(tmpdir, "test")
+        _write_strings_inx(gwb_path, ["", "John"])
+
+        def callback(base):
+            assert base.func.insert_string("Smith") == 4
+            return "success"
+
+        assert database.with_database(gwb_path, callback, read_only=False) == "success"
+
+
+def test_name_index_is_stable_across_processes():
+    import subprocess
+    import sys
+    code = "from lib import database, dutil; print(database.name_index('Jean Dupont'), dutil.name_index('Jean Dupont'))"
+    outputs = set()
+    for seed in ("1", "2"):
+        env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=os.path.dirname(os.path.dirname(database.__file__)))
+        outputs.add(subprocess.run([sys.executable, "-c", code], env=env,
+                                   capture_output=True, text=True, check=True).stdout)
+    idx = database.name_index("Jean Dupont")
+    assert outputs == {f"{idx} {idx}\n"}
+
+
+def test_persons_of_name_reads_marked_index():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        secure.add_assets(tmpdir)
+        table = [[] for _ in range(database.TABLE_SIZE)]
+        table[database.name_index("Jean Dupont")] = [7, 9]
+
+        with open(os.path.join(tmpdir, "names.inx"), 'wb') as f:
+            f.write(database.MAGIC_NAMES_INX)
+            database.output_binary_int(f, 0)
+            iovalue.output(f, table)
+
+        lookup = database.persons_of_name(tmpdir, {database.name_index("Jean Dupont"): [11]})
+        assert lookup("jean dupont") == [7, 9, 11]
+
+
+def test_persons_of_name_unmarked_index_uses_legacy_hash():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        secure.add_assets(tmpdir)
+        table = [[] for _ in range(database.TABLE_SIZE)]
+        table[database.legacy_name_index("Jean Dupont")] = [3]
+
+        with open(os.path.join(tmpdir, "names.inx"), 'wb') as f:
+            database.output_binary_int(f, 0)
+            iovalue.output(f, table)
+
+        assert database.persons_of_name(tmpdir, {})("Jean Dupont") == [3]
+
+
+def _write_names_files(dirname, table):
+    with open(os.path.join(dirname, "names.inx"), 'wb') as f:
+        f.write(database.MAGIC_NAMES_INX)
+        database.output_binary_int(f, 0)
+        database.output_binary_int(f, 0)
+        writer = iovalue.ValueWriter(f, f.tell())
+        offsets = writer.output_array(table)
+        writer.flush()
+    with open(os.path.join(dirname, "names.acc"), 'wb') as f:
+        for pos in offsets:
+            database.output_binary_int(f, pos)
+
+
+def test_names_index_opens_files_once():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        secure.add_assets(tmpdir)
+        table = [[] for _ in range(database.TABLE_SIZE)]
+        table[database.name_index("Jean Dupont")] = [4, 2]
+        table[database.name_index("Anne Martin")] = [8]
+        _write_names_files(tmpdir, table)
+
+        names_index = database.NamesIndex(tmpdir)
+        lookup = database.persons_of_name(tmpdir, {}, names_index)
+        with patch('lib.secure.open_in_bin', wraps=secure.open_in_bin) as mock_open_bin:
+            assert lookup("Jean Dupont") == [4, 2]
+            assert lookup("Anne Martin") == [8]
+            assert lookup("Jean Dupont") == [4, 2]
+        assert mock_open_bin.call_count == 2
+        assert len(names_index.buckets) == 2
+        names_index.close()
+
+
+def test_names_index_bucket_cache_is_bounded():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        secure.add_assets(tmpdir)
+        table = [[i] for i in range(database.TABLE_SIZE)]
+        _write_names_files(tmpdir, table)
+
+        names_index = database.NamesIndex(tmpdir, cache_size=2)
+        assert [names_index.bucket(0, i) for i in (5, 6, 7, 6)] == [[5], [6], [7], [6]]
+        assert list(names_index.buckets) == [(0, 7), (0, 6)]
+        names_index.close()
+
+
+def test_last_change_prefers_patches():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        assert database.last_change(tmpdir) == 0.0
+        base = os.path.join(tmpdir, "base")
+        open(base, 'wb').close()
+        os.utime(base, (100, 100))
+        assert database.last_change(tmpdir) == 100
+        patches = os.path.join(tmpdir, "patches")
+        open(patches, 'wb').close()
+        os.utime(patches, (200, 200))
+        assert database.last_change(tmpdir) == 200
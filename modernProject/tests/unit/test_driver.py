@@ -181,6 +181,59 @@ def test_poi_and_foi():
     assert family.index == 10
 
 
+
+def test_poi_many_loads_only_requested_kinds():
+    from lib.driver import poi_many
+    from types import SimpleNamespace
+    from unittest.mock import patch
+
+    calls = []
+
+    def getter(kind):
+        return lambda i: calls.append((kind, i)) or i
+
+    data = SimpleNamespace(persons=SimpleNamespace(get=getter('person')),
+                           ascends=SimpleNamespace(get=getter('ascend')),
+                           unions=SimpleNamespace(get=getter('union')),
+                           strings=SimpleNamespace(get=lambda i: ""))
+    base = SimpleNamespace(data=data)
+
+    with patch('lib.driver.dutil.ascend_to_gen_ascend', side_effect=lambda a: ('asc', a)):
+        persons = poi_many(base, [7, 3, 7], ('ascend',))
+
+    assert [p.index for p in persons] == [7, 3, 7]
+    assert persons[0] is persons[2]
+    assert calls == [('ascend', 3), ('ascend', 7)]
+    assert persons[1].gen_ascend == ('asc', 3)
+    assert persons[1].gen_person is None
+    assert persons[1].gen_union is None
+
+
+def test_poi_many_rejects_field_names():
+    import pytest
+    from lib.driver import poi_many, foi_many
+
+    with pytest.raises(ValueError):
+        poi_many(None, [1], ('parents',))
+    with pytest.raises(ValueError):
+        foi_many(None, [1], ('father',))
+
+
+def test_foi_many_loads_all_kinds_by_default():
+    from lib.driver import foi_many
+    from unittest.mock import MagicMock, patch
+
+    base = MagicMock()
+    with patch('lib.driver.dutil.family_to_gen_family', return_value='f'), \
+         patch('lib.driver.dutil.couple_to_gen_couple', return_value='c'), \
+         patch('lib.driver.dutil.descend_to_gen_descend', return_value='d'):
+        families = foi_many(base, [2, 1])
+
+    assert [f.index for f in families] == [2, 1]
+    assert all((f.gen_family, f.gen_couple, f.gen_descend) == ('f', 'c', 'd') for f in families)
+    assert [c.args[0] for c in base.data.couples.get.call_args_list] == [1, 2]
+
+
 def test_sou():
     from lib.driver import sou
     from types import SimpleNamespace
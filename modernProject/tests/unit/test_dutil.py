@@ -228,6 +228,15 @@ def test_couple_to_gen_couple_from_tuple():
     assert result.mother == 2
 
 
+def test_list_records_decode_option_fields():
+    couple = dutil.couple_to_gen_couple([0, {'tag': 1, 'fields': [1]}])
+    assert couple.father == 0
+    assert couple.mother == 1
+    assert dutil.couple_to_gen_couple([2, []]).mother is None
+    assert dutil.ascend_to_gen_ascend([[], []]).parents is None
+    assert dutil.ascend_to_gen_ascend([[7], []]).parents == 7
+
+
 def test_couple_to_gen_couple_from_dict():
     couple_dict = {"father": 3, "mother": 4}
     result = dutil.couple_to_gen_couple(couple_dict)
@@ -0,0 +1,52 @@
+import io
+import random
+
+from lib import extsort, iovalue
+
+
+def test_sorter_in_memory():
+    with extsort.ExternalSorter() as sorter:
+        for item in [(3, 'c'), (1, 'a'), (2, 'b')]:
+            sorter.add(item)
+        assert list(sorter) == [(1, 'a'), (2, 'b'), (3, 'c')]
+        assert sorter.runs == []
+
+
+def test_sorter_spills_runs_and_merges():
+    items = [(random.randrange(50), i % 7) for i in range(1000)]
+    with extsort.ExternalSorter(run_size=64) as sorter:
+        for item in items:
+            sorter.add(item)
+        assert len(sorter.runs) == 1000 // 64
+        assert list(sorter) == sorted(items)
+        assert list(sorter.unique()) == sorted(set(items))
+    assert sorter.runs == []
+
+
+def test_output_buckets_fills_gaps():
+    out = io.BytesIO()
+    writer = iovalue.ValueWriter(out)
+    offsets = extsort.output_buckets(writer, 5, [(1, 10), (1, 11), (3, 4)])
+    writer.flush()
+
+    data = out.getvalue()
+    assert iovalue.input_value(io.BytesIO(data)) == [[], [10, 11], [], [4], []]
+    assert len(offsets) == 5
+    assert iovalue.input_value(io.BytesIO(data[offsets[1]:])) == [10, 11]
+    assert iovalue.input_value(io.BytesIO(data[offsets[3]:])) == [4]
+
+
+def test_output_name_lists():
+    entries = [('Doe', 5, 0), ('Doe', 5, 3), ('Smith', 2, 1)]
+    oc_dat = io.BytesIO()
+    oc_inx = io.BytesIO()
+    extsort.output_name_lists(oc_dat, oc_inx, entries, lambda e: e[1], lambda e: e[2])
+
+    inx = iovalue.input_value(io.BytesIO(oc_inx.getvalue()))
+    assert [istr for istr, _ in inx] == [5, 2]
+    dat = oc_dat.getvalue()
+    doe_pos = inx[0][1]
+    assert [int.from_bytes(dat[doe_pos + 4 * k:doe_pos + 4 * k + 4], 'big') for k in range(3)] == [2, 0, 3]
+    smith_pos = inx[1][1]
+    assert int.from_bytes(dat[smith_pos:smith_pos + 4], 'big') == 1
+    assert int.from_bytes(dat[smith_pos + 4:smith_pos + 8], 'big') == 1
@@ -125,6 +125,48 @@ def test_gedcom_parser_integration():
             os.unlink(test_file)
 
 
+
+def test_iter_records_streams_level0_records():
+    test_gedcom = """0 HEAD
+1 CHAR UTF-8
+0 @I1@ INDI
+1 NAME John /Doe/
+1 BIRT
+2 DATE 1 JAN 1900
+1 SEX M
+0 @F1@ FAM
+1 HUSB @I1@
+0 TRLR
+"""
+
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.ged', delete=False) as f:
+        f.write(test_gedcom)
+        test_file = f.name
+
+    try:
+        parser = GedcomParser(test_file)
+        records = parser.iter_records()
+        head = next(records)
+        assert head.tag == 'HEAD'
+        assert [c.tag for c in head.children] == ['CHAR']
+
+        indi = next(records)
+        assert indi.xref == '@I1@'
+        assert [c.tag for c in indi.children] == ['NAME', 'BIRT', 'SEX']
+        assert indi.children[1].children[0].value == '1 JAN 1900'
+
+        assert [r.tag for r in records] == ['FAM', 'TRLR']
+        assert [r.tag for r in parser.parse_file()] == ['HEAD', 'INDI', 'FAM', 'TRLR']
+    finally:
+        if os.path.exists(test_file):
+            os.unlink(test_file)
+
+
+def test_gedcom_line_slots():
+    line = GedcomLine(0, None, 'HEAD', '')
+    assert not hasattr(line, '__dict__')
+    assert line.children == []
+
 def test_database_builder_integration():
     test_gedcom = """0 HEAD
 1 SOUR GeneWeb
@@ -562,3 +604,59 @@ def test_get_merged_value_not_found():
 
     merged = parser.get_merged_value(record, 'NONEXISTENT', 'default')
     assert merged == 'default'
+
+
+def test_build_parallel_matches_serial(monkeypatch):
+    import ged2gwb
+    lines = ['0 HEAD', '1 CHAR UTF-8']
+    for i in range(12):
+        lines += [f'0 @I{i}@ INDI', f'1 NAME Given{i % 5} /Family{i % 3}/',
+                  '1 SEX ' + ('M' if i % 2 == 0 else 'F'),
+                  '1 BIRT', f'2 DATE {1900 + i}', f'2 PLAC Town{i % 4}']
+    for i in range(5):
+        lines += [f'0 @F{i}@ FAM', f'1 HUSB @I{2 * i}@', f'1 WIFE @I{2 * i + 1}@',
+                  f'1 CHIL @I{i + 10}@' if i + 10 < 12 else '1 MARR', f'1 NOTE Note{i % 2}']
+    lines.append('0 TRLR')
+
+    temp_dir = tempfile.mkdtemp()
+    ged = os.path.join(temp_dir, 'test.ged')
+    with open(ged, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    monkeypatch.setattr(ged2gwb, 'CONVERT_CHUNK', 3)
+
+    try:
+        outputs = []
+        for jobs in (1, 2):
+            parser = GedcomParser(ged)
+            parser.load()
+            out = os.path.join(temp_dir, f'j{jobs}.gwb')
+            DatabaseBuilder(parser).build(out, jobs)
+            outputs.append(out)
+        for name in ('base', 'base.acc', 'names.inx', 'snames.dat', 'fnames.dat', 'strings.inx'):
+            with open(os.path.join(outputs[0], name), 'rb') as a, open(os.path.join(outputs[1], name), 'rb') as b:
+                assert a.read() == b.read(), name
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def test_convert_reports_progress():
+    import ged2gwb
+    from lib.progr_bar import ProgressBar
+
+    temp_dir = tempfile.mkdtemp()
+    ged = os.path.join(temp_dir, 'test.ged')
+    with open(ged, 'w') as f:
+        f.write('0 HEAD\n0 @I1@ INDI\n1 NAME John /Doe/\n0 @I2@ INDI\n1 NAME Jane /Doe/\n0 TRLR\n')
+    parsed = []
+    written = []
+
+    try:
+        builder = ged2gwb.convert(ged, os.path.join(temp_dir, 'test.gwb'),
+                                  parse_bar=ProgressBar(disabled=True, report=lambda c, t: parsed.append((c, t))),
+                                  write_bar=ProgressBar(disabled=True, report=lambda c, t: written.append((c, t))))
+        assert len(builder.parser.individuals) == 2
+        assert parsed[-1][0] == parsed[-1][1] == os.path.getsize(ged)
+        assert [c for c, _ in written] == list(range(1, ged2gwb.BUILD_STEPS + 1))
+        assert os.path.exists(os.path.join(temp_dir, 'test.gwb', 'base'))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
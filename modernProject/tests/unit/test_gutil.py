@@ -123,10 +123,14 @@ def test_spouse():
 
 
 def test_designation():
+    from unittest.mock import patch
     base = MockBase()
-    p = MockPerson(iper=1, first_name="John", surname="Doe", occ=2,
+    p = MockPerson(iper=1, first_name=b"Jos\xc3\xa9", surname="Doe", occ=2,
                    birth=None, baptism=None, death=None, burial=None)
-    assert gutil.designation(base, p) == "John.2 Doe"
+    with patch('lib.gutil.driver.p_first_name', side_effect=lambda b, p: p.first_name), \
+         patch('lib.gutil.driver.p_surname', side_effect=lambda b, p: p.surname), \
+         patch('lib.gutil.driver.get_occ', side_effect=lambda p: p.occ):
+        assert gutil.designation(base, p) == "Jos\u00e9.2 Doe"
 
 
 def test_person_is_key_direct_match():
@@ -3,8 +3,9 @@ from pathlib import Path
 import socket
 import pytest
 import io
+import zlib
 from bin import gwd, request, robot
-from lib import config
+from lib import config, page_cache
 
 sys.path.insert(0, str(Path(__file__).parent.parent / 'bin'))
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -701,7 +702,7 @@ def test_geneweb_server_initialization_and_shutdown():
         mock_socket_class.assert_called_once_with(socket.AF_INET, socket.SOCK_STREAM)
         mock_socket_instance.setsockopt.assert_called_once_with(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         mock_socket_instance.bind.assert_called_once_with(("127.0.0.1", 8080))
-        mock_socket_instance.listen.assert_called_once_with(5)
+        mock_socket_instance.listen.assert_called_once_with(gwd.max_pending_requests)
 
         mock_logs_info.assert_any_call("GeneWeb server starting...")
         mock_logs_info.assert_any_call("Port: 8080")
@@ -903,9 +904,12 @@ def test_arg_parse_in_file_not_implemented():
     with pytest.raises(NotImplementedError):
         gwd.arg_parse_in_file("filename.txt")
 
-def test_robot_exclude_arg_not_implemented():
-    with pytest.raises(NotImplementedError):
-        gwd.robot_exclude_arg("fname")
+def test_robot_exclude_arg():
+    with patch.object(gwd, 'robot_xcl', None):
+        gwd.robot_exclude_arg("30,60")
+        assert gwd.robot_xcl == (30, 60)
+        with pytest.raises(SystemExit):
+            gwd.robot_exclude_arg("fname")
 
 def test_slashify():
     assert gwd.slashify("/path") == "/path/"
@@ -983,9 +987,15 @@ def test_no_access():
         mock_refuse_log.assert_called_once_with(mock_conf, "192.168.1.1")
 
 
-def test_log_and_robot_check_not_implemented():
-    with pytest.raises(NotImplementedError):
-        gwd.log_and_robot_check(0.0, "addr", "req", MagicMock())
+def test_log_and_robot_check():
+    conf = MagicMock()
+    with patch('bin.gwd.robot.check') as mock_check:
+        with patch.object(gwd, 'robot_xcl', None):
+            gwd.log_and_robot_check(0.0, "addr", "req", conf)
+        mock_check.assert_not_called()
+        with patch.object(gwd, 'robot_xcl', (30, 60)):
+            gwd.log_and_robot_check(5.0, "addr", "req", conf)
+        mock_check.assert_called_once_with(5.0, "addr", 30, 60, conf, False)
 
 
 def test_conf_and_connection_not_implemented():
@@ -1171,3 +1181,518 @@ def test_refuse_auth():
         mock_syslog.assert_called_once_with(gwd.logs.LOG_NOTICE,
                                             f"Access failed --- From: {from_addr} --- Basic realm: {auth_type} --- Response: {auth}")
         mock_unauthorized.assert_called_once_with(mock_config, auth_type)
+
+
+def test_connection_pool_processes_submitted_connections():
+    import threading
+    handled = []
+    done = threading.Event()
+
+    def handler(conn, addr):
+        handled.append(addr)
+        if len(handled) == 3:
+            done.set()
+
+    pool = gwd.ConnectionPool(handler, 2, 10)
+    pool.start()
+    for n in range(3):
+        assert pool.submit(MagicMock(), ("127.0.0.1", n))
+    assert done.wait(5)
+    pool.shutdown(5)
+
+    assert sorted(a[1] for a in handled) == [0, 1, 2]
+    assert all(not t.is_alive() for t in pool.threads)
+
+
+def test_connection_pool_rejects_when_queue_full():
+    pool = gwd.ConnectionPool(MagicMock(), 1, 1)
+
+    assert pool.submit(MagicMock(), ("127.0.0.1", 1))
+    assert not pool.submit(MagicMock(), ("127.0.0.1", 2))
+
+
+def test_connection_pool_worker_survives_handler_error():
+    import threading
+    done = threading.Event()
+    calls = []
+
+    def handler(conn, addr):
+        calls.append(addr)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        done.set()
+
+    with patch('bin.gwd.logs.syslog') as mock_syslog:
+        pool = gwd.ConnectionPool(handler, 1, 4)
+        pool.start()
+        pool.submit(MagicMock(), "a")
+        pool.submit(MagicMock(), "b")
+        assert done.wait(5)
+        pool.shutdown(5)
+
+    mock_syslog.assert_any_call(gwd.logs.LOG_ERR, "Worker error: boom")
+    assert calls == ["a", "b"]
+
+
+def test_shed_connection_sends_503_and_closes():
+    mock_conn = MagicMock()
+
+    with patch('bin.gwd.logs.syslog'):
+        gwd.shed_connection(mock_conn, ("127.0.0.1", 1))
+
+    sent = mock_conn.sendall.call_args[0][0]
+    assert sent.startswith(b"HTTP/1.1 503 Service Unavailable\r\n")
+    assert b"Retry-After:" in sent
+    head, body = sent.split(b"\r\n\r\n", 1)
+    assert f"Content-Length: {len(body)}".encode() in head
+    mock_conn.close.assert_called_once()
+
+
+def test_geneweb_server_sheds_when_pool_full():
+    with (
+        patch('socket.socket') as mock_socket_class,
+        patch('bin.gwd.logs.info'),
+        patch('bin.gwd.logs.syslog'),
+        patch('bin.gwd.ConnectionPool') as mock_pool_class,
+        patch('bin.gwd.shed_connection') as mock_shed,
+        patch('bin.gwd.selected_port', 8080),
+        patch('bin.gwd.selected_addr', "127.0.0.1")
+    ):
+        mock_socket_instance = MagicMock()
+        mock_socket_class.return_value = mock_socket_instance
+        mock_conn = MagicMock()
+        mock_socket_instance.accept.side_effect = [
+            (mock_conn, ("127.0.0.1", 1)),
+            KeyboardInterrupt
+        ]
+        mock_pool = mock_pool_class.return_value
+        mock_pool.submit.return_value = False
+
+        gwd.geneweb_server()
+
+        mock_conn.settimeout.assert_called_once_with(gwd.conn_timeout)
+        mock_shed.assert_called_once_with(mock_conn, ("127.0.0.1", 1))
+        mock_pool.shutdown.assert_called_once_with(gwd.drain_timeout)
+
+
+def test_capture_is_per_thread():
+    import threading
+    original = sys.stdout
+    outputs = {}
+    barrier = threading.Barrier(2)
+
+    def render(tag):
+        buf = []
+        gwd.begin_capture(buf)
+        try:
+            barrier.wait(5)
+            for _ in range(50):
+                print(tag, end="")
+        finally:
+            gwd.end_capture()
+        outputs[tag] = "".join(buf)
+
+    threads = [threading.Thread(target=render, args=(t,)) for t in "ab"]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert outputs == {"a": "a" * 50, "b": "b" * 50}
+    assert sys.stdout is original
+
+
+def test_frame_response_adds_length_and_connection():
+    raw = "HTTP/1.1 200 OK\r\nContent-type: text/html\r\nContent-Length: 1\r\n\r\nhéllo"
+
+    framed = gwd.frame_response(raw, keep_alive=True)
+
+    head, body = framed.split(b"\r\n\r\n", 1)
+    assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert b"Content-Length: 6" in head
+    assert b"Content-Length: 1" not in head
+    assert b"Connection: keep-alive" in head
+    assert body == "héllo".encode("utf-8")
+
+
+def test_frame_response_without_status_or_headers():
+    framed = gwd.frame_response("<html>body</html>", keep_alive=False)
+
+    head, body = framed.split(b"\r\n\r\n", 1)
+    assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert b"Content-Type: text/html" in head
+    assert b"Connection: close" in head
+    assert body == b"<html>body</html>"
+
+
+def test_frame_response_head_only():
+    framed = gwd.frame_response("HTTP/1.1 200 OK\r\n\r\nabc", keep_alive=True, head_only=True)
+
+    assert framed.endswith(b"Content-Length: 3\r\nConnection: keep-alive\r\n"
+                           + f"Keep-Alive: timeout={gwd.keepalive_timeout}, max={gwd.max_keepalive_requests}\r\n\r\n".encode())
+
+
+def test_wants_keep_alive():
+    assert gwd.wants_keep_alive("HTTP/1.1", {})
+    assert not gwd.wants_keep_alive("HTTP/1.1", {"connection": "close"})
+    assert not gwd.wants_keep_alive("HTTP/1.0", {})
+    assert gwd.wants_keep_alive("HTTP/1.0", {"connection": "Keep-Alive"})
+
+
+def _served_paths(mock_treat_request):
+    return [c.args[0].request for c in mock_treat_request.call_args_list]
+
+
+def test_handle_connection_pipelined_requests():
+    with patch('bin.request.treat_request') as mock_treat_request:
+        mock_treat_request.side_effect = lambda conf: print("HTTP/1.1 200 OK\r\n\r\n" + conf.request, end="")
+        mock_conn = MagicMock()
+        mock_conn.recv.side_effect = [
+            b"GET /a HTTP/1.1\r\nHost: x\r\n\r\n"
+            b"POST /b HTTP/1.1\r\nContent-Length: 3\r\n\r\nx=1"
+            b"GET /c HTTP/1.1\r\nConnection: close\r\n\r\n",
+        ]
+
+        gwd.handle_connection(mock_conn, ("127.0.0.1", 1))
+
+        assert _served_paths(mock_treat_request) == ["/a", "/b", "/c"]
+        assert mock_treat_request.call_args_list[1].args[0].body_data == b"x=1"
+        responses = [c.args[0] for c in mock_conn.sendall.call_args_list]
+        assert len(responses) == 3
+        assert b"Connection: keep-alive" in responses[0]
+        assert responses[1].endswith(b"\r\n\r\n/b")
+        assert b"Connection: close" in responses[2]
+        mock_conn.close.assert_called_once()
+
+
+def test_handle_connection_stops_at_max_requests():
+    with (
+        patch('bin.request.treat_request') as mock_treat_request,
+        patch('bin.gwd.max_keepalive_requests', 2)
+    ):
+        mock_conn = MagicMock()
+        mock_conn.recv.side_effect = [b"GET /a HTTP/1.1\r\n\r\n" * 3]
+
+        gwd.handle_connection(mock_conn, ("127.0.0.1", 1))
+
+        assert mock_treat_request.call_count == 2
+        assert b"Connection: close" in mock_conn.sendall.call_args_list[-1].args[0]
+
+
+def test_handle_connection_idle_timeout_closes_quietly():
+    with (
+        patch('bin.request.treat_request'),
+        patch('bin.gwd.logs.syslog') as mock_syslog
+    ):
+        mock_conn = MagicMock()
+        mock_conn.recv.side_effect = [b"GET /a HTTP/1.1\r\n\r\n", socket.timeout()]
+
+        gwd.handle_connection(mock_conn, ("127.0.0.1", 1))
+
+        mock_conn.settimeout.assert_called_with(gwd.keepalive_timeout)
+        mock_syslog.assert_not_called()
+        mock_conn.close.assert_called_once()
+
+
+def _stream_page(conf):
+    conf.output_conf.status(200)
+    conf.output_conf.header("Content-type: text/html")
+    conf.output_conf.body("\r\n")
+    for i in range(5):
+        print("x" * 10, end="")
+
+
+def test_handle_connection_streams_chunked_body():
+    with (
+        patch('bin.request.treat_request', side_effect=_stream_page),
+        patch('bin.gwd.response_chunk_size', 16)
+    ):
+        mock_conn = MagicMock()
+        mock_conn.recv.side_effect = [b"GET /a HTTP/1.1\r\nConnection: close\r\n\r\n"]
+
+        gwd.handle_connection(mock_conn, ("127.0.0.1", 1))
+
+        sent = [c.args[0] for c in mock_conn.sendall.call_args_list]
+        assert sent[0].startswith(b"HTTP/1.1 200\r\nContent-type: text/html\r\n")
+        assert b"Transfer-Encoding: chunked" in sent[0]
+        assert b"Content-Length" not in sent[0]
+        assert sent[1:] == [b"14\r\n" + b"x" * 20 + b"\r\n", b"14\r\n" + b"x" * 20 + b"\r\n",
+                            b"a\r\n" + b"x" * 10 + b"\r\n", b"0\r\n\r\n"]
+
+
+def test_handle_connection_streams_http10_until_close():
+    with (
+        patch('bin.request.treat_request', side_effect=_stream_page),
+        patch('bin.gwd.response_chunk_size', 16)
+    ):
+        mock_conn = MagicMock()
+        mock_conn.recv.side_effect = [b"GET /a HTTP/1.0\r\nConnection: keep-alive\r\n\r\n" * 2]
+
+        gwd.handle_connection(mock_conn, ("127.0.0.1", 1))
+
+        sent = [c.args[0] for c in mock_conn.sendall.call_args_list]
+        assert b"Connection: close" in sent[0]
+        assert b"Transfer-Encoding" not in sent[0]
+        assert b"".join(sent[1:]) == b"x" * 50
+        mock_conn.close.assert_called_once()
+
+
+def test_response_stream_error_after_headers_closes():
+    conn = MagicMock()
+    stream = gwd.ResponseStream(conn, "HTTP/1.1", True, chunk_size=4)
+    stream.append("HTTP/1.1 200 OK\r\n\r\nhello")
+    sent = len(conn.sendall.call_args_list)
+    stream.append("more")
+    assert stream.discard() is False
+    assert stream.finish() is False
+    assert len(conn.sendall.call_args_list) == sent + 1
+
+
+def test_response_stream_small_page_single_send():
+    conn = MagicMock()
+    stream = gwd.ResponseStream(conn, "HTTP/1.1", True)
+    stream.output_conf.header("Content-type: text/plain")
+    stream.output_conf.body("\r\n")
+    stream.output_conf.body("hi")
+    assert stream.finish() is True
+    conn.sendall.assert_called_once()
+    sent = conn.sendall.call_args.args[0]
+    assert sent.startswith(b"HTTP/1.1 200 OK\r\nContent-type: text/plain\r\nContent-Length: 2\r\n")
+    assert sent.endswith(b"\r\n\r\nhi")
+
+
+def test_choose_encoding():
+    assert gwd.choose_encoding("gzip, deflate") == "gzip"
+    assert gwd.choose_encoding("deflate;q=1, gzip;q=0.5") == "deflate"
+    assert gwd.choose_encoding("gzip;q=0, identity") is None
+    assert gwd.choose_encoding("*") == "gzip"
+    assert gwd.choose_encoding("br") is None
+
+
+def test_response_stream_compresses_small_page():
+    conn = MagicMock()
+    stream = gwd.ResponseStream(conn, "HTTP/1.1", False, accept_encoding="gzip")
+    stream.append("HTTP/1.1 200 OK\r\nContent-type: text/html\r\n\r\n" + "abc" * 200)
+    stream.finish()
+
+    head, _, body = conn.sendall.call_args.args[0].partition(b"\r\n\r\n")
+    assert b"Content-Encoding: gzip" in head
+    assert b"Vary: Accept-Encoding" in head
+    assert f"Content-Length: {len(body)}".encode() in head
+    assert zlib.decompress(body, 31) == b"abc" * 200
+
+
+def test_response_stream_skips_binary_and_tiny_bodies():
+    for page in ("HTTP/1.1 200 OK\r\nContent-type: image/png\r\n\r\n" + "x" * 500,
+                 "HTTP/1.1 200 OK\r\n\r\nsmall"):
+        conn = MagicMock()
+        stream = gwd.ResponseStream(conn, "HTTP/1.1", False, accept_encoding="gzip")
+        stream.append(page)
+        stream.finish()
+        assert b"Content-Encoding" not in conn.sendall.call_args.args[0]
+
+
+def test_response_stream_compresses_chunked_body():
+    conn = MagicMock()
+    stream = gwd.ResponseStream(conn, "HTTP/1.1", False, chunk_size=64, accept_encoding="deflate")
+    stream.append("HTTP/1.1 200 OK\r\n\r\n")
+    for _ in range(10):
+        stream.append("y" * 50)
+    stream.finish()
+
+    sent = [c.args[0] for c in conn.sendall.call_args_list]
+    assert b"Content-Encoding: deflate" in sent[0]
+    assert b"Transfer-Encoding: chunked" in sent[0]
+    assert sent[-1] == b"0\r\n\r\n"
+    payload = b""
+    for chunk in sent[1:-1]:
+        size, _, rest = chunk.partition(b"\r\n")
+        assert len(rest) == int(size, 16) + 2
+        payload += rest[:-2]
+    assert zlib.decompress(payload) == b"y" * 500
+
+
+def test_not_modified():
+    validators = ('W/"abc"', 1000.0)
+    assert gwd.not_modified({"if-none-match": '"abc"'}, validators)
+    assert gwd.not_modified({"if-none-match": '"x", W/"abc"'}, validators)
+    assert not gwd.not_modified({"if-none-match": '"x"',
+                                 "if-modified-since": "Thu, 01 Jan 2099 00:00:00 GMT"}, validators)
+    assert gwd.not_modified({"if-modified-since": "Thu, 01 Jan 1970 00:16:40 GMT"}, validators)
+    assert not gwd.not_modified({"if-modified-since": "Thu, 01 Jan 1970 00:16:39 GMT"}, validators)
+    assert not gwd.not_modified({"if-modified-since": "garbage"}, validators)
+    assert not gwd.not_modified({}, validators)
+
+
+def _vconf(**kwargs):
+    return config.Config(output_conf=None, **kwargs)
+
+
+def test_page_validators_depend_on_base_and_request():
+    conf = _vconf(bname="b", env={"i": "3"}, request="/b?i=3", method="GET")
+    with patch('bin.gwd.database.with_shared_database', lambda path, k: 1000.0):
+        etag, t = gwd.page_validators(conf)
+        assert t == 1000.0
+        assert gwd.page_validators(_vconf(bname="b", env={"i": "4"}, request="/b?i=4",
+                                          method="GET"))[0] != etag
+        assert gwd.page_validators(_vconf(bname="b", env={"i": "3", "lang": "fr"}, request="/b?i=3&lang=fr",
+                                          method="GET"))[0] != etag
+        assert gwd.page_validators(_vconf(bname="b", env={"i": "3"}, request="/b?i=3", method="GET",
+                                          headers={"accept-language": "fr"}))[0] != etag
+        assert gwd.page_validators(_vconf(bname="b", method="POST")) is None
+        assert gwd.page_validators(_vconf(bname="b", method="GET")) is None
+    with patch('bin.gwd.database.with_shared_database', lambda path, k: 0.0):
+        assert gwd.page_validators(conf) is None
+
+
+def test_page_validators_skip_privileged_and_uncacheable_requests():
+    visitor = _vconf(bname="b", env={"i": "3"}, request="/b?i=3", method="GET")
+    with patch('bin.gwd.database.with_shared_database', return_value=1000.0) as last_change:
+        etag, _ = gwd.page_validators(visitor)
+        assert gwd.page_validators(_vconf(bname="b", env={"i": "3"}, request="/b?i=3", method="GET",
+                                          wizard=True)) is None
+        assert gwd.page_validators(_vconf(bname="b", env={"i": "3"}, request="/b?i=3", method="GET",
+                                          friend=True)) is None
+        assert gwd.page_validators(_vconf(bname="b", env={"i": "3"}, request="/b?i=3", method="GET",
+                                          headers={"authorization": "Basic d2l6OnB3"})) is None
+        assert gwd.page_validators(_vconf(bname="b", env={"m": "MOD_IND", "i": "3"}, method="GET")) is None
+        assert gwd.page_validators(_vconf(bname="b", env={"i": "3", "w": "pw"}, method="GET")) is None
+    assert last_change.call_count == 1
+    assert etag
+
+
+def test_handle_connection_answers_not_modified_without_rendering():
+    with (
+        patch('bin.request.treat_request') as mock_treat_request,
+        patch('bin.gwd.database.with_shared_database', lambda path, k: 1000.0)
+    ):
+        etag, _ = gwd.page_validators(_vconf(bname="b", env={"b": "b", "i": "1"},
+                                             request="/x?b=b&i=1", method="GET"))
+        mock_conn = MagicMock()
+        mock_conn.recv.side_effect = [
+            f"GET /x?b=b&i=1 HTTP/1.1\r\nIf-None-Match: {etag}\r\nConnection: close\r\n\r\n".encode()]
+
+        gwd.handle_connection(mock_conn, ("127.0.0.1", 1))
+
+        mock_treat_request.assert_not_called()
+        sent = mock_conn.sendall.call_args.args[0]
+        assert sent.startswith(b"HTTP/1.1 304 Not Modified\r\n")
+        assert f"ETag: {etag}".encode() in sent
+        assert b"Content-Length" not in sent
+
+
+def test_serve_page_uses_page_cache():
+    cache = page_cache.PageCache(1000)
+    calls = []
+
+    def render(conf):
+        calls.append(conf)
+        print("HTTP/1.1 200 OK\r\n\r\nperson", end="")
+
+    with (
+        patch('bin.request.treat_request', side_effect=render),
+        patch('bin.gwd.page_cache.cache', return_value=cache),
+        patch('bin.gwd.database.with_shared_database', lambda path, k: 0.0)
+    ):
+        for _ in range(2):
+            mock_conn = MagicMock()
+            mock_conn.recv.side_effect = [b"GET /x?b=b&i=1 HTTP/1.1\r\nConnection: close\r\n\r\n"]
+            gwd.handle_connection(mock_conn, ("127.0.0.1", 1))
+            assert mock_conn.sendall.call_args.args[0].endswith(b"\r\n\r\nperson")
+
+    assert len(calls) == 1
+    assert cache.hits == 1
+
+
+def test_serve_page_does_not_cache_errors():
+    cache = page_cache.PageCache(1000)
+    conf = _vconf(bname="b", env={"b": "b", "i": "1"}, method="GET")
+
+    with (
+        patch('bin.request.treat_request',
+              side_effect=lambda c: print("HTTP/1.1 404 Not Found\r\n\r\nno", end="")) as mock_treat,
+        patch('bin.gwd.page_cache.cache', return_value=cache)
+    ):
+        for _ in range(2):
+            stream = gwd.ResponseStream(MagicMock(), "HTTP/1.1", False)
+            gwd.begin_capture(stream)
+            try:
+                gwd.serve_page(conf, stream)
+            finally:
+                gwd.end_capture()
+
+    assert mock_treat.call_count == 2
+    assert cache.pages == {}
+
+
+def test_read_request_spools_large_body():
+    body = b"x" * 5000
+    mock_conn = MagicMock()
+    mock_conn.recv.side_effect = [
+        b"POST /?upload=1 HTTP/1.1\r\nContent-Length: 5000\r\n\r\n" + body[:1000],
+        body[1000:3000], body[3000:], b"GET / HTTP/1.1\r\n\r\n"]
+    pending = bytearray()
+
+    with patch('bin.gwd.max_inline_body', 100):
+        lines, headers, spooled = gwd.read_request(mock_conn, pending)
+
+    assert not isinstance(spooled, bytes)
+    assert spooled.read() == body
+    spooled.close()
+    assert gwd.read_request(mock_conn, pending)[0][0] == "GET / HTTP/1.1"
+
+
+def test_handle_connection_refuses_body_over_upload_limit():
+    mock_conn = MagicMock()
+    mock_conn.recv.side_effect = [b"POST /?m=UPLOAD HTTP/1.1\r\nContent-Length: 5000\r\n\r\n" + b"x" * 100]
+
+    with (
+        patch('bin.gwd.import_queue.max_upload_size', 1000),
+        patch('bin.gwd.logs.syslog'),
+        patch('bin.gwd.spool_body') as mock_spool,
+        patch('bin.gwd.serve_request') as mock_serve
+    ):
+        gwd.handle_connection(mock_conn, ("127.0.0.1", 1))
+
+    mock_spool.assert_not_called()
+    mock_serve.assert_not_called()
+    sent = mock_conn.sendall.call_args[0][0]
+    assert sent.startswith(b"HTTP/1.1 413 Payload Too Large\r\n")
+    assert b"Connection: close" in sent
+    mock_conn.close.assert_called_once()
+
+
+def test_serve_request_passes_and_closes_body_file():
+    seen = []
+
+    def treat(conf):
+        seen.append((conf.body_data, conf.body_file.read()))
+
+    body = io.BytesIO(b"payload")
+    with patch('bin.request.treat_request', side_effect=treat):
+        gwd.serve_request(["POST /?upload=1 HTTP/1.1"], {}, body, ("127.0.0.1", 1), MagicMock(), False)
+
+    assert seen == [(b"", b"payload")]
+    assert body.closed
+
+
+def test_handle_connection_aborts_stream_on_late_error():
+    def render(conf):
+        print("HTTP/1.1 200 OK\r\n\r\n", end="")
+        print("x" * 40, end="")
+        raise RuntimeError("boom")
+
+    with (
+        patch('bin.request.treat_request', side_effect=render),
+        patch('bin.gwd.response_chunk_size', 16)
+    ):
+        mock_conn = MagicMock()
+        mock_conn.recv.side_effect = [b"GET /a HTTP/1.1\r\n\r\nGET /b HTTP/1.1\r\n\r\n"]
+
+        gwd.handle_connection(mock_conn, ("127.0.0.1", 1))
+
+        sent = [c.args[0] for c in mock_conn.sendall.call_args_list]
+        assert b"Transfer-Encoding: chunked" in sent[0]
+        assert b"0\r\n\r\n" not in sent
+        assert not any(b"500" in s for s in sent)
+        mock_conn.close.assert_called_once()
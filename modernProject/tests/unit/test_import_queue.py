@@ -0,0 +1,152 @@
+import io
+import os
+import tempfile
+import time
+
+import pytest
+
+from bin import import_queue
+
+
+@pytest.fixture(autouse=True)
+def fresh_queue():
+    import_queue.reset()
+    yield
+    import_queue.reset()
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(import_queue, 'upload_chunk_size', 7)
+
+
+def test_copy_raw_upload_strips_headers_and_boundary(small_chunks):
+    out = io.BytesIO()
+    size = import_queue.copy_raw_upload(
+        io.BytesIO(b'Content-Disposition: form-data\r\n\r\n0 HEAD\r\n0 TRLR\r\n--boundary--'), out)
+    assert out.getvalue() == b'0 HEAD\r\n0 TRLR\r\n'
+    assert size == len(out.getvalue())
+
+    out = io.BytesIO()
+    import_queue.copy_raw_upload(io.BytesIO(b'0 HEAD\r\n0 TRLR\r\n'), out)
+    assert out.getvalue() == b'0 HEAD\r\n0 TRLR\r\n'
+
+
+def test_copy_multipart_file_streams_requested_field(small_chunks):
+    content = b'0 HEAD\r\n' + b'1 NOTE --b is not a boundary\r\n' * 20 + b'0 TRLR\r\n'
+    body = (b'--b\r\nContent-Disposition: form-data; name="other"\r\n\r\nvalue\r\n'
+            b'--b\r\nContent-Disposition: form-data; name="gedcom"; filename="fam.ged"\r\n\r\n'
+            + content + b'\r\n--b--\r\n')
+    out = io.BytesIO()
+    opened = []
+
+    def open_target(filename):
+        opened.append(filename)
+        return out
+
+    assert import_queue.copy_multipart_file(io.BytesIO(body), b'b', 'gedcom', open_target) == 'fam.ged'
+    assert opened == ['fam.ged']
+    assert out.getvalue() == content
+
+
+def test_copy_multipart_file_without_field_or_truncated():
+    body = b'--b\r\nContent-Disposition: form-data; name="other"\r\n\r\nvalue\r\n--b--\r\n'
+    assert import_queue.copy_multipart_file(io.BytesIO(body), b'b', 'gedcom', lambda f: io.BytesIO()) is None
+    body = b'--b\r\nContent-Disposition: form-data; name="gedcom"; filename="x.ged"\r\n\r\n0 HEAD'
+    assert import_queue.copy_multipart_file(io.BytesIO(body), b'b', 'gedcom', lambda f: io.BytesIO()) is None
+
+
+def test_copies_stop_past_max_upload_size(small_chunks, monkeypatch):
+    monkeypatch.setattr(import_queue, 'max_upload_size', 20)
+    content = b'0 HEAD\r\n' + b'1 NOTE x\r\n' * 5 + b'0 TRLR\r\n'
+    out = io.BytesIO()
+    with pytest.raises(import_queue.UploadTooLarge) as raised:
+        import_queue.copy_raw_upload(io.BytesIO(content), out)
+    assert raised.value.limit == 20
+    assert len(out.getvalue()) <= 20
+
+    body = b'--b\r\nContent-Disposition: form-data; name="gedcom"; filename="x.ged"\r\n\r\n' + content + b'\r\n--b--\r\n'
+    out = io.BytesIO()
+    with pytest.raises(import_queue.UploadTooLarge):
+        import_queue.copy_multipart_file(io.BytesIO(body), b'b', 'gedcom', lambda f: out)
+    assert len(out.getvalue()) <= 20
+
+    monkeypatch.setattr(import_queue, 'max_upload_size', 0)
+    out = io.BytesIO()
+    assert import_queue.copy_raw_upload(io.BytesIO(content), out) == len(content)
+
+
+def test_valid_base_name():
+    assert import_queue.valid_base_name("my_base-2")
+    assert not import_queue.valid_base_name("../etc")
+    assert not import_queue.valid_base_name("")
+
+
+def _wait(job):
+    for _ in range(200):
+        if job.state in (import_queue.DONE, import_queue.FAILED):
+            return
+        time.sleep(0.01)
+
+
+def test_queue_runs_conversion_with_progress(monkeypatch):
+    def convert(ged_path, out_path, jobs, parse_bar=None, write_bar=None):
+        parse_bar.progress(5, 10)
+        write_bar.progress(1, 4)
+        os.makedirs(out_path)
+
+    monkeypatch.setattr('bin.ged2gwb.convert', convert)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        open(os.path.join(tmpdir, 'fam.ged'), 'w').close()
+        job = import_queue.ensure_base(tmpdir, 'fam')
+        assert job is not None
+        _wait(job)
+        assert job.state == import_queue.DONE
+        assert job.stage == "writing"
+        assert job.percent() == 100
+        assert os.path.isdir(os.path.join(tmpdir, 'fam.gwb'))
+        assert not os.path.exists(os.path.join(tmpdir, 'fam.gwb' + import_queue.importing_suffix))
+        assert import_queue.ensure_base(tmpdir, 'fam') is None
+
+
+def test_failed_import_is_reported_until_file_changes(monkeypatch):
+    def convert(ged_path, out_path, jobs, parse_bar=None, write_bar=None):
+        os.makedirs(out_path)
+        raise ValueError("bad gedcom")
+
+    monkeypatch.setattr('bin.ged2gwb.convert', convert)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ged = os.path.join(tmpdir, 'fam.ged')
+        open(ged, 'w').close()
+        os.utime(ged, (1, 1))
+        job = import_queue.ensure_base(tmpdir, 'fam')
+        _wait(job)
+        assert job.state == import_queue.FAILED
+        assert job.error == "bad gedcom"
+        assert not os.path.exists(os.path.join(tmpdir, 'fam.gwb' + import_queue.importing_suffix))
+        assert import_queue.ensure_base(tmpdir, 'fam') is job
+
+        os.utime(ged, None)
+        retry = import_queue.ensure_base(tmpdir, 'fam')
+        assert retry is not job
+        _wait(retry)
+
+
+def test_submit_returns_pending_job():
+    q = import_queue.ImportQueue()
+    q.worker = type('Alive', (), {'is_alive': lambda self: True})()
+    job = q.submit('fam', 'fam.ged', 'fam.gwb')
+    assert q.submit('fam', 'fam.ged', 'fam.gwb') is job
+    assert q.status('fam') is job
+    assert job.state == import_queue.QUEUED
+    assert job.percent() == 0
+
+
+def test_ensure_base_rejects_invalid_names():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base_dir = os.path.join(tmpdir, 'bases')
+        os.mkdir(base_dir)
+        open(os.path.join(tmpdir, 'x.ged'), 'w').close()
+        assert import_queue.ensure_base(base_dir, '../x') is None
+        assert import_queue.import_queue().status('../x') is None
+        assert not os.path.exists(os.path.join(tmpdir, 'x.gwb'))
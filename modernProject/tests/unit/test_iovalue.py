@@ -294,3 +294,124 @@ def test_boundary_values():
         buf.seek(0)
         result = input_value(buf)
         assert result == val, f"Failed for value {val}"
+
+
+def test_buffer_reader_matches_bytesio():
+    from lib.iovalue import BufferReader
+    data = io.BytesIO()
+    value = [1, -300, b"x" * 40, {'tag': 2, 'fields': [70000, b""]}]
+    output(data, value)
+
+    reader = BufferReader(b"pad" + data.getvalue(), 3)
+    assert input_value(reader) == value
+    assert reader.tell() == 3 + len(data.getvalue())
+    reader.seek(-1, 2)
+    assert reader.read() == data.getvalue()[-1:]
+    assert reader.read(5) == b""
+
+
+def test_buffer_decoder_matches_stream_decoder():
+    from lib.iovalue import input_loop, in_channel_funs, input_value_from_buffer
+    value = [0, 63, 64, -1, -128, 127, -32768, 32767, -70000, 1 << 29,
+             b"", b"a" * 31, b"b" * 32, b"c" * 300,
+             [None, [], {'tag': 3, 'fields': [1, b"z"]}],
+             {'tag': 1, 'fields': list(range(20))}]
+    buf = io.BytesIO()
+    output(buf, value)
+    data = buf.getvalue()
+
+    expected = input_loop(in_channel_funs, io.BytesIO(data))
+    decoded, end = input_value_from_buffer(memoryview(data))
+
+    assert decoded == expected
+    assert end == len(data)
+    assert isinstance(decoded[10], bytes)
+
+
+def test_buffer_decoder_truncated_string():
+    from lib.iovalue import input_value_from_buffer
+    with pytest.raises(EOFError):
+        input_value_from_buffer(bytes([PREFIX_SMALL_STRING + 5]) + b"ab")
+    with pytest.raises(EOFError):
+        input_value_from_buffer(bytes([CODE_INT8]))
+
+
+def test_input_value_advances_bytesio():
+    buf = io.BytesIO()
+    output(buf, b"first")
+    output(buf, [1, 2])
+    buf.seek(0)
+
+    assert input_value(buf) == b"first"
+    assert input_value(buf) == [1, 2]
+    with pytest.raises(EOFError):
+        input_value(buf)
+
+
+def _stream_encode(value):
+    from lib.iovalue import output_loop, out_channel_funs
+    buf = io.BytesIO()
+    output_loop(out_channel_funs, buf, value)
+    return buf.getvalue()
+
+
+def test_encoder_matches_stream_encoder():
+    from lib.iovalue import encode_value
+    values = [0, 63, 64, -1, -129, 40000, -(1 << 31), 1 << 40, -(1 << 40),
+              b"", b"x" * 31, b"y" * 32, b"z" * 256, "héllo", None, (),
+              list(range(8)), {'tag': 20, 'fields': [1]}, {'tag': 2, 'fields': list(range(9))}]
+    for value in values:
+        buf = bytearray()
+        encode_value(buf, value)
+        assert bytes(buf) == _stream_encode(value), value
+
+
+def test_value_writer_offsets_and_flushing():
+    from lib.iovalue import ValueWriter
+    items = [b"a" * n for n in range(50)] + [[1, 2], 70000]
+    out = io.BytesIO()
+    out.write(b"PREFIX")
+
+    writer = ValueWriter(out, out.tell(), flush_size=64)
+    offsets = writer.output_array(items)
+    end = writer.tell()
+    writer.flush()
+
+    data = out.getvalue()
+    assert data[6:] == _stream_encode(items)
+    assert end == len(data)
+    for offset, item in zip(offsets, items):
+        assert input_value(io.BytesIO(data[offset:])) == item
+    assert offsets[0] == 6 + array_header_size(len(items))
+
+
+def test_value_writer_encoded_array_matches_output_array():
+    from lib.iovalue import ValueWriter, encode_value
+    items = [b"a" * n for n in range(40)] + [[1, 2], 70000]
+    chunks = []
+    for start in range(0, len(items), 16):
+        buf = bytearray()
+        sizes = []
+        for item in items[start:start + 16]:
+            pos = len(buf)
+            encode_value(buf, item)
+            sizes.append(len(buf) - pos)
+        chunks.append((bytes(buf), sizes))
+
+    plain = io.BytesIO()
+    writer = ValueWriter(plain, 0, flush_size=64)
+    plain_offsets = writer.output_array(items)
+    writer.flush()
+
+    encoded = io.BytesIO()
+    writer = ValueWriter(encoded, 0, flush_size=64)
+    encoded_offsets = writer.output_encoded_array(len(items), chunks)
+    writer.flush()
+
+    assert encoded.getvalue() == plain.getvalue()
+    assert encoded_offsets == plain_offsets
+
+
+def test_size_matches_encoded_length():
+    value = {'tag': 1, 'fields': [b"abc", [1, -5, 1 << 20]]}
+    assert size(value) == len(_stream_encode(value))
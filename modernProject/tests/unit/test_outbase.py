@@ -255,6 +255,52 @@ def test_dsk_person_misc_names():
     assert len(names) > 0
     assert "John Smith" in names
 
+def test_base_writer_offsets_and_header():
+    oc = io.BytesIO()
+    oc_acc = io.BytesIO()
+    writer = outbase.BaseWriter(oc, oc_acc)
+    writer.output_header(2, 0, 0, "")
+    writer.output_array(iter([b"first", [1, 2]]), 2)
+    writer.output_array(["", "?", "x"])
+    writer.finish(3)
+
+    data = oc.getvalue()
+    ic = io.BytesIO(data)
+    assert ic.read(8) == database.MAGIC_GNWB0024
+    assert [outbase.input_binary_int(ic) for _ in range(3)] == [2, 0, 3]
+    positions = [outbase.input_binary_int(ic) for _ in range(2)]
+    assert iovalue.input_value(io.BytesIO(data[positions[0]:])) == [b"first", [1, 2]]
+    assert iovalue.input_value(io.BytesIO(data[positions[1]:])) == [b"", b"?", b"x"]
+
+    acc = oc_acc.getvalue()
+    offsets = [database.ACC_OFFSET.unpack_from(acc, k * 4)[0] for k in range(len(acc) // 4)]
+    assert len(offsets) == 5
+    assert iovalue.input_value(io.BytesIO(data[offsets[1]:])) == [1, 2]
+    assert iovalue.input_value(io.BytesIO(data[offsets[4]:])) == b"x"
+
+def test_outbase_output_round_trips_records():
+    from tests.gwb_generator import create_minimal_gwb
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        secure.add_assets(tmpdir)
+        source_gwb = create_minimal_gwb(tmpdir, "source")
+        output_gwb = os.path.join(tmpdir, "output.gwb")
+
+        def arrays(base):
+            data = base.data
+            return [[a.get(i) for i in range(a.len)]
+                    for a in (data.persons, data.ascends, data.unions, data.families,
+                              data.couples, data.descends, data.strings)]
+
+        def write(base):
+            expected = arrays(base)
+            base.data.bdir = output_gwb
+            outbase.output(base)
+            return expected
+
+        expected = database.with_database(source_gwb, write)
+        assert database.with_database(output_gwb, arrays) == expected
+
 def test_outbase_output_creates_files():
     from lib import database
     from tests.gwb_generator import create_minimal_gwb
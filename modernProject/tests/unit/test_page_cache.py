@@ -0,0 +1,98 @@
+import os
+import tempfile
+from types import SimpleNamespace
+
+from lib import page_cache
+
+
+def _conf(**kwargs):
+    values = dict(method='GET', bname='b', env={'b': 'b', 'i': '3'}, wizard=False, friend=False)
+    values.update(kwargs)
+    return SimpleNamespace(**values)
+
+
+def test_key_covers_request_and_bypasses_privileged_sessions():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = page_cache.PageCache(1000)
+        path = os.path.join(tmpdir, 'b')
+        key = cache.key(_conf(), path)
+        assert key is not None
+        assert cache.key(_conf(env={'b': 'b', 'i': '4'}), path) != key
+        assert cache.key(_conf(env={'b': 'b', 'i': '3', 'lang': 'fr'}), path) != key
+        assert cache.key(_conf(env={'b': 'b', 'i': '3', 'm': 'A', 'v': '5'}), path) != \
+            cache.key(_conf(env={'b': 'b', 'i': '3', 'm': 'A', 'v': '6'}), path)
+        assert cache.key(_conf(wizard=True), path) is None
+        assert cache.key(_conf(friend=True), path) is None
+        assert cache.key(_conf(headers={'authorization': 'Basic d2l6OnB3'}), path) is None
+        assert cache.key(_conf(headers={'cookie': 'session=1'}), path) is None
+        assert cache.key(_conf(method='POST'), path) is None
+        assert cache.key(_conf(env={'b': 'b'}), path) is None
+        assert cache.key(_conf(env={'b': 'b', 'm': 'S', 'n': 'x'}), path) is None
+        assert cache.key(_conf(env={'b': 'b', 'i': '3', 'junk': '1'}), path) is None
+
+        os.mkdir(path + '.gwb')
+        with open(os.path.join(path + '.gwb', 'patches'), 'wb') as f:
+            f.write(b'x')
+        assert cache.key(_conf(), path) != key
+
+
+def test_lru_eviction_by_size():
+    cache = page_cache.PageCache(10)
+    cache.put(('a',), 'aaaa')
+    cache.put(('b',), 'bbbb')
+    assert cache.get(('a',)) == 'aaaa'
+    cache.put(('c',), 'cccc')
+    assert cache.get(('b',)) is None
+    assert cache.get(('a',)) == 'aaaa'
+    assert cache.get(('c',)) == 'cccc'
+    cache.put(('d',), 'x' * 11)
+    assert cache.get(('d',)) is None
+    assert cache.size == 8
+    cache.put(('e',), '\u00e9' * 6)
+    assert cache.get(('e',)) is None
+    assert cache.size == 8
+
+
+def test_disk_tier_and_invalidate():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = page_cache.PageCache(100, os.path.join(tmpdir, 'cache'))
+        bdir = os.path.join(tmpdir, 'b.gwb')
+        key = cache.key(_conf(), bdir)
+        cache.put(key, 'page\r\n')
+        cache.clear()
+        assert cache.get(key) == 'page\r\n'
+        assert cache.hits == 1
+
+        cache.invalidate(bdir)
+        assert cache.generation(os.path.abspath(bdir)) == 1
+        assert cache.get(key) is None
+        assert cache.key(_conf(), bdir) != key
+        assert os.listdir(os.path.join(tmpdir, 'cache')) == []
+        assert cache.disk_size == 0
+
+
+def test_disk_tier_byte_budget():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        disk_dir = os.path.join(tmpdir, 'cache')
+        cache = page_cache.PageCache(100, disk_dir, disk_max_bytes=10)
+        cache.put(('b', 1), 'aaaa')
+        os.utime(cache._disk_path(('b', 1)), (1, 1))
+        cache.put(('b', 2), 'bbbb')
+        os.utime(cache._disk_path(('b', 2)), (2, 2))
+        cache.put(('b', 3), '\u00e9\u00e9')
+        cache.put(('b', 4), 'x' * 11)
+        assert cache.disk_size == 8
+        assert not os.path.exists(cache._disk_path(('b', 1)))
+        assert not os.path.exists(cache._disk_path(('b', 4)))
+        cache.clear()
+        assert cache.get(('b', 2)) == 'bbbb'
+        assert cache.get(('b', 3)) == '\u00e9\u00e9'
+        assert page_cache.PageCache(100, disk_dir).disk_size == 8
+
+
+def test_module_cache_configuration():
+    assert page_cache.configure(0) is None
+    page_cache.invalidate('anything')
+    cache = page_cache.configure(100)
+    assert page_cache.cache() is cache
+    page_cache.configure(0)
@@ -147,3 +147,11 @@ def test_progress_bar_throttling_and_output():
 
     finally:
         sys.stderr = old_stderr
+
+
+def test_progress_bar_reports_every_update():
+    seen = []
+    bar = ProgressBar(disabled=True, report=lambda current, total: seen.append((current, total)))
+    bar.progress(1, 4)
+    bar.progress(2, 4)
+    assert seen == [(1, 4), (2, 4)]
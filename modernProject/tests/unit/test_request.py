@@ -3,13 +3,22 @@ import os
 import tempfile
 from pathlib import Path
 
+import pytest
+
 sys.path.insert(0, str(Path(__file__).parent.parent / 'bin'))
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from bin import request
+from bin import import_queue, request
 from lib import config, driver, secure, sosa
 
 
+@pytest.fixture(autouse=True)
+def no_import_jobs(monkeypatch):
+    monkeypatch.setattr(import_queue.ImportQueue, 'run', lambda self, job: None)
+    yield
+    import_queue.reset()
+
+
 def test_imports():
     assert hasattr(request, 'treat_request')
     assert hasattr(request, 'w_base')
@@ -832,6 +841,50 @@ def test_handle_relation_page():
     assert "Relationship" in output
 
 
+def test_handle_relation_page_with_persons():
+    from types import SimpleNamespace
+    from unittest.mock import patch, MagicMock
+
+    output_buffer = []
+    output_conf = config.OutputConf(
+        status=lambda s: None,
+        header=lambda h: None,
+        body=lambda b: output_buffer.append(b),
+        flush=lambda: None
+    )
+    conf = config.Config(output_conf=output_conf, bname='test', env={'i': '6', 'i1': '7'})
+    engine = MagicMock()
+    engine.relationship.return_value = (0.0625, (0,))
+    persons = {'': SimpleNamespace(key_index=6), '1': SimpleNamespace(key_index=7)}
+
+    with patch('bin.request.w_base', side_effect=lambda none, cb, c, bname: cb(c, 'base')), \
+         patch('bin.request.util.find_person_in_env', side_effect=lambda c, b, suff: persons[suff]), \
+         patch('bin.request.consang.relationship_engine', return_value=engine), \
+         patch('bin.request.person_link', side_effect=lambda c, b, ip: f"P{ip}"):
+        request.handle_relation_page(conf)
+
+    output = ''.join(output_buffer)
+    engine.relationship.assert_called_once_with(6, 7)
+    assert "P6" in output and "P7" in output
+    assert "6.25%" in output
+    assert "<li>P0</li>" in output
+
+
+def test_person_link_escapes_names():
+    from unittest.mock import patch
+
+    conf = config.Config(output_conf=None, bname='a"b')
+    with patch('bin.request.driver.poi', side_effect=lambda b, ip: ip), \
+         patch('bin.request.driver.p_first_name', return_value=b'<script>'), \
+         patch('bin.request.driver.p_surname', return_value='O\'Brien & co'):
+        link = request.person_link(conf, 'base', 3)
+
+    assert "<script>" not in link
+    assert "&#60;script&#62;" in link
+    assert "O&#39;Brien &#38; co" in link
+    assert 'href="?b=a&#34;b&amp;i=3"' in link
+
+
 def test_handle_search_page():
     output_buffer = []
 
@@ -988,3 +1041,160 @@ def test_select_std_eq():
 
     result = request.select_std_eq(conf, None, [], "test")
     assert isinstance(result, list)
+
+
+def _capture_conf(**kwargs):
+    output_buffer = []
+    status_list = []
+    output_conf = config.OutputConf(
+        status=status_list.append,
+        header=lambda h: output_buffer.append(f"HEADER:{h}"),
+        body=output_buffer.append,
+        flush=lambda: None
+    )
+    return config.Config(output_conf=output_conf, **kwargs), status_list, output_buffer
+
+
+def test_handle_gedcom_upload_streams_body_file():
+    import io
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original_base_dir = secure.base_dir
+        secure.set_base_dir(tmpdir)
+        try:
+            gedcom_content = b'0 HEAD\r\n' + b'1 NOTE x\r\n' * 10000 + b'0 TRLR\r\n'
+            body = io.BytesIO(b'--XX\r\nContent-Disposition: form-data; name="gedcom"; filename="big.ged"\r\n\r\n'
+                              + gedcom_content + b'\r\n--XX--\r\n')
+            conf, status_list, output_buffer = _capture_conf(
+                method='POST', headers={'content-type': 'multipart/form-data; boundary=XX'}, body_file=body)
+
+            request.handle_gedcom_upload(conf)
+
+            assert 303 in status_list
+            assert "HEADER:Location: /?b=big&m=IMPORT" in output_buffer
+            assert (Path(tmpdir) / "big.ged").read_bytes() == gedcom_content
+            assert not list(Path(tmpdir).glob("*.ged.part"))
+            assert import_queue.import_queue().status("big").state == import_queue.QUEUED
+        finally:
+            secure.set_base_dir(original_base_dir())
+
+
+def test_handle_gedcom_upload_rejects_bad_name():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original_base_dir = secure.base_dir
+        secure.set_base_dir(tmpdir)
+        try:
+            conf, status_list, output_buffer = _capture_conf(
+                method='POST', headers={'content-disposition': 'filename="a b.ged"'}, body_data=b'0 HEAD\r\n')
+
+            request.handle_gedcom_upload(conf)
+
+            assert 400 in status_list
+            assert os.listdir(tmpdir) == []
+        finally:
+            secure.set_base_dir(original_base_dir())
+
+
+def test_handle_gedcom_upload_refuses_oversized_upload(monkeypatch):
+    monkeypatch.setattr(import_queue, 'max_upload_size', 64)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original_base_dir = secure.base_dir
+        secure.set_base_dir(tmpdir)
+        try:
+            body = b'0 HEAD\r\n' + b'1 NOTE x\r\n' * 100 + b'0 TRLR\r\n'
+            conf, status_list, output_buffer = _capture_conf(
+                method='POST', headers={'content-disposition': 'filename="big.ged"'}, body_data=body)
+
+            request.handle_gedcom_upload(conf)
+
+            assert status_list == [413]
+            assert any("the limit is 64 bytes" in line for line in output_buffer)
+            assert os.listdir(tmpdir) == []
+            assert import_queue.import_queue().status("big") is None
+        finally:
+            secure.set_base_dir(original_base_dir())
+
+
+def test_handle_gedcom_upload_uses_distinct_part_files():
+    import io
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original_base_dir = secure.base_dir
+        secure.set_base_dir(tmpdir)
+        try:
+            inner = []
+            outer = io.BytesIO(b'0 HEAD\r\n1 NOTE outer\r\n0 TRLR\r\n')
+            read = outer.read
+
+            def read_during_other_upload(size=-1):
+                if not inner:
+                    inner.extend(_capture_conf(
+                        method='POST', headers={'content-disposition': 'filename="fam.ged"'},
+                        body_data=b'0 HEAD\r\n1 NOTE inner\r\n0 TRLR\r\n'))
+                    assert len(list(Path(tmpdir).glob("fam.*.ged.part"))) == 1
+                    request.handle_gedcom_upload(inner[0])
+                return read(size)
+
+            outer.read = read_during_other_upload
+            conf, status_list, _ = _capture_conf(
+                method='POST', headers={'content-disposition': 'filename="fam.ged"'}, body_file=outer)
+
+            request.handle_gedcom_upload(conf)
+
+            assert 303 in inner[1]
+            assert 303 in status_list
+            assert (Path(tmpdir) / "fam.ged").read_bytes() == b'0 HEAD\r\n1 NOTE outer\r\n0 TRLR\r\n'
+            assert not list(Path(tmpdir).glob("*.ged.part"))
+        finally:
+            secure.set_base_dir(original_base_dir())
+
+
+def test_import_status_page():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original_base_dir = secure.base_dir
+        secure.set_base_dir(tmpdir)
+        try:
+            conf, status_list, output_buffer = _capture_conf(bname="fam", env={"m": "IMPORT"})
+            request.treat_request(conf)
+            assert 400 in status_list
+
+            (Path(tmpdir) / "fam.ged").write_bytes(b'0 HEAD\r\n0 TRLR\r\n')
+            conf, status_list, output_buffer = _capture_conf(bname="fam", env={"m": "IMPORT"})
+            request.treat_request(conf)
+            output = ''.join(output_buffer)
+            assert "refresh" in output
+            assert "Waiting to start" in output
+
+            job = import_queue.import_queue().status("fam")
+            job.state = import_queue.RUNNING
+            job.report("parsing")(3, 4)
+            conf, status_list, output_buffer = _capture_conf(bname="fam", env={})
+            request.default_person_page(conf)
+            assert "Parsing: 75%" in ''.join(output_buffer)
+
+            job.state = import_queue.DONE
+            (Path(tmpdir) / "fam.gwb").mkdir()
+            conf, status_list, output_buffer = _capture_conf(bname="fam", env={"m": "IMPORT"})
+            request.treat_request(conf)
+            output = ''.join(output_buffer)
+            assert "refresh" not in output
+            assert "?b=fam" in output
+        finally:
+            secure.set_base_dir(original_base_dir())
+
+
+def test_import_status_rejects_and_escapes_names():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original_base_dir = secure.base_dir
+        secure.set_base_dir(tmpdir)
+        try:
+            conf, status_list, output_buffer = _capture_conf(bname="../../elsewhere/x", env={"m": "IMPORT"})
+            request.treat_request(conf)
+            assert 400 in status_list
+            assert "Invalid database name" in ''.join(output_buffer)
+
+            conf, status_list, output_buffer = _capture_conf(bname="<b>", env={})
+            request.print_import_status(conf, None)
+            output = ''.join(output_buffer)
+            assert "<b>" not in output
+            assert "&#60;b&#62;" in output
+        finally:
+            secure.set_base_dir(original_base_dir())
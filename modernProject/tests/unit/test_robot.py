@@ -11,6 +11,23 @@ sys.path.insert(0, str(Path(__file__).parent.parent / 'bin'))
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 
+@pytest.fixture(autouse=True)
+def fresh_limiter():
+    robot.reset()
+    yield
+    robot.reset()
+
+
+def _conf(user="user", **kwargs):
+    output_conf = config.OutputConf(
+        status=lambda x: None,
+        header=lambda x: None,
+        body=lambda x: None,
+        flush=lambda: None
+    )
+    return config.Config(output_conf=output_conf, user=user, bname="b", **kwargs)
+
+
 def test_robot_check_wizard_counts_with_existing_who():
     from bin.robot import Excl, Who, UserType
 
@@ -84,3 +101,68 @@ def test_robot_check_initial_creation_branch():
         normal, wizard, friend, wlist = robot.check(tm=100.0, from_addr="newaddr", max_call=1000, sec=10000, conf=conf, suicide=False)
         assert normal == 0 and wizard == 0 and friend == 0
         assert wlist == []
+
+
+def test_limiter_window_accumulates_across_requests():
+    limiter = robot.RateLimiter(robot.Excl(excl=[], who={}, max_conn=(0, "")), '/dev/null')
+    conf = _conf()
+    for tm in range(5):
+        limiter.check(float(tm), "a", 5, 10, conf, False)
+    assert limiter.who["a"].nb_connect == 5
+
+    limiter.check(20.0, "a", 5, 10, conf, False)
+    assert limiter.who["a"].nb_connect == 1
+    assert limiter.max_conn == (5, "a")
+
+    for tm in range(21, 25):
+        limiter.check(float(tm), "a", 5, 10, conf, False)
+    with pytest.raises(SystemExit):
+        limiter.check(25.0, "a", 5, 10, conf, False)
+    assert limiter.excl == {"a": 6}
+    assert "a" not in limiter.who
+    with pytest.raises(SystemExit):
+        limiter.check(100.0, "a", 5, 10, conf, False)
+
+
+def test_limiter_counts_displayed_robots():
+    limiter = robot.RateLimiter(robot.Excl(excl=[], who={}, max_conn=(0, "")), '/dev/null')
+    for tm in range(robot.min_disp_req):
+        result = limiter.check(float(tm), "w", 1000, 1000, _conf("wiz", wizard=True), False)
+        limiter.check(float(tm), "n", 1000, 1000, _conf(), False)
+    assert result[:3] == (0, 1, 0)
+    assert result[3] == [("wiz", float(robot.min_disp_req - 1))]
+    assert limiter.check(5000.0, "n", 1000, 1000, _conf(), False)[:3] == (0, 1, 0)
+
+
+def test_limiter_snapshot_is_written_by_flush(tmp_path):
+    robot_file = str(tmp_path / "gwd_robot.txt")
+    limiter = robot.RateLimiter(robot.Excl(excl=[("old", 9)], who={}, max_conn=(0, "")), robot_file)
+    limiter.flush()
+    assert not (tmp_path / "gwd_robot.txt").exists()
+
+    with pytest.raises(SystemExit):
+        limiter.check(1.0, "old", 5, 10, _conf(), True)
+    with um.patch('bin.robot.robot_error'):
+        limiter.check(1.0, "b", 0, 10, _conf(), False)
+    limiter.flush()
+    assert not limiter.dirty
+    with open(robot_file) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == robot.magic_robot
+    assert "b 1" in lines and "old 9" not in lines
+
+
+def test_limiter_prune_forgets_idle_addresses():
+    limiter = robot.RateLimiter(robot.Excl(excl=[], who={}, max_conn=(0, "")), '/dev/null')
+    limiter.check(1.0, "idle", 100, 10, _conf(), False)
+    limiter.check(50.0, "busy", 100, 10, _conf(), False)
+    limiter.prune(55.0)
+    assert list(limiter.who) == ["busy"]
+
+
+def test_check_reuses_limiter():
+    with um.patch('bin.robot.robot_excl', return_value=(robot.Excl(excl=[], who={}, max_conn=(0, "")), '/dev/null')) as excl:
+        robot.check(1.0, "a", 100, 10, _conf(), False)
+        robot.check(2.0, "a", 100, 10, _conf(), False)
+        assert excl.call_count == 1
+    assert robot.limiter().who["a"].nb_connect == 2
@@ -317,27 +317,6 @@ def test_get_date_formatting():
     assert all(part.isdigit() for part in parts)
 
 
-def test_convert_ged_if_needed_no_files():
-    with tempfile.TemporaryDirectory() as tmpdir:
-        result = srcfile_display.convert_ged_if_needed(tmpdir, "nonexistent")
-        assert result == False
-
-
-def test_convert_ged_if_needed_gwb_exists():
-    with tempfile.TemporaryDirectory() as tmpdir:
-        (Path(tmpdir) / "test.gwb").mkdir()
-        result = srcfile_display.convert_ged_if_needed(tmpdir, "test")
-        assert result == True
-
-
-def test_convert_ged_if_needed_with_ged():
-    with tempfile.TemporaryDirectory() as tmpdir:
-        ged_file = Path(tmpdir) / "test.ged"
-        ged_file.write_text("0 HEAD\n1 SOUR Test\n0 TRLR\n")
-        result = srcfile_display.convert_ged_if_needed(tmpdir, "test")
-        assert isinstance(result, bool)
-
-
 def test_list_databases_with_ged():
     with tempfile.TemporaryDirectory() as tmpdir:
         (Path(tmpdir) / "test1.ged").touch()
@@ -17,6 +17,13 @@ class MockPerson:
     parents: Optional[int] = None
 
 
+@pytest.fixture(autouse=True)
+def mock_driver_names(monkeypatch):
+    monkeypatch.setattr('lib.gutil.driver.p_first_name', lambda base, p: base.p_first_name(p))
+    monkeypatch.setattr('lib.gutil.driver.p_surname', lambda base, p: base.p_surname(p))
+    monkeypatch.setattr('lib.gutil.driver.get_occ', lambda p: 0)
+
+
 @dataclass
 class MockCouple:
     father: int
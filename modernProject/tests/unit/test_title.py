@@ -184,7 +184,7 @@ def test_select_title_place_absolute(monkeypatch):
         mapping = {10: "Duke", 11: "Count", 20: "London", 21: "Paris"}
         return mapping.get(istr, "")
 
-    monkeypatch.setattr("lib.title.driver.ipers", mock_ipers)
+    monkeypatch.setattr("lib.title.driver.nb_of_persons", lambda base: len(mock_ipers(base)))
     monkeypatch.setattr("lib.title.driver.poi", mock_poi)
     monkeypatch.setattr("lib.title.driver.nobtitles", mock_nobtitles)
     monkeypatch.setattr("lib.title.driver.sou", mock_sou)
@@ -214,7 +214,7 @@ def test_select_title_place_not_absolute(monkeypatch):
         mapping = {10: "Duke", 11: "Count", 20: "London", 21: "Paris"}
         return mapping.get(istr, "")
 
-    monkeypatch.setattr("lib.title.driver.ipers", mock_ipers)
+    monkeypatch.setattr("lib.title.driver.nb_of_persons", lambda base: len(mock_ipers(base)))
     monkeypatch.setattr("lib.title.driver.poi", mock_poi)
     monkeypatch.setattr("lib.title.driver.nobtitles", mock_nobtitles)
     monkeypatch.setattr("lib.title.driver.sou", mock_sou)
@@ -243,7 +243,7 @@ def test_select_all_with_place(monkeypatch):
         mapping = {10: "Duke", 11: "Count", 20: "London", 21: "Paris"}
         return mapping.get(istr, "")
 
-    monkeypatch.setattr("lib.title.driver.ipers", mock_ipers)
+    monkeypatch.setattr("lib.title.driver.nb_of_persons", lambda base: len(mock_ipers(base)))
     monkeypatch.setattr("lib.title.driver.poi", mock_poi)
     monkeypatch.setattr("lib.title.driver.nobtitles", mock_nobtitles)
     monkeypatch.setattr("lib.title.driver.sou", mock_sou)
@@ -271,7 +271,7 @@ def test_select_title_absolute(monkeypatch):
         mapping = {10: "Duke", 20: "London", 21: "Paris"}
         return mapping.get(istr, "")
 
-    monkeypatch.setattr("lib.title.driver.ipers", mock_ipers)
+    monkeypatch.setattr("lib.title.driver.nb_of_persons", lambda base: len(mock_ipers(base)))
     monkeypatch.setattr("lib.title.driver.poi", mock_poi)
     monkeypatch.setattr("lib.title.driver.nobtitles", mock_nobtitles)
     monkeypatch.setattr("lib.title.driver.sou", mock_sou)
@@ -299,7 +299,7 @@ def test_select_title_not_absolute(monkeypatch):
         mapping = {10: "Duke", 20: "London"}
         return mapping.get(istr, "")
 
-    monkeypatch.setattr("lib.title.driver.ipers", mock_ipers)
+    monkeypatch.setattr("lib.title.driver.nb_of_persons", lambda base: len(mock_ipers(base)))
     monkeypatch.setattr("lib.title.driver.poi", mock_poi)
     monkeypatch.setattr("lib.title.driver.nobtitles", mock_nobtitles)
     monkeypatch.setattr("lib.title.driver.sou", mock_sou)
@@ -328,7 +328,7 @@ def test_select_place(monkeypatch):
         mapping = {10: "Duke", 11: "Count", 20: "London"}
         return mapping.get(istr, "")
 
-    monkeypatch.setattr("lib.title.driver.ipers", mock_ipers)
+    monkeypatch.setattr("lib.title.driver.nb_of_persons", lambda base: len(mock_ipers(base)))
     monkeypatch.setattr("lib.title.driver.poi", mock_poi)
     monkeypatch.setattr("lib.title.driver.nobtitles", mock_nobtitles)
     monkeypatch.setattr("lib.title.driver.sou", mock_sou)
@@ -358,7 +358,7 @@ def test_select_all(monkeypatch):
         mapping = {20: "London", 21: "Paris"}
         return mapping.get(istr, "")
 
-    monkeypatch.setattr("lib.title.driver.ipers", mock_ipers)
+    monkeypatch.setattr("lib.title.driver.nb_of_persons", lambda base: len(mock_ipers(base)))
     monkeypatch.setattr("lib.title.driver.poi", mock_poi)
     monkeypatch.setattr("lib.title.driver.nobtitles", mock_nobtitles)
     monkeypatch.setattr("lib.title.driver.sou", mock_sou)
@@ -383,7 +383,7 @@ def test_select_all_with_counter(monkeypatch):
     def mock_sou(base, istr):
         return "Duke"
 
-    monkeypatch.setattr("lib.title.driver.ipers", mock_ipers)
+    monkeypatch.setattr("lib.title.driver.nb_of_persons", lambda base: len(mock_ipers(base)))
     monkeypatch.setattr("lib.title.driver.poi", mock_poi)
     monkeypatch.setattr("lib.title.driver.nobtitles", mock_nobtitles)
     monkeypatch.setattr("lib.title.driver.sou", mock_sou)
@@ -413,7 +413,7 @@ def test_select_all_titles(monkeypatch):
         mapping = {10: "Duke", 11: "Count"}
         return mapping.get(istr, "")
 
-    monkeypatch.setattr("lib.title.driver.ipers", mock_ipers)
+    monkeypatch.setattr("lib.title.driver.nb_of_persons", lambda base: len(mock_ipers(base)))
     monkeypatch.setattr("lib.title.driver.poi", mock_poi)
     monkeypatch.setattr("lib.title.driver.nobtitles", mock_nobtitles)
     monkeypatch.setattr("lib.title.driver.sou", mock_sou)
@@ -441,7 +441,7 @@ def test_select_all_places(monkeypatch):
         mapping = {20: "London", 21: "Paris"}
         return mapping.get(istr, "")
 
-    monkeypatch.setattr("lib.title.driver.ipers", mock_ipers)
+    monkeypatch.setattr("lib.title.driver.nb_of_persons", lambda base: len(mock_ipers(base)))
     monkeypatch.setattr("lib.title.driver.poi", mock_poi)
     monkeypatch.setattr("lib.title.driver.nobtitles", mock_nobtitles)
     monkeypatch.setattr("lib.title.driver.sou", mock_sou)
@@ -0,0 +1,137 @@
+import os
+import tempfile
+from types import SimpleNamespace
+
+from lib import database, title, title_index
+from lib.gwdef import GenTitle, Tnone
+from lib.adef import CdateNone
+
+
+def _title(ident, place):
+    return GenTitle(Tnone(), ident, place, CdateNone(), CdateNone(), 0)
+
+
+def _person(*titles):
+    fields = [0] * 34
+    fields[9] = list(titles)
+    return fields
+
+
+def test_person_keys_from_raw_and_gen_titles():
+    raw = _person([{'tag': 0, 'fields': []}, 5, 6, [], [], 0])
+    assert title_index.person_keys(raw) == [(5, 6)]
+    assert title_index.person_keys(SimpleNamespace(titles=[_title(7, 8)])) == [(7, 8)]
+    assert title_index.person_keys({'titles': []}) == []
+
+
+def test_build_counts_and_lookups():
+    index = title_index.build([
+        _person(_title(10, 20)),
+        _person(),
+        _person(_title(10, 21), _title(11, 20)),
+        _person(_title(10, 20)),
+    ])
+    assert index.ident_counts() == [(10, 3), (11, 1)]
+    assert index.places() == [20, 21]
+    assert index.ipers_of_idents([10]) == [0, 2, 3]
+    assert index.ipers_of_places([20]) == [0, 2, 3]
+
+    index.add_person(2, [(12, 22)])
+    assert index.ident_counts() == [(10, 2), (12, 1)]
+    assert index.ipers_of_places([20]) == [0, 3]
+    index.add_person(0, [])
+    assert index.ipers_of_idents([10]) == [3]
+
+
+def test_write_read_round_trip():
+    index = title_index.build([_person(_title(10, 20), _title(10, 20)), _person(_title(11, 21))])
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, title_index.TITLES_INX)
+        title_index.write(path, index)
+        loaded = title_index.read(path)
+
+    assert loaded.by_ident == index.by_ident
+    assert loaded.by_place == index.by_place
+    loaded.add_person(0, [])
+    assert loaded.ident_counts() == [(11, 1)]
+    assert loaded.places() == [21]
+
+
+def test_read_missing_or_bad_file():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, title_index.TITLES_INX)
+        assert title_index.read(path) is None
+        with open(path, 'wb') as f:
+            f.write(b"garbage!")
+        assert title_index.read(path) is None
+
+
+def test_for_base_applies_patched_persons():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        title_index.write(os.path.join(tmpdir, title_index.TITLES_INX),
+                          title_index.build([_person(_title(2, 3)), _person()]))
+        records = [_person(_title(2, 3)), _person(_title(4, 3))]
+        persons = SimpleNamespace(len=2, get=lambda i: records[i])
+        base = SimpleNamespace(data=SimpleNamespace(bdir=tmpdir, persons=persons),
+                               func=SimpleNamespace(patched_persons=lambda: {1}))
+
+        index = title_index.for_base(base)
+        assert index.ident_counts() == [(2, 1), (4, 1)]
+
+        records[1] = _person()
+        assert title_index.for_base(base).ident_counts() == [(2, 1)]
+
+
+def test_for_base_indexes_persons_added_by_patches():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        title_index.write(os.path.join(tmpdir, title_index.TITLES_INX),
+                          title_index.build([_person(_title(2, 3)), _person()]))
+        records = {0: _person(_title(2, 3)), 1: _person(), 2: _person(_title(4, 5))}
+        persons = SimpleNamespace(len=2, get=lambda i: records[i])
+        patched = SimpleNamespace(data=SimpleNamespace(bdir=tmpdir, persons=persons),
+                                  func=SimpleNamespace(patched_persons=lambda: {2}))
+
+        index = title_index.for_base(patched)
+        assert index.ident_counts() == [(2, 1), (4, 1)]
+        assert index.ipers_of_places([5]) == [2]
+
+        reopened = SimpleNamespace(data=SimpleNamespace(bdir=tmpdir, persons=persons),
+                                   func=SimpleNamespace(patched_persons=lambda: set()))
+        assert title_index.for_base(reopened) is index
+        assert index.ident_counts() == [(2, 1)]
+        assert title_index._indexes[tmpdir] == (database.base_stamp(tmpdir), index)
+
+
+def test_for_base_without_directory():
+    assert title_index.for_base(SimpleNamespace()) is None
+
+
+def test_select_all_titles_uses_index(monkeypatch):
+    index = title_index.build([_person(_title(2, 3)), _person(_title(2, 4))])
+    strings = {2: "duke", 3: "Paris", 4: "Lyon"}
+    monkeypatch.setattr("lib.title.driver.title_index", lambda base: index)
+    monkeypatch.setattr("lib.title.driver.sou", lambda base, i: strings[i])
+    monkeypatch.setattr("lib.title.driver.nb_of_persons", lambda base: (_ for _ in ()).throw(AssertionError("scan")))
+
+    conf = SimpleNamespace(allowed_titles=[], denied_titles=[])
+    assert title.select_all_titles(conf, None) == [("duke", 2)]
+    assert title.select_all_places(conf, None) == ["Paris", "Lyon"]
+
+
+def test_select_place_looks_up_candidates(monkeypatch):
+    index = title_index.build([_person(_title(2, 3)), _person(), _person(_title(5, 4))])
+    strings = {2: "duke", 3: "Paris", 4: "Lyon", 5: "count"}
+    requested = []
+
+    def poi_many(base, ipers, kinds=None):
+        requested.extend(ipers)
+        return [SimpleNamespace(titles=[_title(2, 3)]) for _ in ipers]
+
+    monkeypatch.setattr("lib.title.driver.title_index", lambda base: index)
+    monkeypatch.setattr("lib.title.driver.sou", lambda base, i: strings[i])
+    monkeypatch.setattr("lib.title.driver.poi_many", poi_many)
+    monkeypatch.setattr("lib.title.driver.nobtitles", lambda base, a, d, p: p.titles)
+
+    conf = SimpleNamespace(allowed_titles=[], denied_titles=[])
+    assert title.select_place(conf, None, "PARIS") == ["duke"]
+    assert requested == [0]